@@ -1,9 +1,25 @@
 from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Tuple
+import asyncio
+import hashlib
+import multiprocessing
 import os
+import threading
+import time
+import uuid
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Стоимость bcrypt: хэши с другим числом раундов пересчитываются при входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "16"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS,
+                           bcrypt__max_rounds=BCRYPT_ROUNDS)
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
@@ -18,3 +34,145 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(пароль верен, новый хэш или None, если пересчитывать не нужно)."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class Overloaded(RuntimeError):
+    pass
+
+
+class HashPool:
+    """
+    bcrypt в отдельном пуле процессов: всплеск логинов не занимает потоки
+    веб-сервера. Сверх queue_limit одновременных операций — Overloaded,
+    вызывающий отвечает 503 вместо того, чтобы копить очередь.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def run(self, fn, *args):
+        # счётчик меняется только в event loop, блокировка не нужна
+        if self.in_flight >= self.queue_limit:
+            self.rejected += 1
+            raise Overloaded(f"Password hashing queue is full ({self.queue_limit})")
+        self.in_flight += 1
+        try:
+            return await asyncio.wrap_future(self.pool.submit(fn, *args))
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "in_flight": self.in_flight,
+                "queue_limit": self.queue_limit, "rejected": self.rejected}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+hash_pool = HashPool()
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run(get_password_hash, password)
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await hash_pool.run(verify_and_update, plain_password, hashed_password)
+
+
+# Кэш проверенных токенов: sha256 всего токена -> пользователь. Запись живёт
+# не дольше AUTH_CACHE_TTL и не дольше срока действия самого токена.
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+
+class Principal(NamedTuple):
+    id: uuid.UUID
+    email: str
+    created_at: Optional[datetime]
+
+
+class PrincipalCache:
+    """
+    Попадание в кэш заменяет проверку подписи и запрос в БД, поэтому ключ —
+    хэш всего токена. invalidate_user (смена email, удаление) действует
+    только в этом процессе: в других воркерах запись доживает до TTL,
+    отсюда короткий AUTH_CACHE_TTL по умолчанию.
+    """
+
+    def __init__(self, max_items: int = AUTH_CACHE_SIZE, ttl: int = AUTH_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        # сам токен в памяти не храним
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = self.key(token)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= time.time():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, token: str, principal: Principal, expires_at: Optional[float] = None):
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._items[self.key(token)] = (principal, deadline)
+            self._items.move_to_end(self.key(token))
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate_user(self, email: str) -> int:
+        with self._lock:
+            stale = [k for k, (p, _) in self._items.items() if p.email == email]
+            for k in stale:
+                del self._items[k]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "items": len(self._items),
+            }
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,462 @@
+# app/catalog.py
+#
+# Локальный каталог индикаторов и стран Всемирного банка.
+# Хранится в двух parquet-файлах (indicators, countries) в WB_CATALOG_DIR,
+# собирается один раз из офлайн-снимка ответов /v2/indicator и /v2/country
+# и обновляется инкрементально: меняются только новые и изменившиеся записи.
+# В памяти — инвертированный индекс по токенам кода и названия с
+# отсортированным списком токенов для поиска по префиксу (автодополнение),
+# так что поиск и проверка метрик не ходят ни в API, ни на диск. Для
+# коротких префиксов (первые буквы в поле ввода) готовые top-k списки
+# строятся вместе с индексом. Изменённые файлы перечитываются в фоновом
+# потоке, запросы до подмены отвечают по старой версии.
+#
+# Пока снимка нет, каталог состоит из METRIC_MAP и стран из pycountry.
+#
+#     python -m app.catalog build --indicators indicators.json --countries countries.json
+#     python -m app.catalog refresh            # из WB_API_URL
+#     python -m app.catalog search "gdp per capita"
+
+import bisect
+import heapq
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from .indicator_map import METRIC_MAP
+
+CATALOG_DIR = os.getenv("WB_CATALOG_DIR", os.path.join(tempfile.gettempdir(), "wb_catalog"))
+# Как часто проверять, не обновили ли файлы каталога другим процессом
+CATALOG_RELOAD_INTERVAL = float(os.getenv("WB_CATALOG_RELOAD_INTERVAL", "60"))
+SEARCH_LIMIT_MAX = 100
+# Префиксы до этой длины отвечают из заранее отранжированных списков
+SEARCH_TOPK_PREFIX = int(os.getenv("WB_CATALOG_TOPK_PREFIX", "3"))
+
+INDICATOR_COLUMNS = ["id", "name", "unit", "source", "source_note", "source_organization", "topics", "updated_at"]
+COUNTRY_COLUMNS = ["id", "iso2", "name", "region", "income_level", "capital_city", "aggregate", "updated_at"]
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokens(text: str) -> List[str]:
+    return _TOKEN.findall(str(text).casefold())
+
+
+# --- записи из ответов API ----------------------------------------------------
+
+def _value(item) -> str:
+    return (item or {}).get("value") or "" if isinstance(item, dict) else str(item or "")
+
+
+def indicator_record(row: dict) -> dict:
+    """Строка /v2/indicator -> запись каталога."""
+    return {
+        "id": str(row["id"]).strip().upper(),
+        "name": (row.get("name") or "").strip(),
+        "unit": row.get("unit") or "",
+        "source": _value(row.get("source")),
+        "source_note": row.get("sourceNote") or "",
+        "source_organization": row.get("sourceOrganization") or "",
+        "topics": "; ".join(_value(t) for t in row.get("topics") or [] if _value(t)),
+    }
+
+
+def country_record(row: dict) -> dict:
+    """Строка /v2/country -> запись каталога."""
+    region = _value(row.get("region"))
+    return {
+        "id": str(row["id"]).strip().upper(),
+        "iso2": (row.get("iso2Code") or "").upper(),
+        "name": (row.get("name") or "").strip(),
+        "region": region,
+        "income_level": _value(row.get("incomeLevel")),
+        "capital_city": row.get("capitalCity") or "",
+        "aggregate": region == "Aggregates",
+    }
+
+
+def _rows(payload) -> List[dict]:
+    # снимок — ответ API [meta, rows], список таких ответов (страницы) или просто rows
+    if isinstance(payload, list) and len(payload) == 2 and isinstance(payload[0], dict) and "page" in payload[0]:
+        return payload[1] or []
+    if isinstance(payload, list) and payload and isinstance(payload[0], list):
+        return [row for page in payload for row in _rows(page)]
+    return list(payload or [])
+
+
+def _seed_indicators() -> pd.DataFrame:
+    rows = [{"id": code, "name": name, "unit": "", "source": "METRIC_MAP", "source_note": "",
+             "source_organization": "", "topics": ""} for name, code in METRIC_MAP.items()]
+    return _frame(rows, INDICATOR_COLUMNS)
+
+
+def _seed_countries() -> pd.DataFrame:
+    import pycountry
+    rows = [{"id": c.alpha_3, "iso2": c.alpha_2, "name": c.name, "region": "", "income_level": "",
+             "capital_city": "", "aggregate": False} for c in pycountry.countries]
+    return _frame(rows, COUNTRY_COLUMNS)
+
+
+def _frame(rows: List[dict], columns: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=columns)
+    if "updated_at" in columns:
+        df["updated_at"] = df["updated_at"].fillna(time.time()).astype("float64")
+    return df.drop_duplicates("id", keep="last").reset_index(drop=True)
+
+
+# --- индекс -----------------------------------------------------------------
+
+class _Snapshot(NamedTuple):
+    """Таблицы и индексы одной версии каталога; заменяется целиком одним присваиванием."""
+    indicators: pd.DataFrame
+    countries: pd.DataFrame
+    indicator_rows: List[dict]
+    indicator_pos: Dict[str, int]
+    indicator_index: "SearchIndex"
+    country_rows: List[dict]
+    country_pos: Dict[str, int]
+    country_index: "SearchIndex"
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс: токен -> множество номеров документов.
+    Каждое слово запроса ищется как префикс токена, документ должен
+    содержать все слова. Ранжирование: точный код, префикс кода, число
+    слов, совпавших целиком, затем более короткое название.
+    """
+
+    def __init__(self, ids: List[str], texts: List[str]):
+        self.ids = ids
+        self._keys = [i.casefold() for i in ids]
+        self._lengths = [len(t) for t in texts]
+        postings: Dict[str, set] = {}
+        self._doc_tokens: List[frozenset] = []
+        for doc, (key, text) in enumerate(zip(self._keys, texts)):
+            toks = frozenset(tokens(text)) | frozenset(tokens(key)) | {key}
+            self._doc_tokens.append(toks)
+            for tok in toks:
+                postings.setdefault(tok, set()).add(doc)
+        self._postings = postings
+        self._tokens = sorted(postings)
+        self._topk = self._build_topk()
+
+    def _build_topk(self) -> Dict[str, List[int]]:
+        # короткий префикс совпадает с тысячами документов: объединение и
+        # ранжирование на запрос стоят миллисекунды, поэтому здесь, один раз
+        by_prefix: Dict[str, set] = {}
+        for tok, docs in self._postings.items():
+            for n in range(1, min(len(tok), SEARCH_TOPK_PREFIX) + 1):
+                by_prefix.setdefault(tok[:n], set()).update(docs)
+        return {p: heapq.nsmallest(SEARCH_LIMIT_MAX, docs, key=self._rank(p, {p}))
+                for p, docs in by_prefix.items() if tokens(p) == [p]}
+
+    def _rank(self, q: str, words: set):
+        def rank(doc: int):
+            key = self._keys[doc]
+            return (key != q, not key.startswith(q), -len(words & self._doc_tokens[doc]), self._lengths[doc], key)
+        return rank
+
+    def _prefixed(self, prefix: str) -> set:
+        lo = bisect.bisect_left(self._tokens, prefix)
+        hi = bisect.bisect_left(self._tokens, prefix + "\U0010ffff")
+        if hi - lo == 1:
+            return self._postings[self._tokens[lo]]
+        return set().union(*(self._postings[t] for t in self._tokens[lo:hi]))
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        q = query.strip().casefold()
+        words = set(tokens(q))
+        if not words:
+            return []
+        if q in self._topk:
+            return self._topk[q][:limit]
+        # «ny.gdp» — префикс кода целиком, иначе каждое слово — префикс токена
+        terms = [q] if "." in q and " " not in q else sorted(words, key=len, reverse=True)
+        candidates = None
+        for term in terms:
+            docs = self._prefixed(term)
+            candidates = docs if candidates is None else candidates & docs
+            if not candidates:
+                return []
+        return heapq.nsmallest(limit, candidates or (), key=self._rank(q, words))
+
+
+class Catalog:
+    def __init__(self, directory: str = CATALOG_DIR):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._loaded_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._reloading = False
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.parquet")
+
+    def _mtime(self) -> Optional[float]:
+        times = [os.path.getmtime(self._path(n)) for n in ("indicators", "countries") if os.path.exists(self._path(n))]
+        return max(times) if times else None
+
+    def _read(self, name: str, columns: List[str], seed) -> pd.DataFrame:
+        try:
+            return pd.read_parquet(self._path(name))[columns]
+        except (OSError, ValueError, KeyError):
+            return seed()
+
+    @property
+    def indicators(self) -> pd.DataFrame:
+        return self._snap.indicators
+
+    @property
+    def countries(self) -> pd.DataFrame:
+        return self._snap.countries
+
+    def _load(self):
+        with self._lock:
+            self._loaded_mtime = self._mtime()
+            self._snap = self._build_index(self._read("indicators", INDICATOR_COLUMNS, _seed_indicators),
+                                           self._read("countries", COUNTRY_COLUMNS, _seed_countries))
+
+    @staticmethod
+    def _build_index(ind: pd.DataFrame, cty: pd.DataFrame) -> _Snapshot:
+        # индекс строится целиком в стороне и подменяется одним присваиванием:
+        # читатели без блокировки видят либо старую, либо новую версию, не смесь
+        # ответы собираются из готовых словарей: iloc/to_dict на запрос дороже самого поиска
+        country_pos = {code: i for i, code in enumerate(cty["id"])}
+        country_pos.update({iso2: i for i, iso2 in enumerate(cty["iso2"]) if iso2})
+        return _Snapshot(
+            indicators=ind,
+            countries=cty,
+            indicator_rows=ind.to_dict("records"),
+            indicator_pos={code: i for i, code in enumerate(ind["id"])},
+            indicator_index=SearchIndex(list(ind["id"]), list(ind["name"] + " " + ind["topics"])),
+            country_rows=cty.to_dict("records"),
+            country_pos=country_pos,
+            country_index=SearchIndex(list(cty["id"]), list(cty["name"] + " " + cty["iso2"] + " " + cty["region"])),
+        )
+
+    def maybe_reload(self):
+        """
+        Перечитывает каталог, если файлы обновил другой процесс (не чаще раза
+        в интервал). Чтение parquet и сборка индекса идут в фоновом потоке:
+        вызывающий — обычно обработчик запроса — не ждёт и видит старую версию.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < CATALOG_RELOAD_INTERVAL or self._reloading:
+            return
+        self._checked_at = now
+        if self._mtime() != self._loaded_mtime:
+            self._reloading = True
+            threading.Thread(target=self._reload, name="catalog-reload", daemon=True).start()
+
+    def _reload(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"⚠️ Catalogue reload failed: {e}")
+        finally:
+            self._reloading = False
+
+    # --- чтение ---
+
+    def indicator(self, code: str) -> Optional[dict]:
+        self.maybe_reload()
+        snap = self._snap
+        pos = snap.indicator_pos.get(str(code).strip().upper())
+        return None if pos is None else dict(snap.indicator_rows[pos])
+
+    def country(self, code: str) -> Optional[dict]:
+        self.maybe_reload()
+        snap = self._snap
+        pos = snap.country_pos.get(str(code).strip().upper())
+        return None if pos is None else dict(snap.country_rows[pos])
+
+    def search_indicators(self, query: str, limit: int = 20) -> List[dict]:
+        self.maybe_reload()
+        limit = max(1, min(limit, SEARCH_LIMIT_MAX))
+        fields = ("id", "name", "unit", "source", "topics")
+        snap = self._snap
+        return [{f: snap.indicator_rows[i][f] for f in fields}
+                for i in snap.indicator_index.search(query, limit)]
+
+    def search_countries(self, query: str, limit: int = 20, include_aggregates: bool = True) -> List[dict]:
+        self.maybe_reload()
+        limit = max(1, min(limit, SEARCH_LIMIT_MAX))
+        fields = ("id", "iso2", "name", "region", "income_level", "aggregate")
+        snap = self._snap
+        found = snap.country_index.search(query, limit if include_aggregates else SEARCH_LIMIT_MAX)
+        rows = [snap.country_rows[i] for i in found]
+        if not include_aggregates:
+            rows = [r for r in rows if not r["aggregate"]][:limit]
+        return [{f: r[f] for f in fields} for r in rows]
+
+    def resolve(self, names: Iterable[str]) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Имена метрик запроса -> ({код: имя}, неизвестные). Имя — псевдоним
+        из METRIC_MAP или код индикатора из каталога (без учёта регистра).
+        ValueError — если два разных имени указывают на один индикатор:
+        колонка в данных одна, и одно из имён пропало бы из результата.
+        """
+        self.maybe_reload()
+        snap = self._snap
+        found, unknown = {}, []
+        for name in sorted(set(names)):
+            code = METRIC_MAP.get(name) or str(name).strip().upper()
+            if code in snap.indicator_pos or name in METRIC_MAP:
+                if code in found:
+                    raise ValueError(f"Metrics '{found[code]}' and '{name}' refer to the same indicator {code}")
+                found[code] = name
+            else:
+                unknown.append(name)
+        return found, unknown
+
+    def stats(self) -> dict:
+        return {
+            "indicators": len(self.indicators),
+            "countries": len(self.countries),
+            "directory": self.directory,
+            "loaded_mtime": self._loaded_mtime,
+        }
+
+    # --- запись ---
+
+    def _merge(self, current: pd.DataFrame, rows: List[dict], columns: List[str]) -> Tuple[pd.DataFrame, dict]:
+        fresh = _frame(rows, columns).set_index("id")
+        old = current.set_index("id")
+        fields = [c for c in columns if c not in ("id", "updated_at")]
+        common = fresh.index.intersection(old.index)
+        changed = (fresh.loc[common, fields].astype(str) != old.loc[common, fields].astype(str)).any(axis=1)
+        changed = common[changed.to_numpy()]
+        added = fresh.index.difference(old.index)
+
+        now = time.time()
+        merged = old.copy()
+        if len(changed):
+            merged.loc[changed, fields] = fresh.loc[changed, fields]
+            merged.loc[changed, "updated_at"] = now
+        if len(added):
+            new = fresh.loc[added].copy()
+            new["updated_at"] = now
+            merged = pd.concat([merged, new[merged.columns]])
+        counts = {"added": len(added), "updated": len(changed), "unchanged": len(common) - len(changed),
+                  "total": len(merged)}
+        return merged.reset_index()[columns], counts
+
+    def _write(self, name: str, df: pd.DataFrame):
+        # во временный файл рядом и os.replace: читатель в другом процессе
+        # видит старый или новый файл целиком, но не недописанный
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def update(self, indicators: Optional[List[dict]] = None, countries: Optional[List[dict]] = None,
+               replace: bool = False) -> dict:
+        """
+        Вливает записи (indicator_record / country_record) в каталог: новые
+        добавляются, изменившиеся заменяются, остальные не трогаются.
+        replace=True — собрать каталог заново только из переданных записей.
+        """
+        report = {}
+        with self._lock:
+            tables = {"indicators": self.indicators, "countries": self.countries}
+            for name, rows, columns in (("indicators", indicators, INDICATOR_COLUMNS),
+                                        ("countries", countries, COUNTRY_COLUMNS)):
+                if rows is None:
+                    continue
+                current = _frame([], columns) if replace else tables[name]
+                merged, counts = self._merge(current, rows, columns)
+                if counts["added"] or counts["updated"] or replace:
+                    self._write(name, merged)
+                tables[name] = merged
+                report[name] = counts
+            self._snap = self._build_index(tables["indicators"], tables["countries"])
+            self._loaded_mtime = self._mtime()
+        return report
+
+
+def load_snapshot(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return _rows(json.load(f))
+
+
+def fetch_all(client, path: str, per_page: int = 1000) -> List[dict]:
+    """Все страницы списка API (/indicator, /country) через httpx.Client."""
+    rows, page, pages = [], 1, 1
+    while page <= pages:
+        resp = client.get(path, params={"format": "json", "per_page": per_page, "page": page})
+        resp.raise_for_status()
+        meta, chunk = resp.json()
+        pages = int(meta.get("pages") or 1)
+        rows.extend(chunk or [])
+        page += 1
+    return rows
+
+
+def refresh(catalog: "Catalog", api_url: Optional[str] = None) -> dict:
+    import httpx
+    from .world_bank import WB_API_URL, WB_TIMEOUT
+
+    with httpx.Client(base_url=api_url or WB_API_URL, timeout=WB_TIMEOUT) as client:
+        indicators = [indicator_record(r) for r in fetch_all(client, "/indicator")]
+        countries = [country_record(r) for r in fetch_all(client, "/country")]
+    return catalog.update(indicators, countries)
+
+
+_catalog: Optional[Catalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog()
+    return _catalog
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m app.catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the catalogue from an offline snapshot")
+    build.add_argument("--indicators")
+    build.add_argument("--countries")
+    build.add_argument("--replace", action="store_true", help="drop entries missing from the snapshot")
+    ref = sub.add_parser("refresh", help="merge the current World Bank lists into the catalogue")
+    ref.add_argument("--api", help="API base URL, defaults to WB_API_URL")
+    find = sub.add_parser("search")
+    find.add_argument("query")
+    find.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    cat = get_catalog()
+    if args.command == "build":
+        if not (args.indicators or args.countries):
+            parser.error("nothing to build: pass --indicators and/or --countries")
+        report = cat.update(
+            [indicator_record(r) for r in load_snapshot(args.indicators)] if args.indicators else None,
+            [country_record(r) for r in load_snapshot(args.countries)] if args.countries else None,
+            replace=args.replace,
+        )
+    elif args.command == "refresh":
+        report = refresh(cat, args.api)
+    else:
+        report = cat.search_indicators(args.query, args.limit)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2, default=str)
+    print()
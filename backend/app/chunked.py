@@ -0,0 +1,149 @@
+# app/chunked.py
+#
+# Out-of-core OLS, 2SLS и FE для датасетов, которые не помещаются в память
+# воркера. Данные читаются порциями (row group'ы Parquet), в памяти держатся
+# только суммы и матрицы перекрёстных произведений размера k x k.
+#
+# OLS — один проход. FE — два: сначала средние по entity, затем моменты
+# демингованных данных (численно устойчивее, чем S - s s'/n). 2SLS — два:
+# моменты для оценок, затем остатки для робастной ковариации, как
+# в linearmodels IV2SLS по умолчанию. Контракт результата тот же,
+# что у econometrics.perform_analysis.
+#
+# Ограничение: Parquet датасета хранится в БД одним значением и читается
+# в память целиком (декодируются только порции). Поэтому размер хранимого
+# файла ограничен OUT_OF_CORE_MAX_MB — больше отвечаем 413, а не падаем по памяти.
+# Предел проверяется при открытии датасета для любого анализа, не только
+# здесь, и по умолчанию равен пределу загрузки INGEST_MAX_STORED_MB.
+
+import os
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import moments
+
+OUT_OF_CORE_ROWS = int(os.getenv("OUT_OF_CORE_ROWS", "2000000"))
+OUT_OF_CORE_MAX_BYTES = int(os.getenv("OUT_OF_CORE_MAX_MB", "512")) * 1024 * 1024
+
+# Вызов возвращает новый итератор по порциям: нужен для повторных проходов
+ChunkSource = Callable[[], Iterable[pd.DataFrame]]
+
+
+def _complete(chunk: pd.DataFrame, columns: List[str]):
+    X = chunk[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+    ok = ~np.isnan(X).any(axis=1)
+    return X[ok], ok
+
+
+def ols(chunks: ChunkSource, dependent_var: str, exog_vars: List[str]) -> dict:
+    cols = [dependent_var] + list(exog_vars)
+    N, s, S = 0, np.zeros(len(cols)), np.zeros((len(cols), len(cols)))
+    for chunk in chunks():
+        X, _ = _complete(chunk, cols)
+        N += len(X)
+        s += X.sum(axis=0)
+        S += X.T @ X
+    if N <= len(exog_vars) + 1:
+        raise ValueError("Not enough observations")
+    return moments.ols_solution(N, s, S, exog_vars)
+
+
+def fe(chunks: ChunkSource, dependent_var: str, exog_vars: List[str], entity: str) -> dict:
+    cols = [dependent_var] + list(exog_vars)
+
+    # проход 1: число наблюдений и суммы по каждой entity
+    sums = None
+    for chunk in chunks():
+        X, ok = _complete(chunk, cols)
+        part = pd.DataFrame(X, columns=cols, index=chunk[entity].to_numpy()[ok])
+        part = part[part.index.notna()]
+        part = part.groupby(level=0).agg(["sum", "count"])
+        sums = part if sums is None else sums.add(part, fill_value=0)
+    if sums is None or sums.empty:
+        raise ValueError("Not enough observations")
+    n_i = sums[(dependent_var, "count")]
+    means = pd.DataFrame({c: sums[(c, "sum")] / n_i for c in cols})
+    N = float(n_i.sum())
+
+    # проход 2: моменты отклонений от средних своей entity
+    W = np.zeros((len(cols), len(cols)))
+    for chunk in chunks():
+        X, ok = _complete(chunk, cols)
+        keys = chunk[entity].to_numpy()[ok]
+        known = pd.notna(keys)
+        D = X[known] - means.loc[keys[known]].to_numpy()
+        W += D.T @ D
+
+    mean = (means.to_numpy() * n_i.to_numpy()[:, None]).sum(axis=0) / N
+    return moments.fe_solution(W, mean, N, len(n_i), exog_vars)
+
+
+def tsls(chunks: ChunkSource, dependent_var: str, endog_var: str, exog_vars: List[str],
+         instrument_vars: List[str]) -> dict:
+    exog_vars = list(exog_vars)
+    cols = [dependent_var] + exog_vars + [endog_var] + list(instrument_vars)
+    # позиции в [1, cols]: константа — 0
+    y_i = 1
+    x_idx = [0] + list(range(2, 2 + len(exog_vars) + 1))
+    z_idx = [0] + list(range(2, 2 + len(exog_vars))) + list(range(3 + len(exog_vars), 1 + len(cols)))
+
+    def augmented(chunk):
+        X, _ = _complete(chunk, cols)
+        return np.hstack([np.ones((len(X), 1)), X])
+
+    # проход 1: моменты [1, y, exog, endog, instruments]
+    A = np.zeros((len(cols) + 1, len(cols) + 1))
+    for chunk in chunks():
+        B = augmented(chunk)
+        A += B.T @ B
+    N = A[0, 0]
+    if N <= len(x_idx):
+        raise ValueError("Not enough observations")
+
+    ZZ = A[np.ix_(z_idx, z_idx)]
+    ZX = A[np.ix_(z_idx, x_idx)]
+    Zy = A[z_idx, y_i]
+    Pi = np.linalg.solve(ZZ, ZX)          # X̂ = Z Pi
+    XhXh = ZX.T @ Pi
+    beta = np.linalg.solve(XhXh, Pi.T @ Zy)
+
+    # проход 2: остатки структурного уравнения
+    meat = np.zeros((len(x_idx), len(x_idx)))
+    rss = 0.0
+    for chunk in chunks():
+        B = augmented(chunk)
+        e = B[:, y_i] - B[:, x_idx] @ beta
+        g = (B[:, z_idx] @ Pi) * e[:, None]
+        meat += g.T @ g
+        rss += e @ e
+
+    # гетероскедастично-робастная ковариация без поправки на df (debiased=False)
+    bread = np.linalg.inv(XhXh)
+    cov = bread @ meat @ bread
+    se = np.sqrt(np.diag(cov))
+    pvalues = 2 * moments.norm_sf(np.abs(beta / se))
+    tss = A[y_i, y_i] - A[0, y_i] ** 2 / N
+    names = ["const"] + exog_vars + [endog_var]
+    return moments.make_result("2SLS", names, beta, se, pvalues, 1 - rss / tss, int(N))
+
+
+def supports(method: str) -> bool:
+    return method.lower() in ("ols", "2sls", "fe")
+
+
+def fit(chunks: ChunkSource, method: str, dependent_var: str, base_var: Optional[str] = None,
+        control_vars: Optional[List[str]] = None, instrument_vars: Optional[List[str]] = None,
+        exog_vars: Optional[List[str]] = None, entity: str = "country", **_) -> dict:
+    """Тот же контракт, что у econometrics.perform_analysis для OLS, 2SLS и FE."""
+    m = method.lower()
+    if m == "ols":
+        return ols(chunks, dependent_var, [base_var] + list(control_vars or []))
+    if m == "2sls":
+        if not instrument_vars:
+            raise ValueError("2SLS requires 'instrument_vars'")
+        return tsls(chunks, dependent_var, base_var, list(control_vars or []), instrument_vars)
+    if m == "fe":
+        return fe(chunks, dependent_var, list(exog_vars or []), entity)
+    raise ValueError(f"Method '{method}' is not supported out of core")
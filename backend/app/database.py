@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import AsyncIterator, Optional
 import os
 from dotenv import load_dotenv
 
@@ -8,8 +10,98 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 # Явно используем драйвер psycopg
 DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://")
 
+# Бюджет соединений одного процесса uvicorn на оба движка вместе: при N
+# воркерах в Postgres уходит до N * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+# Асинхронному движку (регистрация, вход, история исследований) достаётся
+# доля DB_ASYNC_POOL_SHARE, синхронному (анализ, загрузка датасетов,
+# проверка токенов) — остальное; у каждого минимум одно постоянное соединение.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_ASYNC_POOL_SHARE = float(os.getenv("DB_ASYNC_POOL_SHARE", "0.4"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Кэш подготовленных выражений asyncpg (0 — выключить, нужно за pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
 
-engine = create_engine(DATABASE_URL)
+
+def split_budget(total: int, share: float, minimum: int = 0) -> tuple:
+    """(синхронная часть, асинхронная часть) бюджета total."""
+    part = min(total, max(minimum, round(total * share)))
+    return max(minimum, total - part), part
+
+
+def _pool_kwargs(url: str, is_async: bool = False) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    # pool_size=0 у QueuePool означает «без ограничений», поэтому минимум 1
+    pool_size = split_budget(DB_POOL_SIZE, DB_ASYNC_POOL_SHARE, minimum=1)[is_async]
+    max_overflow = split_budget(DB_MAX_OVERFLOW, DB_ASYNC_POOL_SHARE)[is_async]
+    return dict(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def async_url(url: str) -> str:
+    return (
+        url.replace("postgresql+psycopg2://", "postgresql+asyncpg://")
+        .replace("sqlite://", "sqlite+aiosqlite://", 1)
+    )
+
+
+engine = create_engine(DATABASE_URL, **_pool_kwargs(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Асинхронный движок создаётся при первом обращении: драйвер asyncpg
+# не нужен процессам, которые работают только с синхронной сессией
+_async_engine = None
+_async_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def get_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        url = async_url(DATABASE_URL)
+        connect_args = {}
+        if url.startswith("postgresql+asyncpg"):
+            connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+        _async_engine = create_async_engine(url, connect_args=connect_args, **_pool_kwargs(url, is_async=True))
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_sessionmaker = None
+
+
+def _status(pool) -> dict:
+    state = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            state[name] = fn()
+    return state
+
+
+def pool_status() -> dict:
+    status = {"sync": _status(engine.pool)}
+    if _async_engine is not None:
+        status["async"] = _status(_async_engine.pool)
+    return status
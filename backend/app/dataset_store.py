@@ -0,0 +1,177 @@
+# app/dataset_store.py
+#
+# Загруженные датасеты храним в Parquet (колоночный бинарный формат)
+# в bytea-колонке DatasetBlob.content: одинаковые загрузки (по sha256 файла)
+# хранятся один раз, датасеты ссылаются на blob. У старых записей Parquet
+# лежит в самом UploadedDataset.content. Чтение — с проекцией колонок:
+# декодируются только нужные колонки.
+
+import io
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PARQUET = "parquet"
+ROW_GROUP_SIZE = 64_000
+
+
+def normalize_nans(df: pd.DataFrame) -> pd.DataFrame:
+    """Строки вида 'nan' / ' NaN ' в текстовых колонках превращаем в пропуски."""
+    df = df.copy()
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object or pd.api.types.is_string_dtype(s):
+            is_nan = s.astype("string").str.strip().str.lower().eq("nan").fillna(False)
+            if is_nan.any():
+                df[col] = s.mask(is_nan.to_numpy())
+    return df
+
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    # имена колонок из Excel бывают нестроковыми
+    df = df.rename(columns=str)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # колонки со смесью чисел и строк храним как строки
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].map(lambda v: v if v is None or pd.isna(v) else str(v))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def encode(table: pa.Table) -> bytes:
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    return buf.getvalue()
+
+
+def describe(table_or_schema) -> List[dict]:
+    schema = getattr(table_or_schema, "schema", table_or_schema)
+    return [{"name": f.name, "dtype": str(f.type)} for f in schema]
+
+
+def read_parquet(content: bytes, columns: Optional[List[str]] = None, filters=None) -> pd.DataFrame:
+    # filters позволяют pyarrow пропускать целые row group'ы по статистикам
+    return pq.read_table(io.BytesIO(content), columns=columns, filters=filters).to_pandas()
+
+
+def iter_batches(content: bytes, columns: Optional[List[str]] = None,
+                 batch_size: int = ROW_GROUP_SIZE) -> Iterator[pd.DataFrame]:
+    pf = pq.ParquetFile(io.BytesIO(content))
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def content_of(dataset) -> Optional[bytes]:
+    """Parquet датасета: общий blob или собственная копия; None — старая JSON-запись."""
+    blob = getattr(dataset, "blob", None)
+    return blob.content if blob is not None else dataset.content
+
+
+def load_dataset(dataset, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Читает UploadedDataset в DataFrame. columns — проекция: из Parquet
+    декодируются только эти колонки. Старые записи (JSON в data) читаются целиком.
+    """
+    content = content_of(dataset)
+    if content is not None:
+        return read_parquet(content, columns)
+    df = pd.DataFrame(dataset.data or [])
+    return df[columns] if columns is not None else df
+
+
+def column_names(dataset) -> List[str]:
+    if dataset.columns is not None:
+        return [c["name"] for c in dataset.columns]
+    # старые JSON-записи: колонки берём из первой строки
+    return list((dataset.data or [{}])[0].keys())
+
+
+def numeric_columns(dataset) -> List[str]:
+    return [
+        c["name"] for c in dataset.columns or []
+        if c["dtype"].startswith(("int", "uint", "double", "float", "halffloat"))
+    ]
+
+
+def _is_numeric(dataset, column: str) -> bool:
+    return column in numeric_columns(dataset)
+
+
+def _filter_rows(df: pd.DataFrame, entity, time, countries, start_year, end_year) -> pd.DataFrame:
+    if countries and entity in df.columns:
+        wanted = {str(c).strip().lower() for c in countries}
+        df = df[df[entity].astype("string").str.strip().str.lower().isin(wanted).fillna(False).to_numpy()]
+    if time in df.columns and (start_year is not None or end_year is not None):
+        years = pd.to_numeric(df[time], errors="coerce")
+        mask = pd.Series(True, index=df.index)
+        if start_year is not None:
+            mask &= years >= start_year
+        if end_year is not None:
+            mask &= years <= end_year
+        df = df[mask.to_numpy()]
+    return df
+
+
+def iter_for_analysis(
+    content: bytes,
+    columns: List[str],
+    entity: Optional[str] = None,
+    time: Optional[str] = None,
+    countries: Optional[List[str]] = None,
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+    batch_size: int = ROW_GROUP_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """Отфильтрованные по странам и годам порции строк; в памяти одна порция."""
+    for batch in iter_batches(content, columns, batch_size):
+        batch = _filter_rows(batch, entity, time, countries, start_year, end_year)
+        if len(batch):
+            yield batch
+
+
+def load_for_analysis(
+    dataset,
+    columns: List[str],
+    entity: Optional[str] = None,
+    time: Optional[str] = None,
+    countries: Optional[List[str]] = None,
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+    max_rows: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Читает только нужные спецификации колонки и строки (страны, годы).
+    max_rows — для предпросмотра: row group'ы читаются по одному,
+    пока не наберётся нужное число строк.
+    """
+    available = set(column_names(dataset))
+    needed = list(dict.fromkeys(columns + [c for c in (entity, time) if c and c in available]))
+
+    content = content_of(dataset)
+    if content is None:
+        df = _filter_rows(load_dataset(dataset, needed), entity, time, countries, start_year, end_year)
+        return df.head(max_rows).reset_index(drop=True) if max_rows else df.reset_index(drop=True)
+
+    if max_rows:
+        frames, n = [], 0
+        for batch in iter_for_analysis(content, needed, entity, time, countries, start_year, end_year):
+            frames.append(batch)
+            n += len(batch)
+            if n >= max_rows:
+                break
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=needed)
+        return df.head(max_rows)
+
+    filters = None
+    if time in available and _is_numeric(dataset, time):
+        bounds = [(time, ">=", start_year)] if start_year is not None else []
+        bounds += [(time, "<=", end_year)] if end_year is not None else []
+        filters = bounds or None
+    df = read_parquet(content, needed, filters)
+    return _filter_rows(df, entity, time, countries, start_year, end_year).reset_index(drop=True)
+
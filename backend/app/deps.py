@@ -0,0 +1,64 @@
+# app/deps.py
+#
+# Общие зависимости FastAPI: аутентификация по Bearer-токену.
+# Проверенный токен и найденный пользователь кэшируются (auth.principal_cache),
+# так что повторные запросы с тем же токеном не ходят в БД.
+
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt, JWTError
+from sqlalchemy import event, inspect
+
+from . import auth, models
+from .database import SessionLocal
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+
+def resolve_token(token: str) -> auth.Principal:
+    """Пользователь по токену; 401, если токен неверен или пользователя нет."""
+    cached = auth.principal_cache.get(token)
+    if cached is not None:
+        return cached
+    try:
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        email = payload.get("sub")
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == email).first()
+    finally:
+        db.close()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+    principal = auth.Principal(user.id, user.email, user.created_at)
+    auth.principal_cache.put(token, principal, expires_at=payload.get("exp"))
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> auth.Principal:
+    return resolve_token(token)
+
+
+def get_optional_user(token: Optional[str] = Depends(oauth2_optional)) -> Optional[auth.Principal]:
+    # анонимные запросы допустимы; с неверным токеном запрос тоже анонимный
+    if not token:
+        return None
+    try:
+        return resolve_token(token)
+    except HTTPException:
+        return None
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _forget_user(mapper, connection, target):
+    # при смене email сбрасываем и записи под старым адресом
+    for email in {target.email, *inspect(target).attrs.email.history.deleted}:
+        auth.principal_cache.invalidate_user(email)
@@ -1,76 +1,174 @@
+import math
 import pandas as pd
 import statsmodels.api as sm
-from typing import List
+from typing import List, Optional
 from linearmodels.panel import PanelOLS, RandomEffects
 from linearmodels.iv import IV2SLS
 
+from . import inference
+from .metrics import stage
+from .moments import PanelMoments
+from .panel import fit as fit_joint
 
-def perform_ols_analysis(df: pd.DataFrame, dependent_var: str, base_var: str, control_vars: List[str]):
-    X = df[[base_var] + control_vars]
-    X = sm.add_constant(X)
-    y = df[dependent_var]
-    model = sm.OLS(y, X, missing='drop').fit()
-    return {
+
+def _clean(series: pd.Series) -> dict:
+    # NaN/inf в JSON не сериализуются — отдаём их как null
+    return {k: (float(v) if math.isfinite(v) else None) for k, v in series.items()}
+
+
+def _float(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def perform_ols_analysis(df: pd.DataFrame, dependent_var: str, base_var: str, control_vars: List[str],
+                         cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+                         render_summary: bool = True):
+    with stage("clean", "OLS"):
+        X = df[[base_var] + control_vars]
+        X = sm.add_constant(X)
+        y = df[dependent_var]
+    with stage("fit", "OLS"):
+        model = sm.OLS(y, X, missing='drop').fit()
+    with stage("render", "OLS"):
+        summary = model.summary().as_text() if render_summary else None
+    result = {
         "method": "OLS",
-        "params": model.params.to_dict(),
-        "pvalues": model.pvalues.to_dict(),
-        "r_squared": model.rsquared,
-        "summary": model.summary().as_text()
+        "params": _clean(model.params),
+        "pvalues": _clean(model.pvalues),
+        "r_squared": _float(model.rsquared),
+        "n_obs": int(model.nobs),
+        "summary": summary
     }
+    if cov_type == "unadjusted":
+        return result
+    with stage("inference", "OLS"):
+        entity = (cov_kwds or {}).get("entity", "country")
+        design = inference.ols_design(df, dependent_var, [base_var] + control_vars, entity)
+        return inference.apply(result, design, cov_type, cov_kwds)
 
 
-def perform_2sls_analysis(df: pd.DataFrame, dependent_var: str, endog_var: str, exog_vars: List[str], instrument_vars: List[str]):
-    exog = sm.add_constant(df[exog_vars])
-    endog = df[endog_var]
-    instr = df[instrument_vars]
-    y = df[dependent_var]
-    iv = IV2SLS(dependent=y, exog=exog, endog=endog, instruments=instr).fit()
+def perform_2sls_analysis(df: pd.DataFrame, dependent_var: str, endog_var: str, exog_vars: List[str], instrument_vars: List[str],
+                          cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+                          render_summary: bool = True):
+    if cov_type != "unadjusted":
+        raise ValueError(f"cov_type '{cov_type}' is supported for OLS, FE and RE only")
+    with stage("clean", "2SLS"):
+        exog = sm.add_constant(df[exog_vars])
+        endog = df[endog_var]
+        instr = df[instrument_vars]
+        y = df[dependent_var]
+    with stage("fit", "2SLS"):
+        iv = IV2SLS(dependent=y, exog=exog, endog=endog, instruments=instr).fit()
+    with stage("render", "2SLS"):
+        summary = iv.summary.as_text() if render_summary else None
     return {
         "method": "2SLS",
-        "params": iv.params.to_dict(),
-        "pvalues": iv.pvalues.to_dict(),
-        "r_squared": iv.rsquared,
-        "summary": iv.summary.as_text()
+        "params": _clean(iv.params),
+        "pvalues": _clean(iv.pvalues),
+        "r_squared": _float(iv.rsquared),
+        "n_obs": int(iv.nobs),
+        "summary": summary
     }
 
 
-def perform_fe_analysis(df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str, time: str):
-    panel = df.set_index([entity, time])
-    exog = sm.add_constant(panel[exog_vars])
-    y = panel[dependent_var]
-    mod = PanelOLS(y, exog, entity_effects=True).fit()
-    return {
+def perform_fe_analysis(df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str, time: str,
+                        cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+                        render_summary: bool = True):
+    return fit_fe(df.set_index([entity, time]), dependent_var, exog_vars, cov_type, cov_kwds, render_summary)
+
+
+def fit_fe(panel: pd.DataFrame, dependent_var: str, exog_vars: List[str],
+           cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+           render_summary: bool = True):
+    # panel уже проиндексирован (entity, time)
+    with stage("clean", "FE"):
+        exog = sm.add_constant(panel[exog_vars])
+        y = panel[dependent_var]
+    with stage("fit", "FE"):
+        mod = PanelOLS(y, exog, entity_effects=True).fit()
+    with stage("render", "FE"):
+        summary = mod.summary.as_text() if render_summary else None
+    result = {
         "method": "Fixed Effects",
-        "params": mod.params.to_dict(),
-        "pvalues": mod.pvalues.to_dict(),
-        "r_squared": mod.rsquared,
-        "summary": mod.summary.as_text()
+        "params": _clean(mod.params),
+        "pvalues": _clean(mod.pvalues),
+        "r_squared": _float(mod.rsquared),
+        "n_obs": int(mod.nobs),
+        "summary": summary
     }
+    if cov_type == "unadjusted":
+        return result
+    with stage("inference", "FE"):
+        design = inference.within_design(panel, dependent_var, exog_vars)
+        return inference.apply(result, design, cov_type, cov_kwds)
 
 
-def perform_re_analysis(df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str, time: str):
-    panel = df.set_index([entity, time])
-    exog = sm.add_constant(panel[exog_vars])
-    y = panel[dependent_var]
-    mod = RandomEffects(y, exog).fit()
-    return {
+def perform_re_analysis(df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str, time: str,
+                        cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+                        render_summary: bool = True):
+    return fit_re(df.set_index([entity, time]), dependent_var, exog_vars, cov_type, cov_kwds, render_summary)
+
+
+def fit_re(panel: pd.DataFrame, dependent_var: str, exog_vars: List[str],
+           cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+           render_summary: bool = True):
+    # panel уже проиндексирован (entity, time)
+    with stage("clean", "RE"):
+        exog = sm.add_constant(panel[exog_vars])
+        y = panel[dependent_var]
+    with stage("fit", "RE"):
+        mod = RandomEffects(y, exog).fit()
+    with stage("render", "RE"):
+        summary = mod.summary.as_text() if render_summary else None
+    result = {
         "method": "Random Effects",
-        "params": mod.params.to_dict(),
-        "pvalues": mod.pvalues.to_dict(),
-        "r_squared": mod.rsquared,
-        "summary": mod.summary.as_text()
+        "params": _clean(mod.params),
+        "pvalues": _clean(mod.pvalues),
+        "r_squared": _float(mod.rsquared),
+        "n_obs": int(mod.nobs),
+        "summary": summary
     }
+    if cov_type == "unadjusted":
+        return result
+    with stage("inference", "RE"):
+        design = inference.quasi_demeaned_design(panel, dependent_var, exog_vars, mod.theta["theta"])
+        return inference.apply(result, design, cov_type, cov_kwds)
+
+
+def perform_panel_analysis(df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str, time: str,
+                           cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+                           render_summary: bool = True):
+    return fit_panel(df.set_index([entity, time]), dependent_var, exog_vars, cov_type, cov_kwds, render_summary)
+
+
+def fit_panel(panel: pd.DataFrame, dependent_var: str, exog_vars: List[str],
+              cov_type: str = "unadjusted", cov_kwds: Optional[dict] = None,
+              render_summary: bool = True):
+    # pooled, between, FE и RE из одного разложения панели плюс тест Хаусмана
+    if cov_type != "unadjusted":
+        raise ValueError(f"cov_type '{cov_type}' is supported for OLS, FE and RE only")
+    with stage("clean", "PANEL"):
+        data = panel[[dependent_var] + exog_vars].reset_index(level=0)
+        pm = PanelMoments.from_frame(data, [dependent_var] + exog_vars, entity=data.columns[0])
+    with stage("fit", "PANEL"):
+        return fit_joint(pm, dependent_var, exog_vars, render_summary)
 
 
 def perform_analysis(df: pd.DataFrame, method: str, **kwargs):
     """
-    method: 'OLS', '2SLS', 'FE', 'RE'
+    method: 'OLS', '2SLS', 'FE', 'RE', 'PANEL' (pooled/between/FE/RE и тест Хаусмана)
     kwargs per method:
       OLS: dependent_var, base_var, control_vars
       2SLS: dependent_var, base_var (endog), control_vars (exog), instrument_vars
-      FE/RE: dependent_var, exog_vars, entity, time
+      FE/RE/PANEL: dependent_var, exog_vars, entity, time
+    Все методы: cov_type ('unadjusted', 'clustered', 'bootstrap') и cov_kwds
+    (scheme, reps, seed, early_stop, entity) — см. app.inference;
+    render_summary=False — без текстовой таблицы summary (её рендер дорогой).
     """
     m = method.lower()
+    common = dict(cov_type=kwargs.get('cov_type') or 'unadjusted', cov_kwds=kwargs.get('cov_kwds'),
+                  render_summary=kwargs.get('render_summary', True))
     if m == 'ols':
         if 'dependent_var' not in kwargs or 'base_var' not in kwargs:
             raise ValueError("OLS requires 'dependent_var' and 'base_var'")
@@ -78,7 +176,8 @@ def perform_analysis(df: pd.DataFrame, method: str, **kwargs):
             df,
             kwargs['dependent_var'],
             kwargs['base_var'],
-            kwargs.get('control_vars', [])
+            kwargs.get('control_vars', []),
+            **common
         )
     elif m == '2sls':
         for param in ['dependent_var', 'base_var', 'instrument_vars']:
@@ -89,7 +188,8 @@ def perform_analysis(df: pd.DataFrame, method: str, **kwargs):
             kwargs['dependent_var'],
             kwargs['base_var'],
             kwargs.get('control_vars', []),
-            kwargs['instrument_vars']
+            kwargs['instrument_vars'],
+            **common
         )
     elif m == 'fe':
         for param in ['dependent_var', 'exog_vars', 'entity', 'time']:
@@ -100,7 +200,8 @@ def perform_analysis(df: pd.DataFrame, method: str, **kwargs):
             kwargs['dependent_var'],
             kwargs['exog_vars'],
             kwargs['entity'],
-            kwargs['time']
+            kwargs['time'],
+            **common
         )
     elif m == 're':
         for param in ['dependent_var', 'exog_vars', 'entity', 'time']:
@@ -111,7 +212,20 @@ def perform_analysis(df: pd.DataFrame, method: str, **kwargs):
             kwargs['dependent_var'],
             kwargs['exog_vars'],
             kwargs['entity'],
-            kwargs['time']
+            kwargs['time'],
+            **common
+        )
+    elif m == 'panel':
+        for param in ['dependent_var', 'exog_vars', 'entity', 'time']:
+            if param not in kwargs:
+                raise ValueError(f"PANEL requires '{param}'")
+        return perform_panel_analysis(
+            df,
+            kwargs['dependent_var'],
+            kwargs['exog_vars'],
+            kwargs['entity'],
+            kwargs['time'],
+            **common
         )
     else:
         raise ValueError(f"Unknown method '{method}'")
@@ -0,0 +1,198 @@
+# app/indicator_cache.py
+#
+# Локальное колоночное хранилище рядов Всемирного банка.
+# Ключ ячейки — (код индикатора, страна, год). На каждый индикатор
+# хранится один parquet-файл с колонками country/year/value/fetched_at,
+# горячие индикаторы дополнительно держатся в памяти (LRU).
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable
+
+import pandas as pd
+
+CACHE_DIR = os.getenv("WB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "wb_cache"))
+# Старые годы Всемирный банк почти не пересматривает, последние — часто
+CACHE_TTL = int(os.getenv("WB_CACHE_TTL", str(7 * 24 * 3600)))
+RECENT_TTL = int(os.getenv("WB_CACHE_RECENT_TTL", str(24 * 3600)))
+RECENT_YEARS = int(os.getenv("WB_CACHE_RECENT_YEARS", "3"))
+MEMORY_ITEMS = int(os.getenv("WB_CACHE_MEMORY_ITEMS", "64"))
+DISK_MAX_BYTES = int(os.getenv("WB_CACHE_DISK_MAX_MB", "512")) * 1024 * 1024
+
+COLUMNS = ["country", "year", "value", "fetched_at"]
+
+
+def _empty() -> pd.DataFrame:
+    df = pd.DataFrame({
+        "country": pd.Series(dtype="object"),
+        "year": pd.Series(dtype="int64"),
+        "value": pd.Series(dtype="float64"),
+        "fetched_at": pd.Series(dtype="float64"),
+    })
+    return df.set_index(["country", "year"])
+
+
+class IndicatorCache:
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        ttl: int = CACHE_TTL,
+        recent_ttl: int = RECENT_TTL,
+        recent_years: int = RECENT_YEARS,
+        memory_items: int = MEMORY_ITEMS,
+        disk_max_bytes: int = DISK_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+        self.recent_years = recent_years
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, code: str) -> str:
+        return os.path.join(self.directory, code.replace("/", "_") + ".parquet")
+
+    def _load(self, code: str) -> pd.DataFrame:
+        with self._lock:
+            if code in self._memory:
+                self._memory.move_to_end(code)
+                return self._memory[code]
+        path = self._path(code)
+        if os.path.exists(path):
+            try:
+                frame = pd.read_parquet(path).set_index(["country", "year"])
+                os.utime(path)  # отмечаем использование для LRU на диске
+            except (OSError, ValueError):
+                frame = _empty()
+        else:
+            frame = _empty()
+        self._remember(code, frame)
+        return frame
+
+    def _remember(self, code: str, frame: pd.DataFrame):
+        with self._lock:
+            self._memory[code] = frame
+            self._memory.move_to_end(code)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _ttl_for(self, years: pd.Index) -> pd.Series:
+        recent_from = datetime.utcnow().year - self.recent_years
+        return pd.Series(
+            [self.recent_ttl if y >= recent_from else self.ttl for y in years],
+            index=years,
+            dtype="float64",
+        )
+
+    def get(self, code: str, countries: Iterable[str], years: Iterable[int]):
+        """
+        Возвращает (values, missing):
+          values  — Series значений свежих ячеек с индексом (country, year)
+          missing — {country: [year, ...]} для отсутствующих или устаревших ячеек
+        """
+        cells = pd.MultiIndex.from_product(
+            [list(countries), list(years)], names=["country", "year"]
+        )
+        frame = self._load(code).reindex(cells)
+        age = time.time() - frame["fetched_at"]
+        ttl = self._ttl_for(cells.get_level_values("year")).to_numpy()
+        fresh = frame["fetched_at"].notna().to_numpy() & (age.to_numpy() < ttl)
+
+        missing: dict[str, list[int]] = {}
+        for country, year in cells[~fresh]:
+            missing.setdefault(country, []).append(int(year))
+
+        with self._lock:
+            self.hits += int(fresh.sum())
+            self.misses += int((~fresh).sum())
+        return frame.loc[fresh, "value"], missing
+
+    def put(self, code: str, values: pd.Series, requested: dict[str, list[int]]):
+        """
+        Сохраняет загруженные значения. Запрошенные, но не вернувшиеся ячейки
+        сохраняются как NaN, чтобы не ходить за ними в API до истечения TTL.
+        """
+        now = time.time()
+        cells = pd.MultiIndex.from_tuples(
+            [(c, y) for c, ys in requested.items() for y in ys],
+            names=["country", "year"],
+        )
+        fresh = pd.DataFrame({"value": float("nan"), "fetched_at": now}, index=cells)
+        if len(values):
+            fresh = fresh.reindex(fresh.index.union(values.index))
+            fresh.loc[values.index, "value"] = values.astype("float64")
+            fresh["fetched_at"] = now
+
+        with self._lock:
+            old = self._load(code)
+            merged = pd.concat([old[~old.index.isin(fresh.index)], fresh]).sort_index()
+            self._remember(code, merged)
+            self._write(code, merged)
+        self._evict_disk()
+
+    def _write(self, code: str, frame: pd.DataFrame):
+        path = self._path(code)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        frame.reset_index()[COLUMNS].to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def _evict_disk(self):
+        # Удаляем давно не использованные индикаторы, пока не влезем в лимит
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            code = os.path.basename(path)[: -len(".parquet")]
+            with self._lock:
+                self._memory.pop(code, None)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            for name in os.listdir(self.directory):
+                if name.endswith(".parquet"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+
+_cache = None
+
+
+def get_cache() -> IndicatorCache:
+    global _cache
+    if _cache is None:
+        _cache = IndicatorCache()
+    return _cache
@@ -0,0 +1,329 @@
+# app/inference.py
+#
+# Робастные стандартные ошибки для OLS, FE и RE: кластеризованные по
+# сущности (стране) и бутстреп — pairs (наблюдения), wild (веса Радемахера
+# на кластер, wild cluster bootstrap) и block (кластеры целиком).
+#
+# Модель сводится к OLS на преобразованных данных (Design): для FE — within
+# с добавлением общего среднего, как в PanelOLS, для RE — квази-демингование
+# с theta из подгонки. Репликации не пересчитывают модель с нуля:
+#   block — сумма покластерных X'X и X'y с мультиномиальными весами, O(G k^2);
+#   wild  — beta* = beta + C v, где C — покластерные (X'X)^-1 X'e, O(G k);
+#   pairs — взвешенные X'X и X'y, O(n k^2).
+# Репликации идут пачками в пуле процессов. У каждой пачки свой потомок
+# SeedSequence(seed), поэтому результат зависит только от seed, а не от
+# числа воркеров. Раундами по BOOTSTRAP_ROUND_BATCHES пачек, пока границы
+# доверительных интервалов не перестанут сдвигаться (early stopping).
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .moments import norm_sf, t_sf
+
+COV_TYPES = ("unadjusted", "clustered", "bootstrap")
+BOOTSTRAP_SCHEMES = ("pairs", "wild", "block")
+
+BOOTSTRAP_WORKERS = int(os.getenv("BOOTSTRAP_WORKERS", str(min(4, os.cpu_count() or 1))))
+BOOTSTRAP_MAX_REPS = int(os.getenv("BOOTSTRAP_MAX_REPS", "9999"))
+BOOTSTRAP_BATCH = int(os.getenv("BOOTSTRAP_BATCH", "50"))
+BOOTSTRAP_ROUND_BATCHES = int(os.getenv("BOOTSTRAP_ROUND_BATCHES", "4"))
+# Остановка, когда границы 95% интервалов за раунд сдвинулись меньше чем на TOL * se
+BOOTSTRAP_TOL = float(os.getenv("BOOTSTRAP_TOL", "0.05"))
+# Раунд дешевле стольких умножений считаем в текущем процессе: пул обойдётся дороже
+BOOTSTRAP_INLINE_WORK = float(os.getenv("BOOTSTRAP_INLINE_WORK", "5e7"))
+
+ALPHA = 0.05
+
+
+class Design:
+    """OLS y = X b на (преобразованных) данных и кластеры наблюдений."""
+
+    def __init__(self, X: np.ndarray, y: np.ndarray, names: List[str], groups, label: str = "entity"):
+        self.X = np.asarray(X, dtype="float64")
+        self.y = np.asarray(y, dtype="float64")
+        self.names = list(names)
+        self.label = label
+        self.clusters, uniques = pd.factorize(np.asarray(groups))
+        self.n_clusters = len(uniques)
+        self.XtX_inv = np.linalg.inv(self.X.T @ self.X)
+        self.beta = self.XtX_inv @ (self.X.T @ self.y)
+        self.resid = self.y - self.X @ self.beta
+
+    @property
+    def n(self) -> int:
+        return len(self.y)
+
+    @property
+    def k(self) -> int:
+        return self.X.shape[1]
+
+    def _by_cluster(self, values: np.ndarray) -> np.ndarray:
+        out = np.zeros((self.n_clusters,) + values.shape[1:])
+        np.add.at(out, self.clusters, values)
+        return out
+
+    def scores(self) -> np.ndarray:
+        """(G, k): X_g' e_g."""
+        return self._by_cluster(self.X * self.resid[:, None])
+
+    def cluster_moments(self):
+        """(G, k, k) и (G, k): X_g' X_g и X_g' y_g."""
+        return (self._by_cluster(np.einsum("ni,nj->nij", self.X, self.X)),
+                self._by_cluster(self.X * self.y[:, None]))
+
+
+def ols_design(df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str) -> Design:
+    if entity not in df.columns:
+        raise ValueError(f"Clustering requires the entity column '{entity}'")
+    data = df[[dependent_var] + list(exog_vars) + [entity]].dropna()
+    X = np.column_stack([np.ones(len(data)), data[exog_vars].to_numpy(dtype="float64")])
+    return Design(X, data[dependent_var].to_numpy(dtype="float64"), ["const"] + list(exog_vars),
+                  data[entity].to_numpy(), label=entity)
+
+
+def _panel(panel: pd.DataFrame, dependent_var: str, exog_vars: List[str]):
+    data = panel[[dependent_var] + list(exog_vars)].dropna().astype("float64")
+    entity = data.index.get_level_values(0)
+    return data, entity, data.groupby(level=0).transform("mean")
+
+
+def within_design(panel: pd.DataFrame, dependent_var: str, exog_vars: List[str]) -> Design:
+    """FE: z - mean_i(z) + mean(z); константа — как у PanelOLS."""
+    data, entity, means = _panel(panel, dependent_var, exog_vars)
+    z = data - means + data.mean()
+    X = np.column_stack([np.ones(len(z)), z[exog_vars].to_numpy()])
+    return Design(X, z[dependent_var].to_numpy(), ["const"] + list(exog_vars), entity.to_numpy(),
+                  label=panel.index.names[0] or "entity")
+
+
+def quasi_demeaned_design(panel: pd.DataFrame, dependent_var: str, exog_vars: List[str],
+                          theta: pd.Series) -> Design:
+    """RE: z - theta_i mean_i(z), константа 1 - theta_i; theta — из подгонки RandomEffects."""
+    data, entity, means = _panel(panel, dependent_var, exog_vars)
+    th = theta.reindex(entity).to_numpy(dtype="float64")
+    z = data.to_numpy() - th[:, None] * means.to_numpy()
+    X = np.column_stack([1.0 - th, z[:, 1:]])
+    return Design(X, z[:, 0], ["const"] + list(exog_vars), entity.to_numpy(),
+                  label=panel.index.names[0] or "entity")
+
+
+def clustered(design: Design) -> dict:
+    """Кластеризованная ковариация с поправкой G/(G-1) * (N-1)/(N-K), p-values по t(G-1)."""
+    G, n, k = design.n_clusters, design.n, design.k
+    if G < 2:
+        raise ValueError("Clustered covariance requires at least two clusters")
+    U = design.scores()
+    scale = G / (G - 1) * (n - 1) / (n - k)
+    cov = scale * design.XtX_inv @ (U.T @ U) @ design.XtX_inv
+    se = np.sqrt(np.diag(cov))
+    tstat = design.beta / se
+    half = -_t_ppf(ALPHA / 2, G - 1) * se
+    return {
+        "std_errors": se,
+        "pvalues": 2 * t_sf(np.abs(tstat), G - 1),
+        "conf_int": np.column_stack([design.beta - half, design.beta + half]),
+        "inference": {"cov_type": "clustered", "clusters": G, "cluster_by": design.label},
+    }
+
+
+def _t_ppf(q, df):
+    from scipy import special
+    return special.stdtrit(df, q)
+
+
+# --- бутстреп ---------------------------------------------------------------
+
+def _solve(XtX: np.ndarray, Xty: np.ndarray) -> np.ndarray:
+    # вырожденные выборки (например, без одного из регрессоров) — NaN
+    try:
+        return np.linalg.solve(XtX, Xty[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        out = np.full(Xty.shape, np.nan)
+        for r in range(len(XtX)):
+            try:
+                out[r] = np.linalg.solve(XtX[r], Xty[r])
+            except np.linalg.LinAlgError:
+                pass
+        return out
+
+
+def _draw(scheme: str, payload: tuple, seed: np.random.SeedSequence, reps: int) -> np.ndarray:
+    """Одна пачка репликаций: (reps, k). Выполняется в пуле процессов."""
+    rng = np.random.default_rng(seed)
+    if scheme == "wild":
+        C, beta = payload
+        V = rng.choice(np.array([-1.0, 1.0]), size=(C.shape[1], reps))
+        return (beta[:, None] + C @ V).T
+    if scheme == "block":
+        Gxx, Gxy = payload
+        G = len(Gxx)
+        W = rng.multinomial(G, np.full(G, 1.0 / G), size=reps).astype("float64")
+        return _solve(np.einsum("rg,gij->rij", W, Gxx), W @ Gxy)
+    X, y = payload
+    n = len(y)
+    XtX = np.empty((reps, X.shape[1], X.shape[1]))
+    Xty = np.empty((reps, X.shape[1]))
+    for r in range(reps):
+        Xw = X * np.bincount(rng.integers(n, size=n), minlength=n)[:, None]
+        XtX[r], Xty[r] = Xw.T @ X, Xw.T @ y
+    return _solve(XtX, Xty)
+
+
+def _work(design: Design, scheme: str) -> int:
+    # порядок числа умножений на одну репликацию
+    if scheme == "wild":
+        return design.n_clusters * design.k
+    if scheme == "block":
+        return design.n_clusters * design.k ** 2
+    return design.n * design.k ** 2
+
+
+def _payload(design: Design, scheme: str) -> tuple:
+    if scheme == "wild":
+        # вклад кластера g в beta*: (X'X)^-1 X_g' e_g, умноженный на v_g = ±1
+        return (design.XtX_inv @ design.scores().T, design.beta)
+    if scheme == "block":
+        return design.cluster_moments()
+    return (design.X, design.y)
+
+
+class BootstrapPool:
+    """Пул процессов для пачек репликаций; создаётся при первом обращении."""
+
+    def __init__(self, workers: int = BOOTSTRAP_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def map(self, scheme: str, payload: tuple, seeds, sizes, work: float = np.inf) -> List[np.ndarray]:
+        if self.workers <= 1 or work * sum(sizes) <= BOOTSTRAP_INLINE_WORK:
+            return [_draw(scheme, payload, s, n) for s, n in zip(seeds, sizes)]
+        with self._lock:
+            if self._pool is None:
+                # spawn: как и в jobs, форк процесса с потоками uvicorn небезопасен
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            pool = self._pool
+        futures = [pool.submit(_draw, scheme, payload, s, n) for s, n in zip(seeds, sizes)]
+        return [f.result() for f in futures]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+pool = BootstrapPool()
+
+
+def bootstrap(design: Design, scheme: str = "block", reps: int = 999, seed: int = 0,
+              early_stop: bool = True) -> dict:
+    """
+    Бутстреп-ошибки и процентильные 95% интервалы; reps — максимум репликаций.
+    p-values — по нормальному распределению со стандартной ошибкой бутстрепа.
+    """
+    if scheme not in BOOTSTRAP_SCHEMES:
+        raise ValueError(f"Unknown bootstrap scheme '{scheme}', expected one of {BOOTSTRAP_SCHEMES}")
+    if not 1 < reps <= BOOTSTRAP_MAX_REPS:
+        raise ValueError(f"Bootstrap replications must be between 2 and {BOOTSTRAP_MAX_REPS}")
+    if scheme != "pairs" and design.n_clusters < 2:
+        raise ValueError(f"'{scheme}' bootstrap requires at least two clusters")
+
+    sizes = [min(BOOTSTRAP_BATCH, reps - start) for start in range(0, reps, BOOTSTRAP_BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    payload = _payload(design, scheme)
+    q = [100 * ALPHA / 2, 100 * (1 - ALPHA / 2)]
+
+    draws, ci, converged = [], None, False
+    for start in range(0, len(sizes), BOOTSTRAP_ROUND_BATCHES):
+        stop = start + BOOTSTRAP_ROUND_BATCHES
+        draws.extend(pool.map(scheme, payload, seeds[start:stop], sizes[start:stop], _work(design, scheme)))
+        B = np.concatenate(draws)
+        B = B[np.isfinite(B).all(axis=1)]
+        if len(B) < 2:
+            continue
+        se = B.std(axis=0, ddof=1)
+        previous, ci = ci, np.percentile(B, q, axis=0).T
+        if early_stop and previous is not None and stop < len(sizes):
+            if np.all(np.abs(ci - previous).max(axis=1) <= BOOTSTRAP_TOL * se):
+                converged = True
+                break
+    if ci is None:
+        raise ValueError("Bootstrap failed: every replication was singular")
+
+    return {
+        "std_errors": se,
+        "pvalues": 2 * norm_sf(np.abs(design.beta / se)),
+        "conf_int": ci,
+        "inference": {
+            "cov_type": "bootstrap",
+            "scheme": scheme,
+            "reps": int(len(B)),
+            "max_reps": reps,
+            "seed": seed,
+            "converged": converged,
+            "clusters": design.n_clusters,
+            "cluster_by": design.label,
+        },
+    }
+
+
+def _label(info: dict) -> str:
+    if info["cov_type"] == "clustered":
+        return f"cluster-robust by {info['cluster_by']} ({info['clusters']} clusters)"
+    stopped = "converged" if info["converged"] else "not converged"
+    return f"bootstrap, {info['scheme']}, {info['reps']} reps ({stopped}), seed {info['seed']}"
+
+
+def _render(names, params, out: dict) -> str:
+    lines = [
+        f"Inference: {_label(out['inference'])}",
+        "-" * 80,
+        f"{'':<24}{'coef':>10}{'std err':>10}{'stat':>9}{'P>|stat|':>9}{'[0.025':>9}{'0.975]':>9}",
+        "-" * 80,
+    ]
+    for name, b, e, p, (lo, hi) in zip(names, params, out["std_errors"], out["pvalues"], out["conf_int"]):
+        lines.append(f"{str(name)[:24]:<24}{b:>10.4f}{e:>10.4f}{b / e:>9.3f}{p:>9.3f}{lo:>9.3f}{hi:>9.3f}")
+    lines.append("-" * 80)
+    return "\n".join(lines)
+
+
+def _finite(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def apply(result: dict, design: Design, cov_type: str, cov_kwds: Optional[dict] = None) -> dict:
+    """
+    Заменяет в результате оценки std_errors и pvalues на робастные,
+    добавляет conf_int, описание inference и таблицу в summary.
+    """
+    cov_kwds = dict(cov_kwds or {})
+    cov_kwds.pop("entity", None)
+    if cov_type == "clustered":
+        out = clustered(design)
+    elif cov_type == "bootstrap":
+        out = bootstrap(design, **cov_kwds)
+    else:
+        raise ValueError(f"Unknown cov_type '{cov_type}', expected one of {COV_TYPES}")
+    names = design.names
+    return {
+        **result,
+        "std_errors": {n: _finite(v) for n, v in zip(names, out["std_errors"])},
+        "pvalues": {n: _finite(v) for n, v in zip(names, out["pvalues"])},
+        "conf_int": {n: [_finite(lo), _finite(hi)] for n, (lo, hi) in zip(names, out["conf_int"])},
+        "inference": out["inference"],
+        # summary не рендерился — таблицу не добавляем
+        "summary": result["summary"] and result["summary"] + "\n\n" + _render(names, design.beta, out),
+    }
+
+
+def shutdown():
+    pool.shutdown()
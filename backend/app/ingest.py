@@ -0,0 +1,263 @@
+# app/ingest.py
+#
+# Потоковая загрузка CSV/Excel: файл читается кусками по INGEST_CHUNK_ROWS
+# строк, каждый кусок сразу пишется row group'ом в Parquet. В памяти
+# одновременно живёт только один кусок.
+#
+# Типы колонок выводятся по первому куску и дальше только расширяются
+# (null → что угодно, int → float, число → строка). Если кусок требует
+# расширения, текущая часть файла закрывается и начинается новая; в конце
+# части склеиваются по row group'ам с приведением к итоговой схеме.
+#
+# Ограничение: разбор идёт в постоянной памяти, но готовый Parquet хранится
+# в БД одним значением (bytea) и перед записью целиком читается в память.
+# Его размер (сжатый zstd, обычно в разы меньше исходного CSV) ограничен
+# INGEST_MAX_STORED_MB; больше — IngestError до чтения файла в память.
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import dataset_store
+
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "50000"))
+# до этого размера промежуточный Parquet держим в памяти, дальше — на диске
+INGEST_SPOOL_BYTES = int(os.getenv("INGEST_SPOOL_MB", "16")) * 1024 * 1024
+INGEST_MAX_STORED_BYTES = int(os.getenv("INGEST_MAX_STORED_MB", "512")) * 1024 * 1024
+PROGRESS_TTL = 3600
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class IngestError(ValueError):
+    pass
+
+
+@dataclass
+class IngestResult:
+    content: bytes
+    columns: List[dict]
+    row_count: int
+    chunks: int
+
+
+# Прогресс загрузок: upload_id -> состояние. Живёт в памяти процесса.
+_progress: dict[str, dict] = {}
+_progress_lock = threading.Lock()
+
+
+def get_progress(upload_id: str) -> Optional[dict]:
+    with _progress_lock:
+        state = _progress.get(upload_id)
+        return dict(state) if state else None
+
+
+def set_progress(upload_id: Optional[str], **state):
+    if not upload_id:
+        return
+    now = time.time()
+    with _progress_lock:
+        for key in [k for k, v in _progress.items() if now - v["updated_at"] > PROGRESS_TTL]:
+            del _progress[key]
+        _progress.setdefault(upload_id, {}).update(state, updated_at=now)
+
+
+class _CountingReader:
+    """Обёртка над файлом, считающая прочитанные байты."""
+
+    def __init__(self, raw: BinaryIO, on_read):
+        self._raw = raw
+        self._on_read = on_read
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self.bytes_read += len(data)
+        self._on_read(self.bytes_read)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def iter_csv_chunks(fileobj, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    yield from pd.read_csv(fileobj, chunksize=chunk_rows)
+
+
+def iter_excel_chunks(fileobj, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    import openpyxl
+
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else f"column_{i}" for i, h in enumerate(next(rows, []))]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(header)])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header).infer_objects()
+                batch = []
+        if batch or not header:
+            yield pd.DataFrame(batch, columns=header).infer_objects()
+    finally:
+        wb.close()
+
+
+def _is_string(t: pa.DataType) -> bool:
+    return pa.types.is_string(t) or pa.types.is_large_string(t)
+
+
+def _widen(a: pa.DataType, b: pa.DataType) -> pa.DataType:
+    if a == b:
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_null(b):
+        return a
+    if _is_string(a) and _is_string(b):
+        return pa.large_string()
+    numeric = (pa.types.is_integer, pa.types.is_floating, pa.types.is_boolean)
+    if any(f(a) for f in numeric) and any(f(b) for f in numeric):
+        if pa.types.is_integer(a) and pa.types.is_integer(b):
+            return pa.int64()
+        return pa.float64()
+    return pa.large_string()
+
+
+def _merge_schema(schema: pa.Schema, other: pa.Schema) -> pa.Schema:
+    if schema.names != other.names:
+        raise IngestError(f"Column set changed mid-file: {schema.names} vs {other.names}")
+    return pa.schema([pa.field(f.name, _widen(f.type, g.type)) for f, g in zip(schema, other)])
+
+
+def _cast(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    try:
+        return table.cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise IngestError(f"Cannot convert chunk to schema: {e}")
+
+
+def _new_part(schema: pa.Schema):
+    spool = tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_BYTES)
+    return spool, pq.ParquetWriter(spool, schema, compression="zstd")
+
+
+def parser_for(filename: str) -> str:
+    """Формат разбора по расширению: xlsx, xls или csv (всё остальное)."""
+    name = filename.lower()
+    for ext in ("xlsx", "xls"):
+        if name.endswith("." + ext):
+            return ext
+    return "csv"
+
+
+def content_hash(fileobj: BinaryIO, upload_id: Optional[str] = None, total_bytes: Optional[int] = None,
+                 parser: str = "csv") -> str:
+    """
+    sha256 формата разбора и всего файла блоками, без разбора; до и после
+    чтения файл перематывается в начало. Одни и те же байты под разными
+    расширениями разбираются по-разному, поэтому дают разные хэши.
+    Блокирующая: вызывать из пула потоков.
+    """
+    fileobj.seek(0)
+    digest = hashlib.sha256(parser.encode() + b"\0")
+    reader = _CountingReader(fileobj, lambda n: set_progress(upload_id, bytes_hashed=n))
+    set_progress(upload_id, status="hashing", bytes_hashed=0, total_bytes=total_bytes)
+    for block in iter(lambda: reader.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def ingest(
+    fileobj: BinaryIO,
+    filename: str,
+    upload_id: Optional[str] = None,
+    total_bytes: Optional[int] = None,
+    chunk_rows: int = INGEST_CHUNK_ROWS,
+) -> IngestResult:
+    """Блокирующая функция: вызывать из пула потоков."""
+    reader = _CountingReader(fileobj, lambda n: set_progress(upload_id, bytes_read=n))
+    set_progress(upload_id, status="parsing", rows=0, chunks=0, bytes_read=0, total_bytes=total_bytes)
+
+    parser = parser_for(filename)
+    if parser == "xlsx":
+        chunks = iter_excel_chunks(reader, chunk_rows)
+    elif parser == "xls":
+        # старый формат Excel потоково не читается
+        df = pd.read_excel(reader)
+        chunks = (df.iloc[i:i + chunk_rows] for i in range(0, max(len(df), 1), chunk_rows))
+    else:
+        chunks = iter_csv_chunks(reader, chunk_rows)
+
+    parts = []  # [(spool, schema)]
+    schema = writer = spool = None
+    rows = n_chunks = 0
+    try:
+        for chunk in chunks:
+            table = dataset_store.to_table(dataset_store.normalize_nans(chunk))
+            merged = table.schema.remove_metadata() if schema is None else _merge_schema(schema, table.schema)
+            if merged != schema:
+                if writer is not None:
+                    writer.close()
+                    parts.append((spool, schema))
+                schema = merged
+                spool, writer = _new_part(schema)
+            writer.write_table(_cast(table.replace_schema_metadata(None), schema))
+            rows += table.num_rows
+            n_chunks += 1
+            set_progress(upload_id, rows=rows, chunks=n_chunks)
+        if writer is None:
+            raise IngestError("File is empty")
+        writer.close()
+        parts.append((spool, schema))
+        content = _finish(parts, schema)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        set_progress(upload_id, status="failed", error=str(e))
+        raise IngestError(f"Cannot parse file: {e}")
+    except Exception as e:
+        set_progress(upload_id, status="failed", error=str(e))
+        raise
+    finally:
+        if spool is not None and all(spool is not part for part, _ in parts):
+            spool.close()
+        for part, _ in parts:
+            part.close()
+
+    set_progress(upload_id, status="parsed")
+    return IngestResult(content=content, columns=dataset_store.describe(schema), row_count=rows, chunks=n_chunks)
+
+
+def _read_stored(spool, max_bytes: int) -> bytes:
+    size = spool.seek(0, os.SEEK_END)
+    if size > max_bytes:
+        raise IngestError(
+            f"Parsed dataset is {size / 2 ** 20:.0f} MB, over the {max_bytes / 2 ** 20:.0f} MB storage limit"
+        )
+    spool.seek(0)
+    return spool.read()
+
+
+def _finish(parts, schema: pa.Schema, max_bytes: Optional[int] = None) -> bytes:
+    max_bytes = INGEST_MAX_STORED_BYTES if max_bytes is None else max_bytes
+    if len(parts) == 1:
+        return _read_stored(parts[0][0], max_bytes)
+    # несколько частей: склеиваем по row group'ам, приводя к итоговой схеме
+    out = tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_BYTES)
+    try:
+        with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+            for spool, _ in parts:
+                spool.seek(0)
+                part = pq.ParquetFile(spool)
+                for i in range(part.num_row_groups):
+                    writer.write_table(_cast(part.read_row_group(i), schema))
+        return _read_stored(out, max_bytes)
+    finally:
+        out.close()
@@ -0,0 +1,146 @@
+# app/jobs.py
+#
+# Очередь фоновых задач анализа. Загрузка данных идёт в event loop,
+# подгонка модели — в пуле процессов, чтобы тяжёлые панели не занимали
+# потоки веб-сервера. Состояние задач хранится в памяти процесса.
+# Задача принадлежит пользователю, который её поставил: статус и результат
+# отдаются только ему (результат может быть посчитан по его приватному датасету).
+
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Iterable, Optional
+
+from . import result_cache
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_LIMIT = int(os.getenv("ANALYSIS_QUEUE_LIMIT", "32"))
+ANALYSIS_JOB_TTL = int(os.getenv("ANALYSIS_JOB_TTL", "3600"))
+
+QUEUED, FETCHING, FITTING, DONE, FAILED = "queued", "fetching", "fitting", "done", "failed"
+FINISHED = {DONE, FAILED}
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, owner_id: Optional[uuid.UUID] = None):
+        self.id = str(uuid.uuid4())
+        self.owner_id = owner_id
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def set_status(self, status: str):
+        self.status = status
+        self.updated_at = time.time()
+        # будим всех, кто ждёт изменений (SSE), и взводим новое событие
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_changed(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = ANALYSIS_WORKERS, queue_limit: int = ANALYSIS_QUEUE_LIMIT,
+                 ttl: int = ANALYSIS_JOB_TTL):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.ttl = ttl
+        self._jobs: dict[str, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: форк процесса с живыми потоками uvicorn небезопасен
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def active(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status not in FINISHED)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [k for k, j in self._jobs.items() if j.status in FINISHED and j.updated_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def submit(self, fetch: Callable[[], Awaitable], fit: Callable,
+               cache_key: Optional[Callable] = None, cache_tags: Iterable[str] = (),
+               owner_id: Optional[uuid.UUID] = None, **fit_kwargs) -> Job:
+        """
+        fetch — корутина, возвращающая DataFrame; fit(df, **fit_kwargs)
+        выполняется в пуле процессов и должна быть picklable.
+        cache_key(df) — ключ в кэше результатов (считается в потоке: может
+        хэшировать весь DataFrame); при попадании модель не считается.
+        """
+        self._prune()
+        if self.active() >= self.queue_limit:
+            raise QueueFull(f"Analysis queue is full ({self.queue_limit} jobs)")
+        job = Job(owner_id)
+        self._jobs[job.id] = job
+        task = asyncio.ensure_future(self._run(job, fetch, fit, fit_kwargs, cache_key, list(cache_tags)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def run_in_pool(self, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = self.pool.submit(fn, *args, **kwargs)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    async def _run(self, job: Job, fetch, fit, fit_kwargs, cache_key=None, cache_tags=()):
+        try:
+            job.set_status(FETCHING)
+            df = await fetch()
+            key = await asyncio.get_running_loop().run_in_executor(None, cache_key, df) if cache_key else None
+            cached = result_cache.cache.get(key) if key else None
+            if cached is not None:
+                job.result = cached
+            else:
+                job.set_status(FITTING)
+                job.result = await self.run_in_pool(fit, df, **fit_kwargs)
+                if key:
+                    result_cache.cache.put(key, job.result, cache_tags)
+            job.set_status(DONE)
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.set_status(FAILED)
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+manager = JobManager()
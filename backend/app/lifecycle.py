@@ -0,0 +1,111 @@
+# app/lifecycle.py
+#
+# Запуск без блокировок: процесс начинает принимать запросы сразу,
+# а схема БД и прогрев тяжёлых библиотек идут в фоне. /healthz отвечает,
+# что процесс жив, /readyz — что он готов обслуживать запросы.
+#
+# Схему лучше создавать отдельным шагом деплоя:
+#     python -m app.lifecycle migrate
+# и выключить создание при старте (DB_AUTO_MIGRATE=0).
+
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "30"))
+PREWARM = os.getenv("PREWARM", "1") == "1"
+
+# Модули, которые не импортируются вместе с main, но нужны первой подгонке/загрузке
+HEAVY_MODULES = ("scipy.special", "app.econometrics", "wbdata")
+
+# linearmodels не переживает одновременный импорт из двух потоков (циклические
+# импорты внутри пакета), поэтому прогрев и ленивые импорты идут под одной блокировкой
+_import_lock = threading.RLock()
+
+state = {"database": False, "warm": False, "error": None, "started_at": time.time()}
+
+
+def migrate():
+    from . import models
+    from .database import engine
+    models.Base.metadata.create_all(bind=engine)
+
+
+def _ping():
+    from .database import engine
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def wait_for_database():
+    """Ждёт БД (и при DB_AUTO_MIGRATE создаёт таблицы), не блокируя event loop."""
+    step = migrate if DB_AUTO_MIGRATE else _ping
+    for i in range(DB_CONNECT_RETRIES):
+        try:
+            await asyncio.to_thread(step)
+            state["database"], state["error"] = True, None
+            print("✅ Database ready")
+            return
+        except OperationalError as e:
+            state["error"] = f"database not ready: {e.__class__.__name__}"
+            print(f"⏳ Database not ready, retrying ({i+1}/{DB_CONNECT_RETRIES})...")
+            await asyncio.sleep(min(2 ** i * 0.25, 5))
+    state["error"] = "could not connect to the database"
+    print("❌ Could not connect to the database after retries")
+
+
+def import_heavy(name: str):
+    # уже загруженный модуль возвращается сразу; пока идёт прогрев — ждём его
+    with _import_lock:
+        return importlib.import_module(name)
+
+
+def load_econometrics():
+    return import_heavy("app.econometrics")
+
+
+def _prewarm():
+    for name in HEAVY_MODULES:
+        try:
+            import_heavy(name)
+        except Exception as e:
+            print(f"⚠️ Prewarm of {name} failed: {e}")
+    try:
+        # индекс каталога индикаторов строится до первого автодополнения
+        from .catalog import get_catalog
+        get_catalog()
+    except Exception as e:
+        print(f"⚠️ Prewarm of the indicator catalogue failed: {e}")
+    state["warm"] = True
+
+
+def start_prewarm() -> threading.Thread:
+    thread = threading.Thread(target=_prewarm, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> dict:
+    return {
+        "ready": state["database"],
+        "database": state["database"],
+        "warm": state["warm"],
+        "error": state["error"],
+        "uptime": time.time() - state["started_at"],
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+        print("✅ Database tables created")
+    else:
+        print("usage: python -m app.lifecycle migrate")
+        sys.exit(2)
@@ -1,223 +1,823 @@
+import asyncio
+import json
+import logging
+import os
 import time
-import math
+import uuid
+from typing import Optional
+import numpy as np
 import pandas as pd
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.exc import OperationalError
-from sqlalchemy.orm import Session
-from jose import jwt, JWTError
+import httpx
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import engine, SessionLocal
+from .database import SessionLocal, AsyncSessionLocal, get_async_db, dispose_async_engine, pool_status
 from . import models, auth
+from .deps import get_current_user, get_optional_user
 from .schemas import (
     UserCreate, Token,
     DatasetResponse,
-    RunAnalysisRequest, RunAnalysisResponse, MethodEnum
+    RunAnalysisRequest, RunAnalysisResponse, MethodEnum, CovTypeEnum,
+    AnalysisJobResponse, AnalysisJobStatus,
+    SpecGridRequest,
+    RollingAnalysisRequest, RollingAnalysisResponse
 )
-from .world_bank import fetch_world_bank_data
-from .econometrics import perform_analysis
+from . import world_bank, jobs, spec_grid, dataset_store, ingest, result_cache, moments, chunked, studies, lifecycle, metrics, inference, rolling, catalog, transforms, responses
+from .world_bank import fetch_world_bank_data_async, WorldBankError
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_db() -> Session:
-    db = SessionLocal()
+# Ответы от GZIP_MIN_SIZE байт сжимаются, если клиент шлёт Accept-Encoding: gzip
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
     try:
-        yield db
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
     finally:
-        db.close()
+        # шаблон пути, а не сам путь: /analysis-jobs/{job_id}, а не id каждой задачи
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.REQUEST_LATENCY.labels(request.method, route, str(status_code)).observe(
+            time.perf_counter() - start
+        )
+
+def _require_metrics_token(request: Request):
+    code = metrics.check_token(request.headers.get("Authorization"))
+    if code == 404:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if code is not None:
+        raise HTTPException(status_code=401, detail="Invalid metrics token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/metrics", dependencies=[Depends(_require_metrics_token)])
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+# Предпросмотр по загруженному датасету считается не больше чем на стольких строках
+PREVIEW_MAX_ROWS = int(os.getenv("PREVIEW_MAX_ROWS", "2000"))
+
+_background: set[asyncio.Task] = set()
 
 @app.on_event("startup")
-def on_startup():
-    # Ждём, пока БД поднимется, и создаём таблицы
-    for i in range(10):
-        try:
-            models.Base.metadata.create_all(bind=engine)
-            print("✅ Database tables created")
-            return
-        except OperationalError:
-            print(f"⏳ Database not ready, retrying ({i+1}/10)...")
-            time.sleep(1)
-    raise RuntimeError("❌ Could not connect to the database after retries")
+async def on_startup():
+    # Не ждём БД и тяжёлые импорты: готовность видна в /readyz
+    task = asyncio.create_task(lifecycle.wait_for_database())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    if lifecycle.PREWARM:
+        lifecycle.start_prewarm()
+
+@app.get("/healthz", response_model=dict)
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    state = lifecycle.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    jobs.manager.shutdown()
+    auth.hash_pool.shutdown()
+    spec_grid.grid_pool.shutdown()
+    inference.shutdown()
+    await world_bank.close_client()
+    await dispose_async_engine()
+
+def _overloaded(e: Exception) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 @app.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(models.User).filter(models.User.email == user.email).first():
+async def register(user: UserCreate):
+    # сессии короткие: соединение не держится, пока считается bcrypt
+    async with AsyncSessionLocal() as db:
+        exists = await db.scalar(select(models.User.id).where(models.User.email == user.email))
+    if exists:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = auth.get_password_hash(user.password)
-    db_user = models.User(email=user.email, hashed_password=hashed)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # bcrypt считается в отдельном пуле процессов
+    try:
+        hashed = await auth.hash_password_async(user.password)
+    except auth.Overloaded as e:
+        raise _overloaded(e)
+    async with AsyncSessionLocal() as db:
+        db_user = models.User(email=user.email, hashed_password=hashed)
+        db.add(db_user)
+        try:
+            await db.commit()
+        except IntegrityError:
+            raise HTTPException(status_code=400, detail="Email already registered")
     token = auth.create_access_token({"sub": db_user.email})
     return {"access_token": token, "token_type": "bearer"}
 
 @app.post("/token", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(models.User).where(models.User.email == form_data.username))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    try:
+        ok, new_hash = await auth.verify_and_update_async(form_data.password, user.hashed_password)
+    except auth.Overloaded as e:
+        raise _overloaded(e)
+    if not ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+    if new_hash:
+        # хэш со старой стоимостью — заменяем, пока пароль известен
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash)
+            )
+            await db.commit()
     token = auth.create_access_token({"sub": user.email})
     return {"access_token": token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=dict)
-def read_users_me(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def read_users_me(user: auth.Principal = Depends(get_current_user)):
     return {"email": user.email, "id": str(user.id), "created_at": user.created_at}
 
 @app.post("/upload-dataset/", response_model=DatasetResponse)
 async def upload_dataset(
     file: UploadFile = File(...),
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    upload_id: Optional[str] = None,
+    user: auth.Principal = Depends(get_current_user),
 ):
-    # Проверяем токен
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    # Хеш содержимого и формата разбора считаем до разбора: тот же файл с тем же
+    # расширением уже лежит в dataset_blobs — разбирать и хранить его второй раз не нужно
+    digest = await run_in_threadpool(ingest.content_hash, file.file, upload_id, file.size,
+                                     ingest.parser_for(file.filename))
+    async with AsyncSessionLocal() as db:
+        blob = await db.get(models.DatasetBlob, digest)
+        meta = blob and (blob.columns, blob.row_count)
 
-    # Читаем файл
-    if file.filename.lower().endswith((".xls", ".xlsx")):
-        df = pd.read_excel(file.file)
+    deduplicated = meta is not None
+    if deduplicated:
+        ingest.set_progress(upload_id, status="parsed", rows=meta[1], deduplicated=True)
     else:
-        df = pd.read_csv(file.file)
-
-    # Заменяем все NaN (числовые и строковые) на None
-    records = df.to_dict(orient="records")
-    cleaned = []
-    for rec in records:
-        new = {}
-        for k, v in rec.items():
-            if isinstance(v, float) and math.isnan(v):
-                new[k] = None
-            elif isinstance(v, str) and v.strip().lower() == "nan":
-                new[k] = None
-            else:
-                new[k] = v
-        cleaned.append(new)
+        # Разбираем файл кусками в пуле потоков, не блокируя event loop
+        try:
+            parsed = await run_in_threadpool(
+                ingest.ingest, file.file, file.filename, upload_id=upload_id, total_bytes=file.size
+            )
+        except ingest.IngestError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        meta = (parsed.columns, parsed.row_count)
+        blob = models.DatasetBlob(
+            hash=digest,
+            content=parsed.content,
+            content_format=dataset_store.PARQUET,
+            columns=parsed.columns,
+            row_count=parsed.row_count,
+            size_bytes=file.size
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(blob)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # тот же файл параллельно сохранила другая загрузка
+                await db.rollback()
 
     dataset = models.UploadedDataset(
         user_id=user.id,
         file_name=file.filename,
-        data=cleaned
+        blob_hash=digest,
+        content_format=dataset_store.PARQUET,
+        columns=meta[0],
+        row_count=meta[1]
     )
-    db.add(dataset)
-    db.commit()
-    db.refresh(dataset)
-    return {"dataset_id": str(dataset.id), "status": "uploaded successfully"}
+    # Соединение берётся из пула только на время записи
+    async with AsyncSessionLocal() as db:
+        db.add(dataset)
+        await db.commit()
+    if upload_id:
+        ingest.set_progress(upload_id, status="stored", dataset_id=str(dataset.id))
+    return {"dataset_id": str(dataset.id), "status": "uploaded successfully", "row_count": meta[1],
+            "deduplicated": deduplicated}
 
-@app.get("/my-datasets/", response_model=list[dict])
-def list_my_datasets(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+@app.get("/upload-progress/{upload_id}", response_model=dict)
+def upload_progress(upload_id: str):
+    state = ingest.get_progress(upload_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return state
 
-    records = db.query(models.UploadedDataset).filter_by(user_id=user.id).all()
+@app.get("/my-datasets/", response_model=list[dict])
+async def list_my_datasets(user: auth.Principal = Depends(get_current_user),
+                           db: AsyncSession = Depends(get_async_db)):
+    records = (await db.scalars(
+        select(models.UploadedDataset).where(models.UploadedDataset.user_id == user.id)
+    )).all()
     return [
-        {"dataset_id": str(r.id), "file_name": r.file_name, "created_at": r.created_at}
+        {
+            "dataset_id": str(r.id),
+            "file_name": r.file_name,
+            "created_at": r.created_at,
+            "row_count": r.row_count,
+            "columns": [c["name"] for c in r.columns or []]
+        }
         for r in records
     ]
 
-@app.post("/run-analysis/", response_model=RunAnalysisResponse)
-def run_analysis(req: RunAnalysisRequest):
-    # Собираем индикаторы
+def _metric_names(req: RunAnalysisRequest) -> set[str]:
     names = {req.dependent_metric}
     if req.base_metric:
         names.add(req.base_metric)
-    names.update(req.control_metrics)
-    names.update(req.instrument_metrics)
-    names.update(req.exog_metrics)
+    names.update(req.control_metrics or [])
+    names.update(req.instrument_metrics or [])
+    names.update(req.exog_metrics or [])
+    return names
+
+def _transform_plan(req: RunAnalysisRequest) -> transforms.Plan:
+    steps = [
+        {"op": t.op.value, "column": t.column, "periods": t.periods, "name": t.name}
+        for t in req.transforms or []
+    ]
+    try:
+        return transforms.Plan(steps, req.period_mean)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid transforms: {e}")
 
-    from .indicator_map import METRIC_MAP
-    unknown = names - METRIC_MAP.keys()
+def _source_names(req: RunAnalysisRequest) -> set[str]:
+    """Исходные метрики, которые нужно загрузить: производные заменяются своими источниками."""
+    plan = _transform_plan(req)
+    return (_metric_names(req) - set(plan.outputs)) | set(plan.sources)
+
+def _resolve_indicators(req: RunAnalysisRequest) -> dict[str, str]:
+    # Метрика — псевдоним из METRIC_MAP или код индикатора из каталога.
+    # Блокирующая (первая загрузка каталога): вызывать через run_in_threadpool
+    try:
+        indicators, unknown = catalog.get_catalog().resolve(_source_names(req))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     if unknown:
         raise HTTPException(400, f"Unknown metrics: {unknown}")
+    return indicators
 
-    indicators = {METRIC_MAP[n]: n for n in names}
+def _cov_kwds(req: RunAnalysisRequest) -> Optional[dict]:
+    if req.cov_type == CovTypeEnum.UNADJUSTED:
+        return None
+    kwds = {"entity": req.entity or "country"}
+    if req.cov_type == CovTypeEnum.BOOTSTRAP:
+        kwds.update(scheme=req.bootstrap.value, reps=req.bootstrap_reps, seed=req.seed)
+    return kwds
 
-    df = fetch_world_bank_data(
-        indicators=indicators,
+def _analysis_kwargs(req: RunAnalysisRequest) -> dict:
+    return dict(
+        method=req.method.value,
+        dependent_var=req.dependent_metric,
+        base_var=req.base_metric,
+        control_vars=req.control_metrics or [],
+        instrument_vars=req.instrument_metrics,
+        exog_vars=req.exog_metrics,
+        entity=req.entity or "country",
+        time=req.time or "year",
+        cov_type=req.cov_type.value,
+        cov_kwds=_cov_kwds(req),
+        render_summary=req.include_summary
+    )
+
+async def _fetch_for(req: RunAnalysisRequest, indicators: dict[str, str]) -> pd.DataFrame:
+    # Загрузка идёт в event loop и не занимает поток воркера
+    plan = _transform_plan(req)
+    try:
+        df = await fetch_world_bank_data_async(
+            indicators=indicators,
+            countries=req.countries,
+            # лаги первых лет берутся из более ранних лет
+            start_year=req.start_year - plan.lookback,
+            end_year=req.end_year
+        )
+    except (httpx.HTTPError, WorldBankError) as e:
+        raise HTTPException(status_code=502, detail=f"World Bank API error: {e}")
+    if req.preview:
+        # как у загруженного датасета: первые строки до преобразований
+        df = df.head(PREVIEW_MAX_ROWS).reset_index(drop=True)
+    if not plan:
+        return df
+    kwargs = _analysis_kwargs(req)
+    # строки заданы индикаторами и фильтром запроса: хэшировать панель не нужно,
+    # а при обновлении индикатора его записи сбрасывает world_bank.invalidate_derived
+    rows = json.dumps(["wb", sorted(indicators.items()), sorted(c.strip().upper() for c in req.countries),
+                       req.start_year - plan.lookback, req.end_year, req.preview], ensure_ascii=False)
+    tags = [result_cache.indicator_tag(code) for code in indicators]
+    try:
+        return await run_in_threadpool(
+            plan.apply, df, kwargs["entity"], kwargs["time"], req.start_year, req.end_year,
+            version=rows, tags=tags,
+        )
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid transforms: {e}")
+
+def _open_dataset(db, req: RunAnalysisRequest, user: Optional[auth.Principal]) -> models.UploadedDataset:
+    """Датасет пользователя из запроса; проверяет владельца и наличие колонок."""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    try:
+        dataset_id = uuid.UUID(req.uploaded_dataset_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid dataset id")
+
+    dataset = db.query(models.UploadedDataset).filter_by(id=dataset_id, user_id=user.id).first()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    unknown = _source_names(req) - set(dataset_store.column_names(dataset))
+    if unknown:
+        raise HTTPException(400, f"Unknown columns: {unknown}")
+    # преобразования считаются только в памяти (см. _fit_out_of_core)
+    if _transform_plan(req) and (dataset.row_count or 0) > chunked.OUT_OF_CORE_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Transforms are limited to datasets of {chunked.OUT_OF_CORE_ROWS} rows; "
+                   f"this one has {dataset.row_count}",
+        )
+    # и порционный, и обычный путь читают хранимый Parquet целиком: размер —
+    # запросом к БД, до того как он окажется в памяти
+    if dataset.blob_hash:
+        size = db.scalar(select(func.length(models.DatasetBlob.content))
+                         .where(models.DatasetBlob.hash == dataset.blob_hash))
+    else:
+        size = db.scalar(select(func.length(models.UploadedDataset.content))
+                         .where(models.UploadedDataset.id == dataset.id))
+    if (size or 0) > chunked.OUT_OF_CORE_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Dataset is {size / 2 ** 20:.0f} MB; analysis is limited to "
+                   f"{chunked.OUT_OF_CORE_MAX_BYTES / 2 ** 20:.0f} MB of stored data",
+        )
+    return dataset
+
+def _dataset_version(dataset: models.UploadedDataset) -> str:
+    # одинаковое содержимое — одна версия: дубликаты делят результаты, моменты и производные колонки
+    if dataset.blob_hash:
+        return result_cache.blob_tag(dataset.blob_hash)
+    return result_cache.dataset_tag(dataset.id)
+
+def _load_uploaded(req: RunAnalysisRequest, user: Optional[auth.Principal], check_only: bool = False,
+                   all_numeric: bool = False):
+    """
+    Загружает из датасета пользователя только колонки и строки спецификации
+    (all_numeric — плюс все числовые колонки, для достаточных статистик).
+    Блокирующая: вызывать через run_in_threadpool. Сессия живёт только на время чтения.
+    """
+    db = SessionLocal()
+    try:
+        dataset = _open_dataset(db, req, user)
+        if check_only:
+            return str(dataset.id), _dataset_version(dataset)
+
+        plan = _transform_plan(req)
+        names = _source_names(req)
+        columns = sorted(names)
+        if all_numeric:
+            extra = [c for c in dataset_store.numeric_columns(dataset) if c not in names]
+            columns += extra[:max(0, moments.MOMENTS_MAX_COLUMNS - len(columns) - len(plan.outputs))]
+
+        kwargs = _analysis_kwargs(req)
+        version = _dataset_version(dataset)
+        start_year = req.start_year - plan.lookback
+        df = dataset_store.load_for_analysis(
+            dataset,
+            columns,
+            entity=kwargs["entity"],
+            time=kwargs["time"],
+            countries=req.countries,
+            start_year=start_year,
+            end_year=req.end_year,
+            max_rows=PREVIEW_MAX_ROWS if req.preview else None
+        )
+    finally:
+        db.close()
+    if not plan:
+        return df
+    # строки однозначно заданы датасетом и фильтром — по ним и кэшируются производные колонки
+    rows = json.dumps([version, sorted(c.strip().lower() for c in req.countries), start_year,
+                       req.end_year, req.preview, all_numeric])
+    try:
+        return plan.apply(df, kwargs["entity"], kwargs["time"], req.start_year, req.end_year, version=rows)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid transforms: {e}")
+
+def _fit_out_of_core(req: RunAnalysisRequest, user: Optional[auth.Principal]) -> Optional[dict]:
+    """
+    Для больших датасетов: модель по порциям Parquet, без DataFrame целиком.
+    None — если датасет небольшой и его выгоднее считать в памяти.
+    """
+    if _transform_plan(req):
+        # лаги и средние по периодам требуют всей истории страны, а не порции;
+        # датасеты больше OUT_OF_CORE_ROWS с преобразованиями отклоняет _open_dataset
+        return None
+    db = SessionLocal()
+    try:
+        dataset = _open_dataset(db, req, user)
+        if (dataset.row_count or 0) <= chunked.OUT_OF_CORE_ROWS:
+            return None
+        content = dataset_store.content_of(dataset)
+        if content is None:
+            return None
+    finally:
+        db.close()
+
+    kwargs = _analysis_kwargs(req)
+    columns = sorted(_metric_names(req) | {kwargs["entity"], kwargs["time"]})
+    source = lambda: dataset_store.iter_for_analysis(
+        content,
+        columns,
+        entity=kwargs["entity"],
+        time=kwargs["time"],
         countries=req.countries,
         start_year=req.start_year,
-        end_year=req.end_year
+        end_year=req.end_year,
     )
+    return chunked.fit(source, **kwargs)
 
-    result = perform_analysis(
-        df=df,
-        method=req.method.value,
+def _result_spec(req: RunAnalysisRequest) -> dict:
+    # всё, от чего зависит результат, кроме самих данных
+    spec = {
+        **_analysis_kwargs(req),
+        "countries": [c.strip().lower() for c in req.countries],
+        "start_year": req.start_year,
+        "end_year": req.end_year,
+        "preview": req.preview,
+    }
+    plan = _transform_plan(req)
+    if plan:
+        spec.update(transforms=plan.steps, period_mean=plan.period_mean)
+    return spec
+
+async def _prepare_source(req: RunAnalysisRequest, user: Optional[auth.Principal]):
+    """
+    Проверяет запрос сразу и возвращает (загрузчик данных, версия данных, теги кэша).
+    Версия None означает, что её считают по содержимому загруженного DataFrame.
+    """
+    if req.uploaded_dataset_id:
+        dataset_id, version = await run_in_threadpool(_load_uploaded, req, user, True)
+        return (lambda: run_in_threadpool(_load_uploaded, req, user)), version, [result_cache.dataset_tag(dataset_id)]
+    indicators = await run_in_threadpool(_resolve_indicators, req)
+    tags = [result_cache.indicator_tag(code) for code in indicators]
+    return (lambda: _fetch_for(req, indicators)), None, tags
+
+def _fit_with_moments(req: RunAnalysisRequest, user: Optional[auth.Principal], version: str,
+                      df: Optional[pd.DataFrame] = None) -> Optional[dict]:
+    """
+    OLS/FE по достаточным статистикам выборки. Моменты считаются один раз
+    на (версию данных, фильтр строк) и отвечают на любой набор регрессоров.
+    None — если спецификацию так посчитать нельзя.
+    """
+    kwargs = _analysis_kwargs(req)
+    key = (
+        version,
+        kwargs["entity"],
+        kwargs["time"],
+        tuple(sorted(c.strip().lower() for c in req.countries)),
+        req.start_year,
+        req.end_year,
+        _transform_plan(req).fingerprint(),
+    )
+    names = _metric_names(req)
+    # моменты по всем колонкам отвечают на любую спецификацию; если они не
+    # помещаются в MOMENTS_MAX_BYTES — только по колонкам этого запроса
+    narrow_key = key + (tuple(sorted(names)),)
+    pm = moments.cache.get(key) or moments.cache.get(narrow_key)
+    if pm is None:
+        if df is None:
+            df = _load_uploaded(req, user, all_numeric=True)
+        numeric = [
+            c for c in df.columns
+            if c not in (kwargs["entity"], kwargs["time"]) and pd.api.types.is_numeric_dtype(df[c])
+        ]
+        # сначала колонки запроса, потом остальные — в пределах лимита
+        numeric.sort(key=lambda c: c not in names)
+        try:
+            pm = moments.PanelMoments.from_frame(df, numeric[:moments.MOMENTS_MAX_COLUMNS], entity=kwargs["entity"])
+            moments.cache.put(key, pm)
+        except moments.MomentsTooLarge:
+            try:
+                pm = moments.PanelMoments.from_frame(df, [c for c in numeric if c in names], entity=kwargs["entity"])
+            except moments.MomentsTooLarge:
+                return None
+            moments.cache.put(narrow_key, pm)
+    try:
+        return moments.fit(pm, **kwargs)
+    except (KeyError, np.linalg.LinAlgError):
+        return None
+
+def _save_study(req: RunAnalysisRequest, user: Optional[auth.Principal], result: dict):
+    """Запись в историю после отправки ответа; ошибки не влияют на клиента."""
+    db = SessionLocal()
+    try:
+        kwargs = _analysis_kwargs(req)
+        studies.save_result(
+            db,
+            user.id if user else None,
+            method=kwargs["method"],
+            dependent_metric=kwargs["dependent_var"],
+            base_metric=kwargs["base_var"],
+            control_metrics=kwargs["control_vars"] or kwargs["exog_vars"],
+            countries=req.countries,
+            start_year=req.start_year,
+            end_year=req.end_year,
+            result=result,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Could not save study")
+    finally:
+        db.close()
+
+def _analysis_response(request: Request, payload: dict, table=responses.coefficients_table) -> Response:
+    """Arrow IPC, если клиент его просит, иначе JSON через orjson (response_model — только для схемы)."""
+    if responses.wants_arrow(request):
+        return responses.arrow_response(table(payload))
+    return responses.FastJSONResponse(payload)
+
+@app.post("/run-analysis/", response_model=RunAnalysisResponse)
+async def run_analysis(req: RunAnalysisRequest, background_tasks: BackgroundTasks, request: Request,
+                       user: Optional[auth.Principal] = Depends(get_optional_user),
+                       profile: bool = False):
+    if profile and not metrics.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (PROFILING_ENABLED=0)")
+    load, version, tags = await _prepare_source(req, user)
+    spec = _result_spec(req)
+    method = req.method.value
+    # при профилировании кэш пропускаем, иначе профилировать нечего
+    prof = metrics.RequestProfile() if profile else None
+    in_pool = prof.wrap if prof else (lambda fn: fn)
+
+    # Для загруженного датасета версия известна заранее — можно не читать данные
+    df = None
+    if version is None:
+        with metrics.stage("fetch", method):
+            df = await load()
+        with metrics.stage("clean", method):
+            version = await run_in_threadpool(result_cache.data_version, df)
+    key = result_cache.make_key(spec, version)
+    cached = result_cache.cache.get(key) if prof is None else None
+    if cached is not None:
+        if not req.preview:
+            background_tasks.add_task(_save_study, req, user, cached)
+        return _analysis_response(request, {**cached, "preview": req.preview})
+
+    result = None
+    # быстрые пути дают только обычные ошибки; робастные считает app.inference
+    fast = not req.preview and req.cov_type == CovTypeEnum.UNADJUSTED
+    try:
+        if req.uploaded_dataset_id and chunked.supports(method) and fast:
+            with metrics.stage("fit", method):
+                result = await run_in_threadpool(in_pool(_fit_out_of_core), req, user)
+        if result is None and moments.supports(method) and fast:
+            with metrics.stage("fit", method):
+                result = await run_in_threadpool(in_pool(_fit_with_moments), req, user, version, df)
+    except (ValueError, np.linalg.LinAlgError) as e:
+        raise HTTPException(status_code=400, detail=f"Analysis failed: {e}")
+    if result is None:
+        if df is None:
+            with metrics.stage("fetch", method):
+                df = await load()
+        try:
+            perform_analysis = lifecycle.load_econometrics().perform_analysis
+            result = await run_in_threadpool(in_pool(perform_analysis), df, **_analysis_kwargs(req))
+        except (ValueError, KeyError) as e:
+            raise HTTPException(status_code=400, detail=f"Analysis failed: {e}")
+    if not req.include_summary:
+        # у быстрых путей таблица дешёвая, но в компактном ответе её тоже нет
+        result = {**result, "summary": None}
+    result_cache.cache.put(key, result, tags)
+    # в историю результат пишется уже после отправки ответа
+    if not req.preview:
+        background_tasks.add_task(_save_study, req, user, result)
+    response = {**result, "preview": req.preview}
+    if prof is not None:
+        response["profile"] = prof.report()
+    return _analysis_response(request, response)
+
+@app.post("/run-analysis-rolling/", response_model=RollingAnalysisResponse)
+async def run_rolling_analysis(req: RollingAnalysisRequest, request: Request,
+                               user: Optional[auth.Principal] = Depends(get_optional_user)):
+    """Траектория коэффициентов OLS/FE по окнам лет за одну загрузку данных."""
+    if req.method not in (MethodEnum.OLS, MethodEnum.FE):
+        raise HTTPException(400, "Rolling estimation supports OLS and FE only")
+    if req.cov_type != CovTypeEnum.UNADJUSTED:
+        raise HTTPException(400, "Rolling estimation supports only cov_type='unadjusted'")
+    if req.method == MethodEnum.OLS and not req.base_metric:
+        raise HTTPException(400, "OLS requires 'base_metric'")
+    load, version, tags = await _prepare_source(req, user)
+    method = req.method.value
+    with metrics.stage("fetch", method):
+        df = await load()
+    if version is None:
+        version = await run_in_threadpool(result_cache.data_version, df)
+    spec = {**_result_spec(req), "rolling": {"window": req.window, "step": req.step, "mode": req.mode.value}}
+    key = result_cache.make_key(spec, version)
+    cached = result_cache.cache.get(key)
+    if cached is not None:
+        return _analysis_response(request, cached, responses.rolling_table)
+
+    kwargs = _analysis_kwargs(req)
+    exog = [kwargs["base_var"]] + kwargs["control_vars"] if req.method == MethodEnum.OLS else kwargs["exog_vars"] or []
+    try:
+        with metrics.stage("fit", method):
+            result = await run_in_threadpool(
+                rolling.fit_path, df, method, kwargs["dependent_var"], exog,
+                start_year=req.start_year, end_year=req.end_year, window=req.window, step=req.step,
+                mode=req.mode.value, entity=kwargs["entity"], time=kwargs["time"],
+            )
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Analysis failed: {e}")
+    result_cache.cache.put(key, result, tags)
+    return _analysis_response(request, result, responses.rolling_table)
+
+@app.post("/analysis-jobs/", response_model=AnalysisJobResponse, status_code=202)
+async def submit_analysis_job(req: RunAnalysisRequest, user: auth.Principal = Depends(get_current_user)):
+    load, version, tags = await _prepare_source(req, user)
+    spec = _result_spec(req)
+    try:
+        job = jobs.manager.submit(
+            load,
+            lifecycle.load_econometrics().perform_analysis,
+            cache_key=lambda df: result_cache.make_key(spec, version or result_cache.data_version(df)),
+            cache_tags=tags,
+            owner_id=user.id,
+            **_analysis_kwargs(req)
+        )
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {"job_id": job.id, "status": job.status}
+
+def _get_job(job_id: str, user: auth.Principal) -> jobs.Job:
+    job = jobs.manager.get(job_id)
+    # чужая задача неотличима от несуществующей
+    if job is None or job.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/analysis-jobs/{job_id}", response_model=AnalysisJobStatus)
+def analysis_job_status(job_id: str, user: auth.Principal = Depends(get_current_user)):
+    return _get_job(job_id, user).to_dict()
+
+@app.get("/analysis-jobs/{job_id}/result", response_model=RunAnalysisResponse)
+def analysis_job_result(job_id: str, user: auth.Principal = Depends(get_current_user)):
+    job = _get_job(job_id, user)
+    if job.status == jobs.FAILED:
+        raise HTTPException(status_code=422, detail=job.error)
+    if job.status != jobs.DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
+
+@app.get("/analysis-jobs/{job_id}/events")
+async def analysis_job_events(job_id: str, user: auth.Principal = Depends(get_current_user)):
+    job = _get_job(job_id, user)
+
+    async def stream():
+        last = None
+        while True:
+            if job.status != last:
+                last = job.status
+                yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.status in jobs.FINISHED:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            await job.wait_changed(timeout=15)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+
+@app.post("/run-analysis-grid/")
+async def run_analysis_grid(req: SpecGridRequest, request: Request):
+    windows = req.year_windows or [(req.start_year, req.end_year)]
+    specs = spec_grid.expand_specs(
+        methods=[m.value for m in req.methods],
+        control_sets=req.control_sets,
+        year_windows=windows,
         dependent_var=req.dependent_metric,
         base_var=req.base_metric,
-        control_vars=req.control_metrics,
         instrument_vars=req.instrument_metrics,
-        exog_vars=req.exog_metrics,
-        entity=req.entity,
-        time=req.time
+        render_summary=req.include_summary,
     )
-    return result
+    if not specs:
+        raise HTTPException(400, "Empty specification grid")
+    if len(specs) > spec_grid.GRID_MAX_SPECS:
+        raise HTTPException(400, f"Too many specifications: {len(specs)} > {spec_grid.GRID_MAX_SPECS}")
+    if any(m == MethodEnum.TSLS for m in req.methods) and not req.instrument_metrics:
+        raise HTTPException(400, "2SLS requires 'instrument_metrics'")
 
+    # Все метрики сетки и весь охват лет — одним запросом
+    union = RunAnalysisRequest(
+        countries=req.countries,
+        method=req.methods[0],
+        dependent_metric=req.dependent_metric,
+        base_metric=req.base_metric,
+        control_metrics=sorted({c for cs in req.control_sets for c in cs}),
+        instrument_metrics=req.instrument_metrics,
+        start_year=min(s for s, _ in windows),
+        end_year=max(e for _, e in windows),
+    )
+    indicators = await run_in_threadpool(_resolve_indicators, union)
+    df = await _fetch_for(union, indicators)
+    panel = await run_in_threadpool(spec_grid.build_panel, df, "country", "year")
 
+    # Уже посчитанные спецификации отдаём из кэша, в пул уходят только остальные
+    version = await run_in_threadpool(result_cache.data_version, panel)
+    tags = [result_cache.indicator_tag(code) for code in indicators]
+    keys = {s["id"]: result_cache.make_key({**s, "id": None, "grid": True}, version) for s in specs}
+    cached, pending = [], []
+    for s in specs:
+        hit = result_cache.cache.get(keys[s["id"]])
+        if hit is not None:
+            cached.append({"spec": s, "result": hit})
+        else:
+            pending.append(s)
 
-@app.get("/my-studies/", response_model=list[dict])
-def my_studies(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    # в пул ставим до начала ответа, чтобы переполнение вернуть как 503
     try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+        grid = await spec_grid.run_grid(panel, pending) if pending else None
+    except spec_grid.Overloaded as e:
+        raise _overloaded(e)
 
-    records = db.query(models.StudyResult).filter_by(user_id=user.id).order_by(models.StudyResult.created_at.desc()).all()
-    return [{
-        "method": r.method,
-        "start_year": r.start_year,
-        "end_year": r.end_year,
-        "countries": r.countries,
-        "metrics": r.metrics,
-        "r_squared": r.r_squared,
-        "summary": r.summary
-    } for r in records]
+    async def fitted():
+        if grid is not None:
+            async for item in grid:
+                if "result" in item:
+                    result_cache.cache.put(keys[item["spec"]["id"]], item["result"], tags)
+                yield item
 
+    if responses.wants_arrow(request):
+        # колоночная таблица собирается целиком, без потоковой отдачи
+        items = cached + [item async for item in fitted()]
+        return responses.arrow_response(responses.grid_table(items))
+
+    async def stream():
+        for item in cached:
+            yield responses.ndjson_line(item)
+        async for item in fitted():
+            yield responses.ndjson_line(item)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+
+@app.get("/catalog/indicators", response_model=list[dict])
+def search_indicators(q: str, limit: int = 20):
+    return catalog.get_catalog().search_indicators(q, limit)
+
+@app.get("/catalog/indicators/{code}", response_model=dict)
+def get_indicator(code: str):
+    record = catalog.get_catalog().indicator(code)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Indicator not found")
+    return record
+
+@app.get("/catalog/countries", response_model=list[dict])
+def search_countries(q: str, limit: int = 20, include_aggregates: bool = True):
+    return catalog.get_catalog().search_countries(q, limit, include_aggregates)
+
+@app.get("/my-studies/", response_model=dict)
+async def my_studies(user: auth.Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db),
+                     limit: int = 20, cursor: Optional[str] = None, include_summary: bool = False):
+    try:
+        return await db.run_sync(
+            studies.list_studies, user.id, limit=limit, cursor=cursor, include_summary=include_summary
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-from collections import Counter
-import json
 
 @app.get("/popular-studies/", response_model=list[dict])
-def popular_studies(db: Session = Depends(get_db), top_n: int = 10):
-    records = db.query(models.StudyResult).all()
-    counter = Counter()
-
-    for r in records:
-        key = json.dumps({
-            "method": r.method,
-            "dependent_metric": r.dependent_metric,
-            "base_metric": r.base_metric,
-            "control_metrics": sorted(r.metrics or [])
-        }, sort_keys=True)
-        counter[key] += 1
-
-    top = counter.most_common(top_n)
-    return [
-        {
-            **json.loads(key),
-            "count": count
-        } for key, count in top
-    ]
+async def popular_studies(db: AsyncSession = Depends(get_async_db), top_n: int = 10,
+                          window: Optional[str] = None):
+    # window: day/week/month — рейтинг по дневным счётчикам, иначе за всё время
+    if window is not None and window not in studies.WINDOWS:
+        raise HTTPException(400, f"Unknown window: {window}")
+    return await db.run_sync(studies.popular, top_n=max(1, min(top_n, 100)), window=window)
+
+@app.get("/internal/cache-stats", response_model=dict, dependencies=[Depends(_require_metrics_token)])
+def cache_stats():
+    from .indicator_cache import get_cache
+    return {
+        "auth": auth.principal_cache.stats(),
+        "password_hashing": auth.hash_pool.stats(),
+        "spec_grid": spec_grid.grid_pool.stats(),
+        "results": result_cache.cache.stats(),
+        "indicators": get_cache().stats(),
+        "catalog": catalog.get_catalog().stats(),
+        "transforms": transforms.cache.stats(),
+        "db_pool": pool_status(),
+    }
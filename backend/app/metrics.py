@@ -0,0 +1,165 @@
+# app/metrics.py
+#
+# Метрики Prometheus: латентность запросов по эндпоинтам, время стадий
+# анализа (fetch, clean, fit, render), счётчики кэшей и состояние пулов.
+# Кэши и пулы не инструментируются напрямую — их stats() читаются при
+# каждом опросе /metrics.
+#
+# Профилирование одного запроса: RequestProfile оборачивает функции,
+# которые выполняются в пуле потоков, и собирает cProfile и время стадий.
+# Подгонки в пуле процессов (фоновые задачи) сюда не попадают.
+#
+# /metrics и /internal/cache-stats раскрывают нагрузку и состояние кэшей,
+# поэтому отвечают только с заголовком Authorization: Bearer METRICS_TOKEN;
+# без METRICS_TOKEN в окружении эндпоинты выключены (404).
+
+import contextvars
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Профилирование по запросу (?profile=true) — только если явно разрешено
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))
+# Токен для /metrics и /internal/cache-stats; пусто — эндпоинты выключены
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STAGE_SECONDS = Histogram(
+    "analysis_stage_seconds",
+    "Time spent in each stage of an analysis",
+    ["stage", "method"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("profile", default=None)
+
+
+@contextmanager
+def stage(name: str, method: str = ""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name, method).observe(elapsed)
+        profile = _profile.get()
+        if profile is not None:
+            profile.add_stage(name, elapsed)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+        self._token = _profile.set(self)
+
+    def add_stage(self, name: str, elapsed: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def wrap(self, fn: Callable) -> Callable:
+        """fn, выполняемая под cProfile в том потоке, где её вызовут."""
+        def run(*args, **kwargs):
+            token = _profile.set(self)
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                _profile.reset(token)
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(prof)
+                    else:
+                        self._stats.add(prof)
+        return run
+
+    def report(self, top: int = PROFILE_TOP) -> dict:
+        _profile.reset(self._token)
+        text = ""
+        if self._stats is not None:
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats("cumulative").print_stats(top)
+            text = out.getvalue()
+        return {"stages": {k: round(v, 6) for k, v in self.stages.items()}, "cprofile": text}
+
+
+class _StatsCollector:
+    """Счётчики кэшей и состояние пулов в момент опроса."""
+
+    def describe(self):
+        # без describe() реестр вызвал бы collect() уже при регистрации
+        return []
+
+    def collect(self):
+        from . import auth, jobs, result_cache, transforms
+        from .database import pool_status
+        from .indicator_cache import get_cache
+
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        items = GaugeMetricFamily("cache_items", "Items held in cache", labels=["cache"])
+        caches = {
+            "auth": auth.principal_cache.stats(),
+            "results": result_cache.cache.stats(),
+            "indicators": get_cache().stats(),
+            "transforms": transforms.cache.stats(),
+        }
+        for name, s in caches.items():
+            hits.add_metric([name], s.get("hits", 0))
+            misses.add_metric([name], s.get("misses", 0))
+            items.add_metric([name], s.get("items", s.get("memory_items", 0)))
+        yield hits
+        yield misses
+        yield items
+
+        pool = GaugeMetricFamily("db_pool_connections", "DB pool connections", labels=["engine", "state"])
+        for engine, s in pool_status().items():
+            for state in ("size", "checkedin", "checkedout", "overflow"):
+                if state in s:
+                    pool.add_metric([engine, state], s[state])
+        yield pool
+
+        hashing = auth.hash_pool.stats()
+        yield GaugeMetricFamily("password_hash_in_flight", "bcrypt operations in flight",
+                                value=hashing["in_flight"])
+        yield CounterMetricFamily("password_hash_rejected", "bcrypt operations rejected by admission control",
+                                  value=hashing["rejected"])
+        yield GaugeMetricFamily("analysis_jobs_active", "Queued or running analysis jobs",
+                                value=jobs.manager.active())
+
+
+REGISTRY.register(_StatsCollector())
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+def check_token(authorization: Optional[str]) -> Optional[int]:
+    """None — доступ разрешён, иначе код ответа: 404 без METRICS_TOKEN, 401 при неверном токене."""
+    if not METRICS_TOKEN:
+        return 404
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return 401
+    return None
+
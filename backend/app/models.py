@@ -1,5 +1,6 @@
 from .database import Base
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Date, DateTime, Boolean, JSON, ForeignKey, LargeBinary, Index, Text
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.dialects.postgresql import UUID
 from datetime import datetime
 import uuid
@@ -11,12 +12,34 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class DatasetBlob(Base):
+    # Содержимое загрузки, общее для всех датасетов с тем же исходным файлом и
+    # форматом разбора; hash — ingest.content_hash (sha256 формата и байтов файла)
+    __tablename__ = "dataset_blobs"
+    hash = Column(String(64), primary_key=True)
+    content = deferred(Column(LargeBinary, nullable=False))
+    content_format = Column(String, nullable=False)
+    columns = Column(JSON, nullable=True)
+    row_count = Column(Integer, nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class UploadedDataset(Base):
     __tablename__ = "uploaded_datasets"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     file_name = Column(String, nullable=False)
-    data = Column(JSON, nullable=False)
+    # Старый формат: список строк в JSON. Новые загрузки пишутся в content
+    data = deferred(Column(JSON, nullable=True))
+    # Parquet-файл; грузится только при явном обращении
+    content = deferred(Column(LargeBinary, nullable=True))
+    content_format = Column(String, nullable=True)
+    # Новые загрузки: ссылка на общий DatasetBlob, content пуст; columns и
+    # row_count копируются из blob, чтобы список датасетов не ходил в blob
+    blob_hash = Column(String(64), ForeignKey("dataset_blobs.hash"), nullable=True, index=True)
+    blob = relationship(DatasetBlob, lazy="select")
+    columns = Column(JSON, nullable=True)
+    row_count = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Study(Base):
@@ -36,3 +59,51 @@ class Study(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     is_public = Column(Boolean, default=True)
     view_count = Column(Integer, default=0)
+
+class StudyResult(Base):
+    __tablename__ = "study_results"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    method = Column(String, nullable=False)
+    dependent_metric = Column(String, nullable=False)
+    base_metric = Column(String, nullable=True)
+    # контрольные переменные
+    metrics = Column(JSON, nullable=True)
+    countries = Column(JSON, nullable=True)
+    start_year = Column(Integer, nullable=True)
+    end_year = Column(Integer, nullable=True)
+    r_squared = Column(Float, nullable=True)
+    n_obs = Column(Integer, nullable=True)
+    # sha256 нормализованной спецификации (метод, метрики) — см. studies.fingerprint
+    fingerprint = Column(String(64), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_study_results_user_created", "user_id", "created_at", "id"),)
+
+# Объёмная часть результата: текст summary и полные таблицы коэффициентов.
+# Читается только по запросу, список исследований её не трогает
+class StudyResultDetail(Base):
+    __tablename__ = "study_result_details"
+    study_id = Column(UUID(as_uuid=True), ForeignKey("study_results.id", ondelete="CASCADE"), primary_key=True)
+    summary = Column(Text, nullable=True)
+    params = Column(JSON, nullable=True)
+    pvalues = Column(JSON, nullable=True)
+
+# Счётчики популярности обновляются при записи результата,
+# чтобы /popular-studies/ не сканировал всю историю
+class StudyPopularity(Base):
+    __tablename__ = "study_popularity"
+    fingerprint = Column(String(64), primary_key=True)
+    method = Column(String, nullable=False)
+    dependent_metric = Column(String, nullable=False)
+    base_metric = Column(String, nullable=True)
+    control_metrics = Column(JSON, nullable=False)
+    count = Column(Integer, nullable=False, default=0, index=True)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+
+# Те же счётчики по дням — для рейтингов за последний день/неделю
+class StudyPopularityDaily(Base):
+    __tablename__ = "study_popularity_daily"
+    fingerprint = Column(String(64), ForeignKey("study_popularity.fingerprint"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    __table_args__ = (Index("ix_study_popularity_daily_day", "day"),)
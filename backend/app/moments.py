@@ -0,0 +1,286 @@
+# app/moments.py
+#
+# Достаточные статистики для OLS и FE (within) по любому подмножеству колонок.
+#
+# Строки группируются по (entity, шаблон пропусков). Для каждой группы
+# хранятся n, суммы и матрица перекрёстных произведений по всем числовым
+# колонкам (пропуски заменены нулями). Для набора колонок C выборка
+# complete-case — это ровно группы, у которых в C нет пропусков, так что
+# моменты любой спецификации — сумма по подходящим группам, без повторного
+# прохода по данным. Результаты совпадают с statsmodels OLS (missing='drop')
+# и linearmodels PanelOLS(entity_effects=True) с константой.
+#
+# Групп столько же, сколько различных (entity, шаблон), и при разбросанных
+# пропусках их число приближается к числу строк, а X'X хранится на каждую.
+# Поэтому размер моментов ограничен MOMENTS_MAX_BYTES: сверх него
+# from_frame бросает MomentsTooLarge, и вызывающий сужает набор колонок
+# или считает модель напрямую.
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+MOMENTS_CACHE_SIZE = int(os.getenv("MOMENTS_CACHE_SIZE", "64"))
+MOMENTS_MAX_COLUMNS = int(os.getenv("MOMENTS_MAX_COLUMNS", "64"))
+# Предел на один набор моментов и на весь кэш, байты
+MOMENTS_MAX_BYTES = int(os.getenv("MOMENTS_MAX_BYTES", str(32 * 2 ** 20)))
+MOMENTS_CACHE_BYTES = int(os.getenv("MOMENTS_CACHE_BYTES", str(256 * 2 ** 20)))
+
+
+class MomentsTooLarge(Exception):
+    """Моменты по этим колонкам заняли бы больше MOMENTS_MAX_BYTES."""
+
+
+class PanelMoments:
+    def __init__(self, columns, entity_idx, pattern, n, s, S, n_entities):
+        self.columns = list(columns)
+        self._pos = {c: i for i, c in enumerate(self.columns)}
+        self.entity_idx = entity_idx  # (G,)
+        self.pattern = pattern        # (G, k), True — пропуск
+        self.n = n                    # (G,)
+        self.s = s                    # (G, k)
+        self.S = S                    # (G, k, k)
+        self.n_entities = n_entities
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.entity_idx, self.pattern, self.n, self.s, self.S))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: List[str], entity: Optional[str] = None,
+                   max_bytes: Optional[int] = None) -> "PanelMoments":
+        X = df[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+        miss = np.isnan(X)
+        X0 = np.where(miss, 0.0, X)
+
+        if entity is not None and entity in df.columns:
+            ent_codes, ent_uniques = pd.factorize(df[entity], use_na_sentinel=True)
+            keep = ent_codes >= 0
+            X0, miss, ent_codes = X0[keep], miss[keep], ent_codes[keep]
+            n_entities = len(ent_uniques)
+        else:
+            ent_codes = np.zeros(len(X0), dtype=np.int64)
+            n_entities = 1
+
+        # шаблон пропусков -> номер, затем номер группы (entity, шаблон)
+        packed = np.packbits(miss, axis=1) if miss.shape[1] else np.zeros((len(miss), 1), np.uint8)
+        _, pat_id = np.unique(packed, axis=0, return_inverse=True)
+        pat_id = pat_id.reshape(-1)
+        group_key = ent_codes.astype(np.int64) * (int(pat_id.max(initial=0)) + 1) + pat_id
+        groups, group_id = np.unique(group_key, return_inverse=True)
+        group_id = group_id.reshape(-1)
+
+        order = np.argsort(group_id, kind="stable")
+        bounds = np.flatnonzero(np.diff(group_id[order])) + 1
+        starts = np.concatenate([[0], bounds]) if len(order) else np.array([], dtype=np.int64)
+        G, k = len(groups), X0.shape[1]
+        max_bytes = MOMENTS_MAX_BYTES if max_bytes is None else max_bytes
+        if G * k * (k + 2) * 8 > max_bytes:
+            raise MomentsTooLarge(f"{G} groups x {k} columns exceed {max_bytes} bytes")
+
+        n = np.zeros(G)
+        s = np.zeros((G, k))
+        S = np.zeros((G, k, k))
+        entity_idx = np.zeros(G, dtype=np.int64)
+        pattern = np.zeros((G, k), dtype=bool)
+        for g, start in enumerate(starts):
+            end = starts[g + 1] if g + 1 < len(starts) else len(order)
+            rows = order[start:end]
+            block = X0[rows]
+            n[g] = len(rows)
+            s[g] = block.sum(axis=0)
+            S[g] = block.T @ block
+            entity_idx[g] = ent_codes[rows[0]]
+            pattern[g] = miss[rows[0]]
+        return cls(columns, entity_idx, pattern, n, s, S, n_entities)
+
+    def _select(self, cols: List[str]):
+        unknown = [c for c in cols if c not in self._pos]
+        if unknown:
+            raise KeyError(f"Columns without moments: {unknown}")
+        idx = [self._pos[c] for c in cols]
+        # номера подходящих групп: выборка по ним копирует только нужный блок S
+        ok = np.flatnonzero(~self.pattern[:, idx].any(axis=1))
+        return idx, ok
+
+    def _cross(self, idx, ok) -> np.ndarray:
+        return self.S[np.ix_(ok, idx, idx)].sum(axis=0)
+
+    def ols(self, dependent_var: str, exog_vars: List[str]) -> dict:
+        idx, ok = self._select([dependent_var] + exog_vars)
+        N = self.n[ok].sum()
+        s = self.s[np.ix_(ok, idx)].sum(axis=0)
+        return ols_solution(N, s, self._cross(idx, ok), exog_vars)
+
+    def entity_sums(self, dependent_var: str, exog_vars: List[str]):
+        """(n_i, s_i, S): число строк и суммы по странам выборки и общий X'X колонок [y, x...]."""
+        idx, ok = self._select([dependent_var] + exog_vars)
+        ent = self.entity_idx[ok]
+        n_i = np.bincount(ent, weights=self.n[ok], minlength=self.n_entities)
+        s_i = np.zeros((self.n_entities, len(idx)))
+        np.add.at(s_i, ent, self.s[np.ix_(ok, idx)])
+        present = n_i > 0
+        return n_i[present], s_i[present], self._cross(idx, ok)
+
+    def fe(self, dependent_var: str, exog_vars: List[str]) -> dict:
+        n_i, s_i, S = self.entity_sums(dependent_var, exog_vars)
+        # within: sum_i (S_i - s_i s_i' / n_i)
+        W = S - np.einsum("ij,ik->jk", s_i / n_i[:, None], s_i)
+        N = n_i.sum()
+        return fe_solution(W, s_i.sum(axis=0) / N, N, len(n_i), exog_vars)
+
+
+def ols_solution(N, s, S, exog_vars: List[str]) -> dict:
+    """
+    OLS с константой по моментам выборки: s — суммы, S — перекрёстные
+    произведения колонок [y, x1, ..., xk].
+    """
+    k = len(exog_vars)
+    XtX = np.empty((k + 1, k + 1))
+    XtX[0, 0] = N
+    XtX[0, 1:] = XtX[1:, 0] = s[1:]
+    XtX[1:, 1:] = S[1:, 1:]
+    Xty = np.concatenate([[s[0]], S[1:, 0]])
+    yty = S[0, 0]
+
+    # псевдообратная, как в statsmodels OLS: почти вырожденный X'X не ломает решение
+    XtX_inv = np.linalg.pinv(XtX)
+    beta = XtX_inv @ Xty
+    rss = yty - beta @ Xty
+    tss = yty - s[0] ** 2 / N
+    df_resid = N - (k + 1)
+    cov = rss / df_resid * XtX_inv
+    se = np.sqrt(np.diag(cov))
+    pvalues = 2 * t_sf(np.abs(beta / se), df_resid)
+    names = ["const"] + list(exog_vars)
+    return make_result("OLS", names, beta, se, pvalues, 1 - rss / tss, int(N))
+
+
+def fe_solution(W, mean, N, n_entities: int, exog_vars: List[str]) -> dict:
+    """
+    FE (within) по демингованным моментам W колонок [y, x1, ..., xk];
+    mean — общие средние тех же колонок, нужны для константы как в PanelOLS.
+    """
+    Wxx, Wxy, Wyy = W[1:, 1:], W[1:, 0], W[0, 0]
+    # PanelOLS отказывает при неполном ранге — тогда вызывающий считает напрямую
+    if np.linalg.matrix_rank(Wxx) < len(exog_vars):
+        raise np.linalg.LinAlgError("Within regressors do not have full column rank")
+    Wxx_inv = np.linalg.pinv(Wxx)
+    beta = Wxx_inv @ Wxy
+    rss = Wyy - beta @ Wxy
+
+    const = mean[0] - mean[1:] @ beta
+    df_resid = N - len(exog_vars) - n_entities
+    s2 = rss / df_resid
+    se_beta = np.sqrt(s2 * np.diag(Wxx_inv))
+    se_const = math.sqrt(s2 * (1.0 / N + mean[1:] @ Wxx_inv @ mean[1:]))
+
+    params = np.concatenate([[const], beta])
+    se = np.concatenate([[se_const], se_beta])
+    # PanelOLS по умолчанию debiased=True: t-распределение с df_resid
+    pvalues = 2 * t_sf(np.abs(params / se), df_resid)
+    names = ["const"] + list(exog_vars)
+    return make_result("Fixed Effects", names, params, se, pvalues, 1 - rss / Wyy, int(N))
+
+
+# scipy.special вместо scipy.stats: тот же результат, но импорт в разы легче
+def t_sf(x, df):
+    from scipy import special
+    return special.stdtr(df, -np.asarray(x))
+
+
+def norm_sf(x):
+    from scipy import special
+    return special.ndtr(-np.asarray(x))
+
+
+def _finite(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def summary_table(method: str, names, params, se, pvalues, r_squared, n_obs) -> str:
+    lines = [
+        f"{method} (sufficient statistics)",
+        f"No. Observations: {n_obs:>10}    R-squared: {r_squared:.4f}",
+        "-" * 62,
+        f"{'':<24}{'coef':>10}{'std err':>10}{'t':>9}{'P>|t|':>9}",
+        "-" * 62,
+    ]
+    for name, b, e, p in zip(names, params, se, pvalues):
+        lines.append(f"{str(name)[:24]:<24}{b:>10.4f}{e:>10.4f}{b / e:>9.3f}{p:>9.3f}")
+    lines.append("-" * 62)
+    return "\n".join(lines)
+
+
+def make_result(method, names, params, se, pvalues, r_squared, n_obs) -> dict:
+    return {
+        "method": method,
+        "params": {n: _finite(v) for n, v in zip(names, params)},
+        "pvalues": {n: _finite(v) for n, v in zip(names, pvalues)},
+        "std_errors": {n: _finite(v) for n, v in zip(names, se)},
+        "r_squared": _finite(r_squared),
+        "n_obs": n_obs,
+        "summary": summary_table(method, names, params, se, pvalues, r_squared, n_obs),
+    }
+
+
+class MomentsCache:
+    """LRU по числу наборов и по их суммарному размеру в байтах."""
+
+    def __init__(self, max_items: int = MOMENTS_CACHE_SIZE, max_bytes: int = MOMENTS_CACHE_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items: "OrderedDict[tuple, PanelMoments]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[PanelMoments]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, moments: PanelMoments):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._items[key] = moments
+            self.nbytes += moments.nbytes
+            while len(self._items) > 1 and (len(self._items) > self.max_items or self.nbytes > self.max_bytes):
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def invalidate(self, version: str):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == version]:
+                self.nbytes -= self._items.pop(key).nbytes
+
+
+cache = MomentsCache()
+
+
+def supports(method: str) -> bool:
+    return method.lower() in ("ols", "fe", "panel")
+
+
+def fit(moments: PanelMoments, method: str, dependent_var: str, base_var: Optional[str] = None,
+        control_vars: Optional[List[str]] = None, exog_vars: Optional[List[str]] = None,
+        render_summary: bool = True, **_) -> dict:
+    """Тот же контракт, что у econometrics.perform_analysis для OLS, FE и PANEL."""
+    m = method.lower()
+    if m == "ols":
+        return moments.ols(dependent_var, [base_var] + list(control_vars or []))
+    if m == "fe":
+        return moments.fe(dependent_var, list(exog_vars or []))
+    if m == "panel":
+        from .panel import fit as fit_panel
+        return fit_panel(moments, dependent_var, list(exog_vars or []), render_summary)
+    raise ValueError(f"Method '{method}' is not supported by sufficient statistics")
@@ -0,0 +1,146 @@
+# app/panel.py
+#
+# Pooled OLS, between, FE (within) и RE (Swamy-Arora) одной спецификации
+# из одного разложения панели, плюс тест Хаусмана FE против RE.
+#
+# Всё считается по моментам complete-case строк: X'X по колонкам
+# [y, 1, x1, ..., xk] и суммы тех же колонок по каждой стране (их даёт
+# moments.PanelMoments). Из них без повторного прохода по данным:
+#   pooled  — сам X'X;
+#   between — средние по странам m_i: sum_i m_i m_i';
+#   within  — X'X - sum_i s_i s_i' / T_i;
+#   RE      — X'X - sum_i (2θ_i - θ_i²) s_i s_i' / T_i (квази-демингование).
+# Оценки и обычные ошибки совпадают с linearmodels PooledOLS, BetweenOLS,
+# PanelOLS(entity_effects=True) и RandomEffects с константой.
+
+import math
+from typing import List
+
+import numpy as np
+
+from .moments import PanelMoments, fe_solution, make_result, t_sf
+
+# уровень значимости теста Хаусмана для выбора основной модели
+HAUSMAN_ALPHA = 0.05
+
+
+def _augment(N, s, S):
+    """Моменты [y, x1..xk] -> моменты [y, 1, x1..xk]."""
+    k = len(s)
+    A = np.empty((k + 1, k + 1))
+    A[0, 0] = S[0, 0]
+    A[0, 2:] = A[2:, 0] = S[0, 1:]
+    A[2:, 2:] = S[1:, 1:]
+    A[1, 1] = N
+    A[0, 1] = A[1, 0] = s[0]
+    A[1, 2:] = A[2:, 1] = s[1:]
+    return A
+
+
+def _solve(Q, y_sum, N, df_resid):
+    """МНК по моментам Q колонок [y, 1, x...]: (beta, cov, rss, tss)."""
+    XtX, Xty, yty = Q[1:, 1:], Q[1:, 0], Q[0, 0]
+    beta = np.linalg.solve(XtX, Xty)
+    rss = yty - beta @ Xty
+    tss = yty - y_sum ** 2 / N
+    cov = rss / df_resid * np.linalg.inv(XtX)
+    return beta, cov, rss, tss
+
+
+def _result(method, names, beta, cov, rss, tss, n_obs, df_resid) -> dict:
+    se = np.sqrt(np.diag(cov))
+    pvalues = 2 * t_sf(np.abs(beta / se), df_resid)
+    return make_result(method, names, beta, se, pvalues, 1 - rss / tss, int(n_obs))
+
+
+def hausman(b_fe, V_fe, b_re, V_re) -> dict:
+    """
+    H = (b_FE - b_RE)' (V_FE - V_RE)^+ (b_FE - b_RE) по коэффициентам
+    регрессоров; число степеней свободы — ранг разности ковариаций.
+    Обе ковариации должны быть посчитаны при одной sigma2_e, иначе
+    разность может не быть положительно полуопределённой.
+    """
+    from scipy import special
+
+    diff = b_fe - b_re
+    V = V_fe - V_re
+    eig = np.linalg.eigvalsh(V)
+    rank = int((eig > 1e-12 * max(abs(eig).max(), 1e-300)).sum())
+    stat = float(diff @ np.linalg.pinv(V) @ diff)
+    pvalue = float(special.chdtrc(rank, max(stat, 0.0))) if rank else None
+    return {
+        "statistic": stat if math.isfinite(stat) else None,
+        "df": rank,
+        "pvalue": pvalue,
+        "preferred": "Fixed Effects" if pvalue is not None and pvalue < HAUSMAN_ALPHA else "Random Effects",
+    }
+
+
+def fit(moments: PanelMoments, dependent_var: str, exog_vars: List[str], render_summary: bool = True) -> dict:
+    """
+    Все четыре оценки и тест Хаусмана. Основной результат (params, pvalues,
+    summary) — модель, которую выбирает тест; остальные — в "models".
+    """
+    exog_vars = list(exog_vars)
+    if not exog_vars:
+        raise ValueError("Panel estimation requires at least one regressor")
+    n_i, s_i, S = moments.entity_sums(dependent_var, exog_vars)
+    k, n = len(exog_vars), len(n_i)
+    N = n_i.sum()
+    if n <= k + 1:
+        raise ValueError(f"Panel estimation needs more than {k + 1} entities, got {n}")
+    if N - k - n <= 0:
+        raise ValueError("Not enough observations for the within estimator")
+    names = ["const"] + exog_vars
+    s = s_i.sum(axis=0)
+
+    # pooled
+    A = _augment(N, s, S)
+    b_pool, V_pool, rss, tss = _solve(A, s[0], N, N - k - 1)
+    pooled = _result("Pooled OLS", names, b_pool, V_pool, rss, tss, N, N - k - 1)
+
+    # between: МНК по средним стран, каждая страна с весом 1
+    m_i = s_i / n_i[:, None]
+    B = _augment(n, m_i.sum(axis=0), m_i.T @ m_i)
+    b_btw, V_btw, ssr_b, tss_b = _solve(B, m_i[:, 0].sum(), n, n - k - 1)
+    between = _result("Between", names, b_btw, V_btw, ssr_b, tss_b, n, n - k - 1)
+
+    # within
+    W = S - np.einsum("ij,ik->jk", s_i / n_i[:, None], s_i)
+    fixed = fe_solution(W, s / N, N, n, exog_vars)
+    Wxx_inv = np.linalg.inv(W[1:, 1:])
+    b_fe = Wxx_inv @ W[1:, 0]
+    sigma2_e = (W[0, 0] - b_fe @ W[1:, 0]) / (N - k - n)
+    V_fe = sigma2_e * Wxx_inv
+
+    # RE: дисперсии компонент по Swamy-Arora, как в linearmodels RandomEffects
+    t_bar = n / (1.0 / n_i).sum()
+    sigma2_u = max(0.0, ssr_b / (n - k - 1) - sigma2_e / t_bar)
+    theta = 1.0 - np.sqrt(sigma2_e / (n_i * sigma2_u + sigma2_e))
+    s_aug = np.insert(s_i, 1, n_i, axis=1)
+    w = (2 * theta - theta ** 2) / n_i
+    Q = A - np.einsum("i,ij,ik->jk", w, s_aug, s_aug)
+    y_sum = ((1 - theta) * s_i[:, 0]).sum()
+    b_re, V_re, rss_re, tss_re = _solve(Q, y_sum, N, N - k - 1)
+    random = _result("Random Effects", names, b_re, V_re, rss_re, tss_re, N, N - k - 1)
+    random["variance_components"] = {
+        "sigma2_e": float(sigma2_e),
+        "sigma2_u": float(sigma2_u),
+        "rho": float(sigma2_u / (sigma2_u + sigma2_e)) if sigma2_u + sigma2_e > 0 else None,
+        "theta_min": float(theta.min()),
+        "theta_max": float(theta.max()),
+    }
+
+    # ковариация RE при той же sigma2_e, что и у FE
+    test = hausman(b_fe, V_fe, b_re[1:], V_re[1:, 1:] * sigma2_e * (N - k - 1) / rss_re)
+    models = {"pooled": pooled, "between": between, "fixed_effects": fixed, "random_effects": random}
+    chosen = fixed if test["preferred"] == "Fixed Effects" else random
+    if not render_summary:
+        models = {name: {**m, "summary": None} for name, m in models.items()}
+        return {**chosen, "summary": None, "models": models, "hausman": test}
+    fmt = lambda v: "n/a" if v is None else f"{v:.4f}"
+    summary = "\n\n".join(m["summary"] for m in models.values()) + (
+        f"\n\nHausman test (FE vs RE): chi2({test['df']}) = {fmt(test['statistic'])}, "
+        f"p = {fmt(test['pvalue'])}; preferred: {test['preferred']}"
+    )
+    return {**chosen, "summary": summary, "models": models, "hausman": test}
@@ -0,0 +1,118 @@
+# app/responses.py
+#
+# Сериализация ответов анализа.
+# JSON — через orjson: результат отдаётся готовыми байтами, без повторной
+# валидации response_model и без json.dumps; NaN/inf становятся null.
+# Arrow IPC (Accept: application/vnd.apache.arrow.stream) — колоночная
+# таблица коэффициентов для больших ответов: сетки спецификаций и rolling
+# окна читаются в pandas/polars/arrow без разбора JSON. Скаляры ответа
+# (method, r_squared, n_obs, ...) кладутся в метаданные схемы как JSON.
+
+from typing import Iterable, List, Optional
+
+import orjson
+import pyarrow as pa
+from fastapi import Request
+from fastapi.responses import Response
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=str, option=_OPTIONS)
+
+
+def ndjson_line(item) -> bytes:
+    return orjson.dumps(item, default=str, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def wants_arrow(request: Request) -> bool:
+    """Accept содержит Arrow IPC (q-веса не учитываются)."""
+    accept = request.headers.get("accept", "")
+    return any(part.split(";")[0].strip() == ARROW_MEDIA_TYPE for part in accept.split(","))
+
+
+def _coefficient_rows(result: dict) -> List[dict]:
+    conf = result.get("conf_int") or {}
+    errors = result.get("std_errors") or {}
+    pvalues = result.get("pvalues") or {}
+    return [
+        {
+            "term": str(term),
+            "estimate": value,
+            "std_error": errors.get(term),
+            "pvalue": pvalues.get(term),
+            "conf_low": (conf.get(term) or [None, None])[0],
+            "conf_high": (conf.get(term) or [None, None])[1],
+        }
+        for term, value in (result.get("params") or {}).items()
+    ]
+
+
+_COEF_TYPES = {
+    "term": "string", "estimate": "float64", "std_error": "float64", "pvalue": "float64",
+    "conf_low": "float64", "conf_high": "float64",
+}
+
+
+def _table(rows: List[dict], types: dict, meta: Optional[dict] = None):
+    schema = pa.schema([(name, pa.type_for_alias(t)) for name, t in types.items()],
+                       metadata={"meta": dumps(meta)} if meta else None)
+    columns = {name: [r.get(name) for r in rows] for name in types}
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def coefficients_table(result: dict):
+    """Одна строка на коэффициент; для PANEL — строки всех моделей с колонкой model."""
+    meta = {k: v for k, v in result.items() if k not in ("params", "pvalues", "std_errors", "conf_int", "models")}
+    models = result.get("models")
+    if not models:
+        return _table(_coefficient_rows(result), _COEF_TYPES, meta)
+    rows = [{"model": name, **row} for name, m in models.items() for row in _coefficient_rows(m)]
+    return _table(rows, {"model": "string", **_COEF_TYPES}, meta)
+
+
+def rolling_table(result: dict):
+    """Одна строка на (окно, коэффициент); окна без оценки — одна строка с error."""
+    rows = []
+    for w in result["windows"]:
+        span = {"start_year": w["start_year"], "end_year": w["end_year"], "r_squared": w.get("r_squared"),
+                "n_obs": w.get("n_obs"), "error": w.get("error")}
+        coefs = _coefficient_rows(w)
+        rows.extend([{**span, **c} for c in coefs] or [span])
+    types = {"start_year": "int64", "end_year": "int64", **_COEF_TYPES, "r_squared": "float64",
+             "n_obs": "int64", "error": "string"}
+    return _table(rows, types, {k: v for k, v in result.items() if k != "windows"})
+
+
+def grid_table(items: Iterable[dict]):
+    """Одна строка на (спецификация, коэффициент); упавшие спецификации — строка с error."""
+    rows = []
+    for item in items:
+        spec, result = item["spec"], item.get("result") or {}
+        head = {
+            "spec_id": spec["id"], "method": spec["method"], "start_year": spec["start_year"],
+            "end_year": spec["end_year"], "controls": ",".join(spec["control_vars"]),
+            "r_squared": result.get("r_squared"), "n_obs": result.get("n_obs"), "error": item.get("error"),
+        }
+        coefs = _coefficient_rows(result)
+        rows.extend([{**head, **c} for c in coefs] or [head])
+    rows.sort(key=lambda r: r["spec_id"])
+    types = {"spec_id": "int64", "method": "string", "start_year": "int64", "end_year": "int64",
+             "controls": "string", **_COEF_TYPES, "r_squared": "float64", "n_obs": "int64", "error": "string"}
+    return _table(rows, types)
+
+
+def arrow_response(table, status_code: int = 200) -> Response:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), status_code=status_code, media_type=ARROW_MEDIA_TYPE)
@@ -0,0 +1,110 @@
+# app/result_cache.py
+#
+# Кэш результатов эконометрических моделей. Ключ — хэш нормализованной
+# спецификации и версии данных (для загруженных датасетов — их id,
+# для данных Всемирного банка — отпечаток содержимого панели).
+# Теги позволяют сбросить все результаты по датасету или индикатору.
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import pandas as pd
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+
+
+def data_version(df: pd.DataFrame) -> str:
+    """Отпечаток содержимого DataFrame: меняется при любом изменении данных."""
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in df.columns], ensure_ascii=False).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return "data:" + h.hexdigest()
+
+
+def _normalize(value):
+    # списки сравниваются как множества (порядок регрессоров и стран не важен);
+    # позиционные параметры передавайте словарём, а не списком
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items()) if v is not None}
+    if isinstance(value, (list, tuple, set)):
+        items = [_normalize(v) for v in value]
+        return sorted(items, key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def make_key(spec: dict, version: str) -> str:
+    spec = dict(spec)
+    if spec.get("method"):
+        spec["method"] = str(spec["method"]).upper()
+    payload = json.dumps({"spec": _normalize(spec), "version": version},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_items: int = RESULT_CACHE_SIZE):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, tuple[dict, frozenset]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return dict(item[0])
+
+    def put(self, key: str, result: dict, tags: Iterable[str] = ()):
+        with self._lock:
+            self._items[key] = (dict(result), frozenset(tags))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, tag: str) -> int:
+        with self._lock:
+            stale = [k for k, (_, tags) in self._items.items() if tag in tags]
+            for k in stale:
+                del self._items[k]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "items": len(self._items),
+            }
+
+
+cache = ResultCache()
+
+
+def dataset_tag(dataset_id) -> str:
+    return f"dataset:{dataset_id}"
+
+
+def blob_tag(digest: str) -> str:
+    # версия данных датасета по содержимому: дубликаты делят кэши результатов
+    return f"blob:{digest}"
+
+
+def indicator_tag(code: str) -> str:
+    return f"indicator:{code}"
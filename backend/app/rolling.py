@@ -0,0 +1,170 @@
+# app/rolling.py
+#
+# Скользящие (rolling) и расширяющиеся (expanding) окна по годам для OLS и FE.
+# Данные один раз сводятся в моменты по годам: для OLS — n, суммы и X'X
+# колонок [y, x1, ..., xk], для FE — ещё и суммы по (стране, году).
+# При сдвиге окна год, который входит, прибавляется, а год, который выходит,
+# вычитается (обновление и даунгрейд X'X блоком строк этого года), так что
+# шаг окна стоит O(k^2) для OLS и O(стран * k^2) для FE вместо переподгонки.
+# Оценки по моментам — те же moments.ols_solution / fe_solution, что и у
+# быстрого пути /run-analysis/, и совпадают с perform_ols/fe_analysis на окне.
+
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .moments import fe_solution, ols_solution
+
+ROLLING_MAX_WINDOWS = int(os.getenv("ROLLING_MAX_WINDOWS", "200"))
+MODES = ("rolling", "expanding")
+
+
+def windows(start_year: int, end_year: int, window: int, step: int = 1, mode: str = "rolling") -> List[tuple]:
+    """[(начало, конец)] окон длиной window лет; у expanding начало фиксировано."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+    if window < 1 or step < 1:
+        raise ValueError("'window' and 'step' must be positive")
+    out = []
+    end = start_year + window - 1
+    while end <= end_year:
+        out.append((end - window + 1 if mode == "rolling" else start_year, end))
+        end += step
+    return out
+
+
+class YearMoments:
+    """Моменты complete-case строк спецификации по годам и по (стране, году)."""
+
+    def __init__(self, df: pd.DataFrame, dependent_var: str, exog_vars: List[str], entity: str, time: str):
+        columns = [dependent_var] + list(exog_vars)
+        data = df[columns + [entity, time]].dropna()
+        Z = data[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+        ok = np.isfinite(Z).all(axis=1)
+        Z, data = Z[ok], data[ok]
+
+        self.exog_vars = list(exog_vars)
+        self.ent_codes, entities = pd.factorize(data[entity])
+        self.n_entities = len(entities)
+        years = data[time].astype("int64").to_numpy()
+        self._rows = {int(t): np.flatnonzero(years == t) for t in np.unique(years)}
+        self._Z = Z
+
+    def year(self, t: int):
+        """(n, s, S, entity_codes, entity_n, entity_s) года t; None, если строк нет."""
+        rows = self._rows.get(t)
+        if rows is None:
+            return None
+        Z = self._Z[rows]
+        codes, inverse = np.unique(self.ent_codes[rows], return_inverse=True)
+        ent_n = np.bincount(inverse, minlength=len(codes)).astype("float64")
+        ent_s = np.zeros((len(codes), Z.shape[1]))
+        np.add.at(ent_s, inverse, Z)
+        return len(rows), Z.sum(axis=0), Z.T @ Z, codes, ent_n, ent_s
+
+
+class _Window:
+    """Текущее окно: общие моменты и суммы по странам, с прибавлением и вычитанием лет."""
+
+    def __init__(self, ym: YearMoments):
+        k = len(ym.exog_vars) + 1
+        self.ym = ym
+        self.N = 0.0
+        self.s = np.zeros(k)
+        self.S = np.zeros((k, k))
+        self.ent_n = np.zeros(ym.n_entities)
+        self.ent_s = np.zeros((ym.n_entities, k))
+        self._cache = {}
+
+    def _year(self, t: int):
+        if t not in self._cache:
+            self._cache[t] = self.ym.year(t)
+        return self._cache[t]
+
+    def add(self, t: int, sign: float = 1.0):
+        m = self._year(t)
+        if m is None:
+            return
+        n, s, S, codes, ent_n, ent_s = m
+        self.N += sign * n
+        self.s += sign * s
+        self.S += sign * S
+        self.ent_n[codes] += sign * ent_n
+        self.ent_s[codes] += sign * ent_s
+        if sign < 0:
+            # год больше не понадобится (окна идут только вперёд)
+            self._cache.pop(t, None)
+
+    def remove(self, t: int):
+        self.add(t, -1.0)
+
+    def ols(self) -> dict:
+        return ols_solution(self.N, self.s, self.S, self.ym.exog_vars)
+
+    def fe(self) -> dict:
+        present = self.ent_n > 0.5
+        n_i, s_i = self.ent_n[present], self.ent_s[present]
+        W = self.S - np.einsum("ij,ik->jk", s_i / n_i[:, None], s_i)
+        return fe_solution(W, self.s / self.N, self.N, int(present.sum()), self.ym.exog_vars)
+
+
+def _entry(start: int, end: int, result: Optional[dict] = None, error: Optional[str] = None) -> dict:
+    entry = {"start_year": start, "end_year": end}
+    if result is None:
+        entry.update(params=None, std_errors=None, pvalues=None, r_squared=None, n_obs=None, error=error)
+    else:
+        entry.update({k: result[k] for k in ("params", "std_errors", "pvalues", "r_squared", "n_obs")})
+    return entry
+
+
+def fit_path(df: pd.DataFrame, method: str, dependent_var: str, exog_vars: List[str], start_year: int,
+             end_year: int, window: int, step: int = 1, mode: str = "rolling", entity: str = "country",
+             time: str = "year") -> dict:
+    """
+    Траектория коэффициентов по окнам. Окно, в котором модель не оценивается
+    (мало наблюдений, вырожденная матрица), возвращается с params=None и error.
+    """
+    m = method.lower()
+    if m not in ("ols", "fe"):
+        raise ValueError(f"Method '{method}' is not supported in rolling mode, expected OLS or FE")
+    if not exog_vars:
+        raise ValueError("Rolling estimation requires at least one regressor")
+    spans = windows(start_year, end_year, window, step, mode)
+    if not spans:
+        raise ValueError(f"Window of {window} years does not fit into {start_year}-{end_year}")
+    if len(spans) > ROLLING_MAX_WINDOWS:
+        raise ValueError(f"Too many windows: {len(spans)} > {ROLLING_MAX_WINDOWS}")
+
+    ym = YearMoments(df, dependent_var, exog_vars, entity, time)
+    current = _Window(ym)
+    k = len(exog_vars) + 1
+    lo, hi = spans[0][0], spans[0][0] - 1  # пустое окно
+    path = []
+    for start, end in spans:
+        for t in range(hi + 1, end + 1):
+            current.add(t)
+        for t in range(lo, start):
+            current.remove(t)
+        lo, hi = start, end
+
+        n_entities = int((current.ent_n > 0.5).sum())
+        dof = current.N - k - (n_entities - 1 if m == "fe" else 0)
+        if dof <= 0:
+            path.append(_entry(start, end, error="Not enough observations"))
+            continue
+        try:
+            result = current.ols() if m == "ols" else current.fe()
+        except np.linalg.LinAlgError:
+            path.append(_entry(start, end, error="Singular design matrix"))
+            continue
+        path.append(_entry(start, end, result))
+
+    return {
+        "method": "OLS" if m == "ols" else "Fixed Effects",
+        "mode": mode,
+        "window": window,
+        "step": step,
+        "windows": path,
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -13,6 +13,9 @@ class Token(BaseModel):
 class DatasetResponse(BaseModel):
     dataset_id: str
     status: str
+    row_count: Optional[int] = None
+    # тот же файл уже был загружен: разбор пропущен, содержимое общее
+    deduplicated: bool = False
 
 class StudyCreate(BaseModel):
     country_list: List[str]
@@ -32,6 +35,31 @@ class MethodEnum(str, Enum):
     TSLS = "2SLS"
     FE   = "FE"
     RE   = "RE"
+    # pooled, between, FE и RE за одну оценку плюс тест Хаусмана
+    PANEL = "PANEL"
+
+class CovTypeEnum(str, Enum):
+    UNADJUSTED = "unadjusted"
+    CLUSTERED  = "clustered"
+    BOOTSTRAP  = "bootstrap"
+
+class BootstrapEnum(str, Enum):
+    PAIRS = "pairs"
+    WILD  = "wild"
+    BLOCK = "block"
+
+class TransformOpEnum(str, Enum):
+    LOG = "log"
+    LAG = "lag"
+    DIFF = "diff"
+    GROWTH = "growth"
+
+class TransformSpec(BaseModel):
+    op: TransformOpEnum
+    column: str
+    periods: int = 1
+    # имя производной колонки; по умолчанию log(x), lag2(x), diff(x), growth(x)
+    name: Optional[str] = None
 
 # Тело запроса на анализ
 class RunAnalysisRequest(BaseModel):
@@ -54,10 +82,96 @@ class RunAnalysisRequest(BaseModel):
     start_year: int
     end_year: int
 
+    # Анализ по загруженному датасету вместо данных Всемирного банка;
+    # метрики — это имена колонок датасета
+    uploaded_dataset_id: Optional[str] = None
+    # Быстрый предпросмотр на ограниченном числе строк
+    preview: bool = False
+
+    # Стандартные ошибки (OLS/FE/RE): обычные, кластеризованные по entity или бутстреп;
+    # bootstrap_reps — максимум репликаций, счёт останавливается раньше, когда интервалы сошлись
+    cov_type: CovTypeEnum = CovTypeEnum.UNADJUSTED
+    bootstrap: BootstrapEnum = BootstrapEnum.BLOCK
+    bootstrap_reps: int = 999
+    seed: int = 0
+
+    # Производные колонки по каждой стране (имена можно использовать как метрики)
+    # и усреднение всей панели по непересекающимся периодам в period_mean лет
+    transforms: Optional[List[TransformSpec]] = None
+    period_mean: Optional[int] = None
+
+    # Текстовая таблица summary рендерится дорого — только по запросу
+    include_summary: bool = False
+
 # Ответ от анализа
 class RunAnalysisResponse(BaseModel):
-    method: MethodEnum
+    method: str
     params: dict
     pvalues: dict
     r_squared: Optional[float]
-    summary: str
+    # только при include_summary=true
+    summary: Optional[str] = None
+    n_obs: Optional[int] = None
+    preview: bool = False
+    # при cov_type != unadjusted: робастные ошибки, 95% интервалы и параметры оценки
+    std_errors: Optional[dict] = None
+    conf_int: Optional[dict] = None
+    inference: Optional[dict] = None
+    # method=PANEL: все четыре оценки и тест Хаусмана (основной результат — выбранная тестом модель)
+    models: Optional[dict] = None
+    hausman: Optional[dict] = None
+    # ?profile=true: время стадий и вывод cProfile
+    profile: Optional[dict] = None
+
+# Скользящие/расширяющиеся окна: данные загружаются один раз за весь период
+# [start_year, end_year], оценки — по окнам длиной window лет с шагом step
+class RollingModeEnum(str, Enum):
+    ROLLING   = "rolling"
+    EXPANDING = "expanding"
+
+class RollingAnalysisRequest(RunAnalysisRequest):
+    window: int
+    step: int = 1
+    mode: RollingModeEnum = RollingModeEnum.ROLLING
+
+class RollingWindowResult(BaseModel):
+    start_year: int
+    end_year: int
+    params: Optional[dict] = None
+    std_errors: Optional[dict] = None
+    pvalues: Optional[dict] = None
+    r_squared: Optional[float] = None
+    n_obs: Optional[int] = None
+    error: Optional[str] = None
+
+class RollingAnalysisResponse(BaseModel):
+    method: str
+    mode: str
+    window: int
+    step: int
+    windows: List[RollingWindowResult]
+
+# Фоновые задачи анализа
+class AnalysisJobResponse(BaseModel):
+    job_id: str
+    status: str
+
+class AnalysisJobStatus(AnalysisJobResponse):
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+
+# Сетка спецификаций: methods × control_sets × year_windows
+class SpecGridRequest(BaseModel):
+    countries: List[str]
+    dependent_metric: str
+    base_metric: str
+    methods: List[MethodEnum] = [MethodEnum.OLS]
+    control_sets: List[List[str]] = [[]]
+    instrument_metrics: Optional[List[str]] = None
+    # по умолчанию одно окно (start_year, end_year)
+    year_windows: Optional[List[Tuple[int, int]]] = None
+    include_summary: bool = False
+
+    start_year: int
+    end_year: int
@@ -0,0 +1,209 @@
+# app/spec_grid.py
+#
+# Сетка спецификаций: данные загружаются и выравниваются один раз,
+# из панели (индекс entity/time, float64-колонки) для каждой спецификации
+# заранее вырезается её матрица — строки окна лет и только её колонки без
+# пропусков. В процесс пула уходит эта матрица, а не вся панель.
+#
+# Пул процессов один на процесс сервера и живёт между запросами (воркеры
+# не импортируют pandas/statsmodels заново на каждую сетку). Сверх
+# GRID_QUEUE_LIMIT спецификаций в работе новая сетка получает Overloaded.
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional
+
+import pandas as pd
+
+from . import lifecycle
+
+GRID_WORKERS = int(os.getenv("GRID_WORKERS", str(os.cpu_count() or 2)))
+GRID_MAX_SPECS = int(os.getenv("GRID_MAX_SPECS", "200"))
+# Маленькие сетки считаем в потоке: запуск процессов дороже самих подгонок
+GRID_INLINE_MAX = int(os.getenv("GRID_INLINE_MAX", "4"))
+# Спецификаций в пуле одновременно, по всем запросам
+GRID_QUEUE_LIMIT = int(os.getenv("GRID_QUEUE_LIMIT", str(2 * GRID_MAX_SPECS)))
+
+
+class Overloaded(RuntimeError):
+    pass
+
+
+def build_panel(df: pd.DataFrame, entity: str, time: str) -> pd.DataFrame:
+    panel = df.set_index([entity, time]).sort_index()
+    return panel.apply(pd.to_numeric, errors="coerce").astype("float64")
+
+
+def expand_specs(
+    methods: List[str],
+    control_sets: List[List[str]],
+    year_windows: List[tuple],
+    dependent_var: str,
+    base_var: str,
+    instrument_vars: Optional[List[str]] = None,
+    render_summary: bool = True,
+) -> List[dict]:
+    specs = []
+    for i, (method, controls, (start, end)) in enumerate(
+        itertools.product(methods, control_sets, year_windows)
+    ):
+        specs.append({
+            "id": i,
+            "method": method,
+            "dependent_var": dependent_var,
+            "base_var": base_var,
+            "control_vars": list(controls),
+            "instrument_vars": list(instrument_vars or []),
+            "start_year": int(start),
+            "end_year": int(end),
+            "render_summary": render_summary,
+        })
+    return specs
+
+
+def design(panel: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    """Строки окна лет спецификации и её колонки, complete-case."""
+    years = panel.index.get_level_values(1)
+    columns = [spec["dependent_var"], spec["base_var"]] + spec["control_vars"]
+    if spec["method"].lower() == "2sls":
+        columns += spec["instrument_vars"]
+    rows = panel[(years >= spec["start_year"]) & (years <= spec["end_year"])]
+    return rows[columns].dropna()
+
+
+def fit_design(data: pd.DataFrame, spec: dict) -> dict:
+    # statsmodels/linearmodels грузятся при первой подгонке, а не при импорте
+    econometrics = lifecycle.load_econometrics()
+
+    y, base, controls = spec["dependent_var"], spec["base_var"], spec["control_vars"]
+    exog = [base] + controls
+    method = spec["method"].lower()
+    render = dict(render_summary=spec.get("render_summary", True))
+    if method == "ols":
+        return econometrics.perform_ols_analysis(data, y, base, controls, **render)
+    if method == "2sls":
+        return econometrics.perform_2sls_analysis(data, y, base, controls, spec["instrument_vars"], **render)
+    if method == "fe":
+        return econometrics.fit_fe(data, y, exog, **render)
+    if method == "re":
+        return econometrics.fit_re(data, y, exog, **render)
+    if method == "panel":
+        return econometrics.fit_panel(data, y, exog, **render)
+    raise ValueError(f"Unknown method '{spec['method']}'")
+
+
+def fit_spec(panel: pd.DataFrame, spec: dict) -> dict:
+    return fit_design(design(panel, spec), spec)
+
+
+def _error(spec: dict, e: Exception) -> dict:
+    return {"spec": spec, "error": f"{type(e).__name__}: {e}"}
+
+
+def _safe_fit(data: pd.DataFrame, spec: dict) -> dict:
+    try:
+        return {"spec": spec, "result": fit_design(data, spec)}
+    except Exception as e:
+        return _error(spec, e)
+
+
+def prepare(panel: pd.DataFrame, specs: List[dict]) -> List[tuple]:
+    """[(spec, матрица или None, ошибка или None)] — в потоке, до отправки в пул."""
+    out = []
+    for spec in specs:
+        try:
+            out.append((spec, design(panel, spec), None))
+        except Exception as e:
+            out.append((spec, None, _error(spec, e)))
+    return out
+
+
+class GridPool:
+    """
+    Общий пул процессов для сеток спецификаций. Число воркеров ограничено
+    GRID_WORKERS на весь процесс; спецификаций в работе — queue_limit,
+    сверх него submit бросает Overloaded, а не копит очередь.
+    """
+
+    def __init__(self, workers: int = GRID_WORKERS, queue_limit: int = GRID_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: форк процесса с живыми потоками uvicorn небезопасен
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _release(self, _):
+        self.in_flight -= 1
+
+    def submit(self, prepared: List[tuple]) -> List[asyncio.Future]:
+        # счётчик меняется только в event loop (done-колбэки asyncio-futures), блокировка не нужна
+        jobs = [(spec, data) for spec, data, error in prepared if error is None]
+        if self.in_flight + len(jobs) > self.queue_limit:
+            self.rejected += 1
+            raise Overloaded(f"Specification grid queue is full ({self.queue_limit} specifications)")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for spec, data in jobs:
+            future = asyncio.wrap_future(self.pool.submit(_safe_fit, data, spec), loop=loop)
+            self.in_flight += 1
+            # освобождается и при отмене, и если результат никто не дождался
+            future.add_done_callback(self._release)
+            futures.append(future)
+        return futures
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "in_flight": self.in_flight,
+                "queue_limit": self.queue_limit, "rejected": self.rejected}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+grid_pool = GridPool()
+
+
+async def run_grid(panel: pd.DataFrame, specs: List[dict]) -> AsyncIterator[dict]:
+    """
+    Готовит матрицы и ставит спецификации в пул; Overloaded — сразу, до
+    первого результата. Итератор отдаёт результаты по мере готовности.
+    """
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(None, prepare, panel, specs)
+    failed = [error for _, _, error in prepared if error is not None]
+
+    if grid_pool.workers <= 1 or len(specs) <= GRID_INLINE_MAX:
+        async def inline():
+            for item in failed:
+                yield item
+            for spec, data, error in prepared:
+                if error is None:
+                    yield await loop.run_in_executor(None, _safe_fit, data, spec)
+        return inline()
+
+    futures = grid_pool.submit(prepared)
+
+    async def completed():
+        try:
+            for item in failed:
+                yield item
+            for done in asyncio.as_completed(futures):
+                yield await done
+        finally:
+            for future in futures:
+                future.cancel()
+    return completed()
@@ -0,0 +1,218 @@
+# app/studies.py
+#
+# История исследований и рейтинг популярных спецификаций.
+# Метаданные результата лежат в узкой study_results, summary и таблицы
+# коэффициентов — в study_result_details и читаются только по запросу.
+# Спецификация (метод, зависимая, базовая и контрольные метрики)
+# нормализуется в отпечаток; счётчики по отпечатку и по дням обновляются
+# upsert'ом при каждой записи, так что рейтинг — это top_n строк по индексу.
+
+import base64
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import case, func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+WINDOWS = {"day": 1, "week": 7, "month": 30}
+PAGE_MAX = 100
+
+
+def spec_of(method: str, dependent_metric: str, base_metric: Optional[str],
+            control_metrics: Optional[List[str]]) -> dict:
+    return {
+        "method": str(method).upper(),
+        "dependent_metric": dependent_metric,
+        "base_metric": base_metric,
+        "control_metrics": sorted(control_metrics or []),
+    }
+
+
+def fingerprint(spec: dict) -> str:
+    payload = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _insert(db: Session, table):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upsert is not implemented for {dialect}")
+
+
+def _bump(db: Session, spec: dict, fp: str, when: datetime, n: int = 1):
+    pop = models.StudyPopularity.__table__
+    stmt = _insert(db, pop).values(fingerprint=fp, count=n, last_seen=when, **spec)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[pop.c.fingerprint],
+        set_={
+            "count": pop.c.count + n,
+            "last_seen": case((stmt.excluded.last_seen > pop.c.last_seen, stmt.excluded.last_seen),
+                              else_=pop.c.last_seen),
+        },
+    ))
+
+    daily = models.StudyPopularityDaily.__table__
+    stmt = _insert(db, daily).values(fingerprint=fp, day=when.date(), count=n)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[daily.c.fingerprint, daily.c.day],
+        set_={"count": daily.c.count + n},
+    ))
+
+
+def record_study(db: Session, study: models.StudyResult):
+    """Добавляет результат в историю и обновляет счётчики в той же транзакции."""
+    spec = spec_of(study.method, study.dependent_metric, study.base_metric, study.metrics)
+    study.fingerprint = fingerprint(spec)
+    study.created_at = study.created_at or datetime.utcnow()
+    db.add(study)
+    db.flush()
+    _bump(db, spec, study.fingerprint, study.created_at)
+
+
+def save_result(db: Session, user_id, method: str, dependent_metric: str, base_metric: Optional[str],
+                control_metrics: Optional[List[str]], countries: List[str], start_year: Optional[int],
+                end_year: Optional[int], result: dict) -> models.StudyResult:
+    """Метаданные — в study_results, summary и таблицы коэффициентов — отдельной строкой."""
+    study = models.StudyResult(
+        user_id=user_id,
+        method=method,
+        dependent_metric=dependent_metric,
+        base_metric=base_metric,
+        metrics=list(control_metrics or []),
+        countries=list(countries or []),
+        start_year=start_year,
+        end_year=end_year,
+        r_squared=result.get("r_squared"),
+        n_obs=result.get("n_obs"),
+    )
+    record_study(db, study)
+    db.add(models.StudyResultDetail(
+        study_id=study.id,
+        summary=result.get("summary"),
+        params=result.get("params"),
+        pvalues=result.get("pvalues"),
+    ))
+    return study
+
+
+def encode_cursor(created_at: datetime, study_id) -> str:
+    raw = f"{created_at.isoformat()}|{study_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    created_at, study_id = raw.split("|", 1)
+    return datetime.fromisoformat(created_at), uuid.UUID(study_id)
+
+
+def list_studies(db: Session, user_id, limit: int = 20, cursor: Optional[str] = None,
+                 include_summary: bool = False) -> dict:
+    """
+    Страница истории пользователя, новые сначала. Keyset-пагинация по
+    (created_at, id) идёт по индексу ix_study_results_user_created —
+    стоимость страницы не зависит от её номера. cursor — из next_cursor
+    предыдущей страницы; ValueError, если он испорчен.
+    """
+    R = models.StudyResult
+    limit = max(1, min(limit, PAGE_MAX))
+    query = db.query(R).filter(R.user_id == user_id)
+    if cursor:
+        try:
+            created_at, study_id = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+        query = query.filter(tuple_(R.created_at, R.id) < tuple_(created_at, study_id))
+    rows = query.order_by(R.created_at.desc(), R.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    details = {}
+    if include_summary and rows:
+        D = models.StudyResultDetail
+        details = {d.study_id: d for d in db.query(D).filter(D.study_id.in_([r.id for r in rows]))}
+
+    items = []
+    for r in rows:
+        item = {
+            "id": str(r.id),
+            "method": r.method,
+            "dependent_metric": r.dependent_metric,
+            "base_metric": r.base_metric,
+            "start_year": r.start_year,
+            "end_year": r.end_year,
+            "countries": r.countries,
+            "metrics": r.metrics,
+            "r_squared": r.r_squared,
+            "n_obs": r.n_obs,
+            "created_at": r.created_at.isoformat(),
+        }
+        if include_summary:
+            d = details.get(r.id)
+            item.update(summary=d and d.summary, params=d and d.params, pvalues=d and d.pvalues)
+        items.append(item)
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def rebuild_popularity(db: Session):
+    """Пересчёт счётчиков из истории одним GROUP BY (после миграции или сбоя)."""
+    db.query(models.StudyPopularityDaily).delete()
+    db.query(models.StudyPopularity).delete()
+    R = models.StudyResult
+    day = func.date(R.created_at)
+    rows = (
+        db.query(R.fingerprint, day, func.count(), func.max(R.created_at))
+        .group_by(R.fingerprint, day)
+        .all()
+    )
+    specs = {}
+    for fp, _, n, last in rows:
+        if fp not in specs:
+            sample = db.query(R).filter(R.fingerprint == fp).first()
+            specs[fp] = spec_of(sample.method, sample.dependent_metric, sample.base_metric, sample.metrics)
+        _bump(db, specs[fp], fp, last, n)
+
+
+def popular(db: Session, top_n: int = 10, window: Optional[str] = None) -> List[dict]:
+    P = models.StudyPopularity
+    fields = (P.method, P.dependent_metric, P.base_metric, P.control_metrics)
+    if window is None:
+        rows = db.query(*fields, P.count).order_by(P.count.desc(), P.fingerprint).limit(top_n).all()
+    else:
+        D = models.StudyPopularityDaily
+        since = datetime.utcnow().date() - timedelta(days=WINDOWS[window] - 1)
+        total = func.sum(D.count).label("total")
+        top = (
+            db.query(D.fingerprint, total)
+            .filter(D.day >= since)
+            .group_by(D.fingerprint)
+            .order_by(total.desc(), D.fingerprint)
+            .limit(top_n)
+            .subquery()
+        )
+        rows = (
+            db.query(*fields, top.c.total)
+            .join(top, top.c.fingerprint == P.fingerprint)
+            .order_by(top.c.total.desc(), P.fingerprint)
+            .all()
+        )
+    return [
+        {
+            "method": method,
+            "dependent_metric": dependent_metric,
+            "base_metric": base_metric,
+            "control_metrics": control_metrics,
+            "count": int(count),
+        }
+        for method, dependent_metric, base_metric, control_metrics, count in rows
+    ]
@@ -0,0 +1,111 @@
+import os
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture
+def env(monkeypatch):
+    # app.database и app.auth читают настройки при импорте; подставляем только на время теста
+    for name, value in (("DATABASE_URL", "sqlite://"), ("SECRET_KEY", "test-secret"), ("ALGORITHM", "HS256")):
+        if name not in os.environ:
+            monkeypatch.setenv(name, value)
+
+
+@pytest.fixture
+def auth(env):
+    from app import auth
+    return auth
+
+
+@pytest.fixture
+def deps(env):
+    from app import deps
+    return deps
+
+
+@pytest.fixture
+def models(env):
+    from app import models
+    return models
+
+
+@pytest.fixture
+def session_factory(monkeypatch, auth, deps, models):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(deps, "SessionLocal", factory)
+    monkeypatch.setattr(auth, "principal_cache", auth.PrincipalCache(max_items=10, ttl=60))
+    return factory
+
+
+def test_principal_cache_hits_and_invalidation(session_factory, auth, deps, models):
+    db = session_factory()
+    db.add(models.User(email="a@example.com", hashed_password="x"))
+    db.commit()
+    token = auth.create_access_token({"sub": "a@example.com"})
+
+    first = deps.resolve_token(token)
+    # второй запрос обслуживается из кэша — даже если пользователя уже не найти в БД
+    session_factory().query(models.User).delete()
+    assert deps.resolve_token(token) == first
+    assert auth.principal_cache.stats()["hits"] == 1
+
+    db = session_factory()
+    db.add(models.User(email="b@example.com", hashed_password="x"))
+    db.commit()
+    token = auth.create_access_token({"sub": "b@example.com"})
+    deps.resolve_token(token)
+    user = db.query(models.User).filter_by(email="b@example.com").one()
+    user.email = "c@example.com"
+    db.commit()
+    with pytest.raises(HTTPException):
+        deps.resolve_token(token)
+
+
+def test_principal_cache_respects_token_expiry(auth):
+    cache = auth.PrincipalCache(ttl=60)
+    principal = auth.Principal(None, "a@example.com", None)
+    cache.put("h.p.sig1", principal, expires_at=time.time() - 1)
+    cache.put("h.p.sig2", principal, expires_at=time.time() + 30)
+    assert cache.get("h.p.sig1") is None
+    assert cache.get("h.p.sig2") == principal
+    # запись — по всему токену: другой заголовок/payload с той же подписью не совпадает
+    assert cache.get("other.p.sig2") is None
+    assert cache.invalidate_user("a@example.com") == 1
+
+
+def test_invalid_token_is_rejected(session_factory, auth, deps):
+    expired = auth.create_access_token({"sub": "a@example.com"}, expires_delta=timedelta(minutes=-1))
+    with pytest.raises(HTTPException):
+        deps.resolve_token(expired)
+    assert deps.get_optional_user("garbage") is None
+
+
+def test_login_rehashes_outdated_cost_and_pool_sheds_load(auth):
+    import asyncio
+    from passlib.hash import bcrypt
+
+    old = bcrypt.using(rounds=4).hash("secret")
+    pool = auth.HashPool(workers=1, queue_limit=1)
+
+    async def scenario():
+        ok, new_hash = await pool.run(auth.verify_and_update, "secret", old)
+        assert ok and new_hash and bcrypt.from_string(new_hash).rounds == auth.BCRYPT_ROUNDS
+        assert await pool.run(auth.verify_and_update, "secret", new_hash) == (True, None)
+        assert (await pool.run(auth.verify_and_update, "wrong", new_hash))[0] is False
+
+        pool.queue_limit = 0
+        with pytest.raises(auth.Overloaded):
+            await pool.run(auth.get_password_hash, "x")
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert pool.stats()["rejected"] == 1
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import catalog, wb_stub
+
+
+@pytest.fixture
+def snapshot():
+    with TestClient(wb_stub.app) as client:
+        indicators = [catalog.indicator_record(r) for r in catalog.fetch_all(client, "/v2/indicator", per_page=500)]
+        countries = [catalog.country_record(r) for r in catalog.fetch_all(client, "/v2/country")]
+    return indicators, countries
+
+
+def test_seed_catalogue_resolves_metric_map(tmp_path):
+    cat = catalog.Catalog(str(tmp_path))
+    found, unknown = cat.resolve(["Инфляция (%)", "ny.gdp.pcap.kd.zg", "NO.SUCH.CODE"])
+    assert found == {"FP.CPI.TOTL.ZG": "Инфляция (%)", "NY.GDP.PCAP.KD.ZG": "ny.gdp.pcap.kd.zg"}
+    assert unknown == ["NO.SUCH.CODE"]
+    # псевдоним и его код вместе — одна колонка на два имени
+    with pytest.raises(ValueError, match="FP.CPI.TOTL.ZG"):
+        cat.resolve(["Инфляция (%)", "fp.cpi.totl.zg"])
+    assert cat.country("us")["id"] == "USA"
+
+
+def test_build_search_and_incremental_refresh(tmp_path, snapshot):
+    indicators, countries = snapshot
+    cat = catalog.Catalog(str(tmp_path))
+    report = cat.update(indicators, countries)
+    assert report["indicators"]["total"] == len(indicators)
+
+    # код по префиксу, название — по префиксам всех слов
+    assert [r["id"] for r in cat.search_indicators("ny.gdp")] == ["NY.GDP.PCAP.KD.ZG"]
+    hits = cat.search_indicators("dom cred priv", limit=5)
+    assert len(hits) == 5 and all("Domestic credit to private sector" in r["name"] for r in hits)
+    assert cat.search_indicators("SYN.00.42")[0]["id"] == "SYN.00.42"
+    assert cat.search_indicators("nothing like this") == []
+    assert [c["id"] for c in cat.search_countries("world", include_aggregates=False)] == []
+    assert cat.resolve(["syn.01.07"])[0] == {"SYN.01.07": "syn.01.07"}
+
+    # повторная загрузка того же списка ничего не переписывает
+    changed = dict(indicators[5], name="Renamed series")
+    report = cat.update(indicators[:100] + [changed] + [dict(indicators[0], id="NEW.CODE")])
+    assert report["indicators"] == {"added": 1, "updated": 1, "unchanged": 99, "total": len(indicators) + 1}
+
+    reopened = catalog.Catalog(str(tmp_path))
+    assert reopened.indicator(changed["id"])["name"] == "Renamed series"
+    assert reopened.indicator("new.code") is not None
+    assert len(reopened.countries) == len(countries)
+
+
+def test_short_prefix_topk_matches_full_ranking(monkeypatch):
+    ids = [f"C{i}" for i in range(300)]
+    texts = [f"{'gdp' if i % 3 else 'gross'} growth series {i}" for i in range(300)]
+    index = catalog.SearchIndex(ids, texts)
+    assert "g" in index._topk and "gd" in index._topk
+    for q in ("g", "gd", "gdp", "s"):
+        expected = index.search(q, 50)
+        monkeypatch.setattr(index, "_topk", {})
+        assert index.search(q, 50) == expected
+        monkeypatch.undo()
+
+
+def test_reload_runs_in_background(tmp_path, monkeypatch, snapshot):
+    indicators, countries = snapshot
+    cat = catalog.Catalog(str(tmp_path))
+    other = catalog.Catalog(str(tmp_path))
+    other.update(indicators, countries)
+
+    code = next(r["id"] for r in indicators if r["id"].startswith("SYN."))
+    assert cat.indicator(code) is None
+
+    # вызов только запускает чтение; до подмены снимка ответы идут по старой версии
+    monkeypatch.setattr(catalog, "CATALOG_RELOAD_INTERVAL", 0)
+    cat.maybe_reload()
+    deadline = time.monotonic() + 10
+    while cat._reloading and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cat._loaded_mtime == other._loaded_mtime
+    assert cat.indicator(code)["id"] == code
@@ -0,0 +1,124 @@
+import hashlib
+import io
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import dataset_store, ingest
+
+
+@pytest.fixture
+def models(monkeypatch):
+    # app.database читает DATABASE_URL при импорте; подставляем только на время теста
+    if "DATABASE_URL" not in os.environ:
+        monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    from app import models
+    return models
+
+
+def _csv(lines):
+    return "\n".join(lines).encode()
+
+
+def test_chunked_ingest_widens_types_across_chunks():
+    lines = ["country,year,gdp,empty,note"]
+    lines += [f"c{i % 3},{2000 + i},{i},," for i in range(25)]
+    lines += ["c1,2030,2.5,abc,", "c1,2031,nan,5, NaN"]
+    data = _csv(lines)
+
+    res = ingest.ingest(io.BytesIO(data), "x.csv", upload_id="t1", total_bytes=len(data), chunk_rows=10)
+    assert (res.row_count, res.chunks) == (27, 3)
+    types = {c["name"]: c["dtype"] for c in res.columns}
+    assert types["year"] == "int64" and types["gdp"] == "double" and types["empty"] == "large_string"
+
+    df = dataset_store.read_parquet(res.content)
+    assert len(df) == 27
+    assert df["gdp"].iloc[-2] == 2.5 and pd.isna(df["gdp"].iloc[-1])
+    assert df["note"].isna().all()
+    assert pq.ParquetFile(io.BytesIO(res.content)).num_row_groups == 3
+
+    progress = ingest.get_progress("t1")
+    assert progress["status"] == "parsed" and progress["rows"] == 27 and progress["bytes_read"] == len(data)
+
+
+def test_excel_ingest_matches_csv():
+    expected = pd.DataFrame({"country": ["a", "b", "c"] * 5, "year": range(2000, 2015), "x": [0.5] * 15})
+    buf = io.BytesIO()
+    expected.to_excel(buf, index=False)
+    buf.seek(0)
+    res = ingest.ingest(buf, "x.xlsx", chunk_rows=4)
+    got = dataset_store.read_parquet(res.content, columns=["year", "x"])
+    assert list(got.columns) == ["year", "x"]
+    assert got["year"].tolist() == list(range(2000, 2015))
+
+
+def test_empty_file_is_rejected():
+    with pytest.raises(ingest.IngestError):
+        ingest.ingest(io.BytesIO(b""), "empty.csv")
+
+
+def test_stored_size_limit_is_enforced(monkeypatch):
+    lines = ["country,year,x"] + [f"c{i % 7},{1900 + i},{i * 0.37}" for i in range(2000)]
+    monkeypatch.setattr(ingest, "INGEST_MAX_STORED_BYTES", 1024)
+    with pytest.raises(ingest.IngestError, match="storage limit"):
+        ingest.ingest(io.BytesIO(_csv(lines)), "big.csv", chunk_rows=500)
+
+
+class _Dataset:
+    def __init__(self, res):
+        self.content = res.content
+        self.columns = res.columns
+        self.data = None
+
+
+def test_load_for_analysis_projects_columns_and_rows():
+    lines = ["country,year,y,x,junk"]
+    lines += [f"C{i},{t},{i + t},{t},zz" for i in range(5) for t in range(1990, 2010)]
+    ds = _Dataset(ingest.ingest(io.BytesIO(_csv(lines)), "p.csv", chunk_rows=30))
+
+    df = dataset_store.load_for_analysis(ds, ["x", "y"], entity="country", time="year",
+                                         countries=["c1", "C3 "], start_year=2000, end_year=2004)
+    assert set(df.columns) == {"x", "y", "country", "year"}
+    assert sorted(df["country"].unique()) == ["C1", "C3"]
+    assert df["year"].between(2000, 2004).all() and len(df) == 10
+
+    preview = dataset_store.load_for_analysis(ds, ["x", "y"], entity="country", time="year", max_rows=7)
+    assert len(preview) == 7
+
+
+def test_duplicate_uploads_share_one_blob(models):
+    lines = ["country,year,y"] + [f"C{i},{2000 + i},{i}" for i in range(10)]
+    data = _csv(lines)
+    upload = io.BytesIO(data)
+    upload.read(3)
+    digest = ingest.content_hash(upload, parser=ingest.parser_for("p.csv"))
+    assert digest == hashlib.sha256(b"csv\0" + data).hexdigest() and upload.tell() == 0
+    # те же байты под другим расширением разбираются иначе — это другой blob
+    assert ingest.content_hash(upload, parser=ingest.parser_for("p.XLS")) != digest
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    res = ingest.ingest(upload, "p.csv")
+    db.add(models.User(email="a@example.com", hashed_password="x"))
+    db.add(models.DatasetBlob(hash=digest, content=res.content, content_format=dataset_store.PARQUET,
+                              columns=res.columns, row_count=res.row_count))
+    db.flush()
+    user = db.query(models.User).one()
+    for name in ("first.csv", "copy.csv"):
+        db.add(models.UploadedDataset(user_id=user.id, file_name=name, blob_hash=digest,
+                                      columns=res.columns, row_count=res.row_count))
+    db.commit()
+    db.expunge_all()
+
+    datasets = db.query(models.UploadedDataset).all()
+    assert db.query(models.DatasetBlob).count() == 1
+    frames = [dataset_store.load_for_analysis(d, ["y"], entity="country", time="year", start_year=2005)
+              for d in datasets]
+    assert all(d.content is None for d in datasets)
+    pd.testing.assert_frame_equal(frames[0], frames[1])
+    assert frames[0]["y"].tolist() == [5, 6, 7, 8, 9]
@@ -0,0 +1,248 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import econometrics, spec_grid
+
+
+def make_panel(n_entities=12, n_years=15, seed=0, missing=0.05):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_entities):
+        alpha = rng.normal(scale=2.0)
+        for t in range(2000, 2000 + n_years):
+            x1, x2, z = rng.normal(size=3)
+            rows.append({
+                "country": f"c{i:02d}",
+                "year": t,
+                "x1": x1 + 0.5 * z,
+                "x2": x2 + 0.3 * alpha,
+                "z": z,
+                "y": 1.0 + 2.0 * x1 - 0.5 * x2 + alpha + rng.normal(),
+            })
+    df = pd.DataFrame(rows)
+    mask = rng.random(df[["x1", "x2", "y"]].shape) < missing
+    df[["x1", "x2", "y"]] = df[["x1", "x2", "y"]].mask(mask)
+    return df
+
+
+def test_grid_spec_matches_single_fit():
+    df = make_panel()
+    panel = spec_grid.build_panel(df, "country", "year")
+    specs = spec_grid.expand_specs(["OLS", "FE"], [[], ["x2"]], [(2000, 2009), (2003, 2014)], "y", "x1")
+    assert len(specs) == 8
+
+    for spec in specs:
+        window = df[(df.year >= spec["start_year"]) & (df.year <= spec["end_year"])]
+        exog = ["x1"] + spec["control_vars"]
+        if spec["method"] == "OLS":
+            expected = econometrics.perform_ols_analysis(window.dropna(subset=["y"] + exog), "y", "x1", spec["control_vars"])
+        else:
+            expected = econometrics.perform_fe_analysis(window.dropna(subset=["y"] + exog), "y", exog, "country", "year")
+        got = spec_grid.fit_spec(panel, spec)
+        for k, v in expected["params"].items():
+            assert got["params"][k] == pytest.approx(v)
+
+
+@pytest.mark.parametrize("exog", [["x1"], ["x1", "x2"], ["x1", "x2", "z"]])
+def test_sufficient_statistics_match_fits(exog):
+    from app import moments
+
+    df = make_panel(missing=0.1)
+    pm = moments.PanelMoments.from_frame(df, ["y", "x1", "x2", "z"], entity="country")
+
+    expected = econometrics.perform_ols_analysis(df, "y", exog[0], exog[1:])
+    got = pm.ols("y", exog)
+    assert got["n_obs"] == expected["n_obs"]
+    assert got["r_squared"] == pytest.approx(expected["r_squared"], rel=1e-9)
+    for k in expected["params"]:
+        assert got["params"][k] == pytest.approx(expected["params"][k], rel=1e-8)
+        assert got["pvalues"][k] == pytest.approx(expected["pvalues"][k], rel=1e-6, abs=1e-12)
+
+    complete = df.dropna(subset=["y"] + exog)
+    expected = econometrics.perform_fe_analysis(complete, "y", exog, "country", "year")
+    got = pm.fe("y", exog)
+    assert got["n_obs"] == expected["n_obs"]
+    assert got["r_squared"] == pytest.approx(expected["r_squared"], rel=1e-9)
+    for k in expected["params"]:
+        assert got["params"][k] == pytest.approx(expected["params"][k], rel=1e-8)
+        assert got["pvalues"][k] == pytest.approx(expected["pvalues"][k], rel=1e-6, abs=1e-12)
+
+
+def test_moments_are_bounded_and_survive_collinearity():
+    from app import moments
+
+    df = make_panel(missing=0.1)
+    with pytest.raises(moments.MomentsTooLarge):
+        moments.PanelMoments.from_frame(df, ["y", "x1", "x2", "z"], entity="country", max_bytes=1_000)
+
+    # почти коллинеарный регрессор: statsmodels решает через pinv, моменты — так же
+    df["x3"] = df["x1"] * 1e6 + 1e-3 * df["z"]
+    pm = moments.PanelMoments.from_frame(df, ["y", "x1", "x2", "x3"], entity="country")
+    expected = econometrics.perform_ols_analysis(df, "y", "x1", ["x2", "x3"])
+    got = pm.ols("y", ["x1", "x2", "x3"])
+    assert got["params"]["x2"] == pytest.approx(expected["params"]["x2"], rel=1e-6)
+
+    cache = moments.MomentsCache(max_items=8, max_bytes=int(pm.nbytes * 1.5))
+    cache.put("a", pm)
+    cache.put("b", pm)
+    assert cache.get("a") is None and cache.get("b") is pm and cache.nbytes == pm.nbytes
+
+
+@pytest.mark.parametrize("method", ["OLS", "2SLS", "FE"])
+def test_out_of_core_matches_in_memory(method):
+    from app import chunked, dataset_store
+
+    df = make_panel(missing=0.1)
+    content = dataset_store.encode(dataset_store.to_table(df))
+    source = lambda: dataset_store.iter_for_analysis(content, list(df.columns), batch_size=37)
+
+    kwargs = dict(dependent_var="y", base_var="x1", control_vars=["x2"], instrument_vars=["z"],
+                  exog_vars=["x1", "x2"], entity="country", time="year")
+    complete = df.dropna(subset=["y", "x1", "x2"])
+    expected = econometrics.perform_analysis(complete, method, **kwargs)
+    got = chunked.fit(source, method, **kwargs)
+
+    assert got["n_obs"] == expected["n_obs"]
+    assert got["r_squared"] == pytest.approx(expected["r_squared"], rel=1e-9)
+    for k in expected["params"]:
+        assert got["params"][k] == pytest.approx(expected["params"][k], rel=1e-8)
+        assert got["pvalues"][k] == pytest.approx(expected["pvalues"][k], rel=1e-6, abs=1e-12)
+
+
+@pytest.mark.parametrize("method", ["OLS", "FE", "RE"])
+def test_clustered_errors_match_libraries(method):
+    import statsmodels.api as sm
+    from linearmodels.panel import PanelOLS, RandomEffects
+
+    df = make_panel(n_entities=20)
+    kwargs = dict(dependent_var="y", base_var="x1", control_vars=["x2"], exog_vars=["x1", "x2"],
+                  entity="country", time="year")
+    got = econometrics.perform_analysis(df, method, cov_type="clustered", cov_kwds={"entity": "country"}, **kwargs)
+
+    data = df.dropna(subset=["y", "x1", "x2"])
+    if method == "OLS":
+        fit = sm.OLS(data.y, sm.add_constant(data[["x1", "x2"]])).fit(cov_type="cluster", cov_kwds={"groups": data.country})
+        expected = fit.bse
+    else:
+        panel = data.set_index(["country", "year"])
+        model = PanelOLS(panel.y, sm.add_constant(panel[["x1", "x2"]]), entity_effects=True) if method == "FE" \
+            else RandomEffects(panel.y, sm.add_constant(panel[["x1", "x2"]]))
+        expected = model.fit(cov_type="clustered", cluster_entity=True, group_debias=True, debiased=True).std_errors
+
+    assert got["inference"] == {"cov_type": "clustered", "clusters": 20, "cluster_by": "country"}
+    for k in expected.index:
+        assert got["std_errors"][k] == pytest.approx(expected[k], rel=1e-8)
+        lo, hi = got["conf_int"][k]
+        assert lo < got["params"][k] < hi
+
+
+def test_bootstrap_is_deterministic_and_stops_early(monkeypatch):
+    from app import inference
+
+    panel = make_panel(n_entities=30, n_years=20).set_index(["country", "year"])
+    design = inference.within_design(panel, "y", ["x1", "x2"])
+    clustered = inference.clustered(design)["std_errors"]
+
+    for scheme in inference.BOOTSTRAP_SCHEMES:
+        first = inference.bootstrap(design, scheme, reps=2000, seed=7)
+        # разбиение на пачки по seed не зависит от того, где они считаются
+        monkeypatch.setattr(inference.pool, "workers", 1)
+        again = inference.bootstrap(design, scheme, reps=2000, seed=7)
+        assert np.array_equal(first["std_errors"], again["std_errors"])
+        assert np.array_equal(first["conf_int"], again["conf_int"])
+        assert first["inference"]["converged"] and first["inference"]["reps"] < 2000
+        if scheme != "pairs":
+            # кластерные схемы воспроизводят кластеризованную ковариацию
+            assert first["std_errors"][1:] == pytest.approx(clustered[1:], rel=0.15)
+
+    other = inference.bootstrap(design, "block", reps=400, seed=8, early_stop=False)
+    assert other["inference"]["reps"] == 400 and not other["inference"]["converged"]
+    with pytest.raises(ValueError):
+        inference.bootstrap(design, "jackknife")
+
+
+@pytest.mark.parametrize("method", ["OLS", "FE"])
+@pytest.mark.parametrize("mode", ["rolling", "expanding"])
+def test_rolling_path_matches_refits(method, mode):
+    from app import rolling
+
+    df = make_panel(n_entities=15, n_years=30, missing=0.1)
+    path = rolling.fit_path(df, method, "y", ["x1", "x2"], 1992, 2029, window=8, step=3, mode=mode)
+    # окна до 2000 года пустые
+    assert path["windows"][0]["params"] is None and path["windows"][0]["error"]
+
+    fitted = [w for w in path["windows"] if w["params"] is not None]
+    assert len(fitted) == len(path["windows"]) - 1
+    for w in fitted:
+        rows = df[(df.year >= w["start_year"]) & (df.year <= w["end_year"])].dropna(subset=["y", "x1", "x2"])
+        expected = econometrics.perform_analysis(rows, method, dependent_var="y", base_var="x1", control_vars=["x2"],
+                                                 exog_vars=["x1", "x2"], entity="country", time="year")
+        assert w["n_obs"] == expected["n_obs"]
+        assert w["r_squared"] == pytest.approx(expected["r_squared"], rel=1e-9)
+        for k in expected["params"]:
+            assert w["params"][k] == pytest.approx(expected["params"][k], rel=1e-8)
+            assert w["pvalues"][k] == pytest.approx(expected["pvalues"][k], rel=1e-6, abs=1e-12)
+
+
+def test_rolling_cache_key_keeps_window_and_step_apart():
+    from app import result_cache
+
+    def key(window, step):
+        spec = {"method": "FE", "exog_vars": ["x2", "x1"],
+                "rolling": {"window": window, "step": step, "mode": "rolling"}}
+        return result_cache.make_key(spec, "data:v1")
+
+    assert key(10, 2) != key(2, 10)
+    assert key(10, 2) == key(10, 2)
+
+
+def test_request_profile_collects_stages_from_worker_thread():
+    from concurrent.futures import ThreadPoolExecutor
+    from app import metrics
+
+    df = make_panel().dropna()
+    prof = metrics.RequestProfile()
+    with ThreadPoolExecutor(1) as pool:
+        pool.submit(prof.wrap(econometrics.perform_analysis), df, "OLS",
+                    dependent_var="y", base_var="x1", control_vars=["x2"]).result()
+    report = prof.report()
+    assert set(report["stages"]) == {"clean", "fit", "render"}
+    assert "perform_ols_analysis" in report["cprofile"]
+    assert b'analysis_stage_seconds_count{method="OLS",stage="fit"}' in metrics.render()
+
+
+def test_joint_panel_matches_separate_fits():
+    import statsmodels.api as sm
+    from linearmodels.panel import BetweenOLS, PanelOLS, PooledOLS, RandomEffects
+
+    df = make_panel(n_entities=20, n_years=12)
+    result = econometrics.perform_analysis(df, "PANEL", dependent_var="y", exog_vars=["x1", "x2"],
+                                           entity="country", time="year")
+
+    data = df.set_index(["country", "year"])[["y", "x1", "x2"]].dropna()
+    X = sm.add_constant(data[["x1", "x2"]])
+    refs = {
+        "pooled": PooledOLS(data["y"], X).fit(),
+        "between": BetweenOLS(data["y"], X).fit(),
+        "fixed_effects": PanelOLS(data["y"], X, entity_effects=True).fit(),
+        "random_effects": RandomEffects(data["y"], X).fit(),
+    }
+    for name, ref in refs.items():
+        got = result["models"][name]
+        for col in ("const", "x1", "x2"):
+            assert got["params"][col] == pytest.approx(ref.params[col], rel=1e-8), (name, col)
+            assert got["std_errors"][col] == pytest.approx(ref.std_errors[col], rel=1e-8), (name, col)
+            assert got["pvalues"][col] == pytest.approx(ref.pvalues[col], rel=1e-6, abs=1e-12), (name, col)
+        assert got["r_squared"] == pytest.approx(ref.rsquared, rel=1e-8), name
+        assert got["n_obs"] == ref.nobs
+
+    fe, re = refs["fixed_effects"], refs["random_effects"]
+    diff = (fe.params - re.params)[["x1", "x2"]]
+    # обе ковариации — при sigma2_e из FE
+    V = (fe.cov - re.cov * fe.s2 / re.s2).loc[["x1", "x2"], ["x1", "x2"]]
+    assert result["hausman"]["statistic"] == pytest.approx(float(diff @ np.linalg.solve(V, diff)), rel=1e-6)
+    assert result["hausman"]["df"] == 2
+    # x2 коррелирует с эффектом страны — тест должен выбрать FE
+    assert result["hausman"]["pvalue"] < 0.05
+    assert result["method"] == result["hausman"]["preferred"] == "Fixed Effects"
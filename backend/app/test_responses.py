@@ -0,0 +1,53 @@
+import math
+
+import numpy as np
+import pyarrow as pa
+
+from app import econometrics, responses
+from app.test_econometrics import make_panel
+
+
+def _read(response):
+    table = pa.ipc.open_stream(response.body).read_all()
+    return table, responses.orjson.loads(table.schema.metadata[b"meta"])
+
+
+def test_summary_is_rendered_only_on_request():
+    df = make_panel()
+    kwargs = dict(dependent_var="y", exog_vars=["x1", "x2"], entity="country", time="year")
+    full = econometrics.perform_analysis(df, "FE", **kwargs)
+    compact = econometrics.perform_analysis(df, "FE", render_summary=False, **kwargs)
+    assert "PanelOLS" in full["summary"] and compact["summary"] is None
+    assert compact["params"] == full["params"]
+
+    joint = econometrics.perform_analysis(df, "PANEL", render_summary=False, **kwargs)
+    assert joint["summary"] is None and all(m["summary"] is None for m in joint["models"].values())
+
+
+def test_json_and_arrow_encodings():
+    result = econometrics.perform_analysis(make_panel(), "OLS", dependent_var="y", base_var="x1",
+                                           control_vars=["x2"], render_summary=False)
+    result["pvalues"]["x2"] = float("nan")
+    body = responses.FastJSONResponse({**result, "n": np.int64(3)}).body
+    decoded = responses.orjson.loads(body)
+    assert decoded["pvalues"]["x2"] is None and decoded["n"] == 3
+
+    table, meta = _read(responses.arrow_response(responses.coefficients_table(result)))
+    assert table.column("term").to_pylist() == ["const", "x1", "x2"]
+    assert table.column("estimate").to_pylist() == list(result["params"].values())
+    assert math.isnan(table.column("pvalue")[2].as_py())
+    assert meta["method"] == "OLS" and meta["n_obs"] == result["n_obs"]
+
+
+def test_grid_table_keeps_failed_specs():
+    items = [
+        {"spec": {"id": 1, "method": "FE", "start_year": 2000, "end_year": 2010, "control_vars": ["x2"]},
+         "result": {"params": {"x1": 2.0, "x2": -0.5}, "pvalues": {"x1": 0.0, "x2": 0.1}, "r_squared": 0.5,
+                    "n_obs": 100}},
+        {"spec": {"id": 0, "method": "2SLS", "start_year": 2000, "end_year": 2010, "control_vars": []},
+         "error": "ValueError: singular"},
+    ]
+    table = responses.grid_table(items)
+    assert table.column("spec_id").to_pylist() == [0, 1, 1]
+    assert table.column("error").to_pylist() == ["ValueError: singular", None, None]
+    assert table.column("controls").to_pylist() == ["", "x2", "x2"]
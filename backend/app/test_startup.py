@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Бюджет на `import app.main` в холодном процессе, секунды
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET", "2.5"))
+BACKEND = Path(__file__).resolve().parents[1]
+
+PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - t
+heavy = [m for m in ("statsmodels", "linearmodels", "wbdata", "scipy.stats", "app.econometrics") if m in sys.modules]
+print(json.dumps({"elapsed": elapsed, "heavy": heavy}))
+"""
+
+
+def test_import_is_lazy_and_within_budget():
+    env = {**os.environ, "DATABASE_URL": "sqlite://", "SECRET_KEY": "x", "ALGORITHM": "HS256"}
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True)
+    probe = json.loads(out.stdout.strip().splitlines()[-1])
+    assert probe["heavy"] == []
+    assert probe["elapsed"] < IMPORT_BUDGET, f"import app.main took {probe['elapsed']:.2f}s"
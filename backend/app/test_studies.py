@@ -0,0 +1,84 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture
+def models(monkeypatch):
+    # app.database читает DATABASE_URL при импорте; подставляем только на время теста
+    if "DATABASE_URL" not in os.environ:
+        monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    from app import models
+    return models
+
+
+@pytest.fixture
+def studies(models):
+    from app import studies
+    return studies
+
+
+@pytest.fixture
+def db(models):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _study(models, method, dep, base, controls, created_at=None):
+    return models.StudyResult(method=method, dependent_metric=dep, base_metric=base,
+                              metrics=controls, created_at=created_at)
+
+
+def test_popularity_counters_match_history(db, models, studies):
+    now = datetime.utcnow()
+    old = now - timedelta(days=20)
+    for _ in range(3):
+        studies.record_study(db, _study(models, "OLS", "gdp", "inflation", ["b", "a"], old))
+    studies.record_study(db, _study(models, "ols", "gdp", "inflation", ["a", "b"], now))
+    for _ in range(2):
+        studies.record_study(db, _study(models, "FE", "gdp", "trade", [], now))
+    db.commit()
+
+    top = studies.popular(db, top_n=1)
+    assert top == [{"method": "OLS", "dependent_metric": "gdp", "base_metric": "inflation",
+                    "control_metrics": ["a", "b"], "count": 4}]
+
+    week = studies.popular(db, window="week")
+    assert [(r["method"], r["count"]) for r in week] == [("FE", 2), ("OLS", 1)]
+
+    studies.rebuild_popularity(db)
+    db.commit()
+    assert studies.popular(db) == [top[0], {**week[0]}]
+
+
+def test_history_keyset_pagination(db, models, studies):
+    user = models.User(email="a@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    start = datetime(2024, 1, 1)
+    for i in range(7):
+        study = studies.save_result(db, user.id, "OLS", "gdp", "x", [], ["usa"], 2000, 2010,
+                                    {"r_squared": i / 10, "summary": f"s{i}", "params": {"x": i}})
+        study.created_at = start + timedelta(hours=i)
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = studies.list_studies(db, user.id, limit=3, cursor=cursor)
+        assert all("summary" not in item for item in page["items"])
+        seen += [item["r_squared"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [0.6, 0.5, 0.4, 0.3, 0.2, 0.1, 0.0]
+
+    page = studies.list_studies(db, user.id, limit=1, include_summary=True)
+    assert page["items"][0]["summary"] == "s6" and page["items"][0]["params"] == {"x": 6}
+    with pytest.raises(ValueError):
+        studies.list_studies(db, user.id, cursor="garbage")
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import transforms
+
+
+@pytest.fixture
+def panel():
+    rows = []
+    for country, base in (("A", 100.0), ("B", 50.0)):
+        for year in range(2000, 2010):
+            if country == "B" and year == 2004:
+                continue  # пропущенный год
+            rows.append({"country": country, "year": year, "gdp": base * 1.1 ** (year - 2000), "x": year % 3})
+    # порядок строк не должен влиять на лаги
+    return pd.DataFrame(rows).sample(frac=1.0, random_state=0).reset_index(drop=True)
+
+
+def test_lags_differences_and_growth_follow_years(panel):
+    plan = transforms.Plan([
+        {"op": "log", "column": "gdp"},
+        {"op": "diff", "column": "log(gdp)", "name": "dlog"},
+        {"op": "growth", "column": "gdp"},
+        {"op": "lag", "column": "x", "periods": 2},
+    ])
+    assert plan.sources == ["gdp", "x"] and plan.lookback == 2
+    out = plan.apply(panel, "country", "year", 2002, 2009).set_index(["country", "year"]).sort_index()
+
+    assert out.index.get_level_values("year").min() == 2002
+    assert np.allclose(out["dlog"].dropna(), np.log(1.1))
+    assert np.allclose(out["growth(gdp)"].dropna(), 10.0)
+    # у B нет 2004 года: разность в 2004 и 2005 не считается, лаг 2006 пуст
+    assert np.isnan(out.loc[("B", 2005), "dlog"]) and np.isnan(out.loc[("B", 2006), "lag2(x)"])
+    assert out.loc[("A", 2006), "lag2(x)"] == 2004 % 3
+
+
+def test_derived_columns_are_cached_and_collapsed(panel):
+    plan = transforms.Plan([{"op": "log", "column": "gdp"}], period_mean=5)
+    before = transforms.cache.stats()["hits"]
+    first = plan.apply(panel, "country", "year", 2000, 2009, version="v1")
+    second = plan.apply(panel, "country", "year", 2000, 2009, version="v1")
+    assert transforms.cache.stats()["hits"] == before + 1
+    pd.testing.assert_frame_equal(first, second)
+
+    # записи с тегом индикатора сбрасываются при его обновлении
+    plan.apply(panel, "country", "year", 2000, 2009, version="v2", tags=["indicator:GDP"])
+    assert transforms.cache.invalidate("indicator:GDP") == 1
+    assert transforms.cache.invalidate("indicator:GDP") == 0
+
+    assert list(first["year"]) == [2000, 2005, 2000, 2005]
+    a = panel[(panel.country == "A") & (panel.year < 2005)]
+    assert first.loc[0, "log(gdp)"] == pytest.approx(np.log(a["gdp"]).mean())
+
+
+def test_derived_cache_byte_budget():
+    cache = transforms.DerivedCache(max_items=10, max_bytes=2000)
+    cache.put("a", np.zeros(100))
+    cache.put("b", np.zeros(100))
+    cache.put("c", np.zeros(100))
+    # 3 × 800 байт > 2000: вытесняется самая старая
+    assert cache.get("a") is None and cache.get("b") is not None
+    assert cache.stats()["bytes"] == 1600
+    cache.put("huge", np.zeros(1000))
+    assert cache.get("huge") is None and cache.stats()["bytes"] == 1600
+
+
+def test_invalid_plans():
+    with pytest.raises(ValueError):
+        transforms.Plan([{"op": "sqrt", "column": "gdp"}])
+    with pytest.raises(ValueError):
+        transforms.Plan([{"op": "lag", "column": "gdp"}, {"op": "lag", "column": "gdp"}])
+    with pytest.raises(ValueError):
+        transforms.Plan(period_mean=1)
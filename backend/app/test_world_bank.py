@@ -0,0 +1,133 @@
+import time
+
+import pandas as pd
+import pytest
+
+from app import indicator_cache, world_bank
+from app.indicator_cache import IndicatorCache
+
+
+def _rows(code, countries, start, end):
+    return [
+        {
+            "indicator": {"id": code},
+            "country": {"id": c[:2], "value": c},
+            "countryiso3code": c,
+            "date": str(y),
+            "value": float(y) + (0.5 if c == "USA" else 0.0),
+        }
+        for c in countries for y in range(start, end + 1)
+        if not (c == "RUS" and y == 2001)  # одна пустая ячейка
+    ]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = IndicatorCache(directory=str(tmp_path), ttl=3600, recent_ttl=3600)
+    monkeypatch.setattr(indicator_cache, "_cache", c)
+    return c
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    log = []
+
+    def fake_get_data(code, country, date):
+        log.append((code, tuple(country), date))
+        return _rows(code, country, int(date[0]), int(date[1]))
+
+    import wbdata  # world_bank импортирует его лениво
+    monkeypatch.setattr(wbdata, "get_data", fake_get_data)
+    return log
+
+
+def test_repeat_request_served_from_cache(cache, calls):
+    ind = {"NY.GDP.PCAP.KD.ZG": "gdp"}
+    first = world_bank.fetch_world_bank_data(["USA", "RUS"], ind, 2000, 2002)
+    second = world_bank.fetch_world_bank_data(["USA", "RUS"], ind, 2000, 2002)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, second)
+    assert list(first.columns) == ["country", "year", "gdp"]
+    # пустая ячейка кэшируется как NaN и не запрашивается повторно
+    assert first.loc[(first.country == "rus") & (first.year == 2001), "gdp"].isna().all()
+
+
+def test_overlapping_request_fetches_only_missing_cells(cache, calls):
+    ind = {"FP.CPI.TOTL.ZG": "cpi"}
+    world_bank.fetch_world_bank_data(["USA"], ind, 2000, 2002)
+    df = world_bank.fetch_world_bank_data(["USA", "DEU"], ind, 2001, 2004)
+    assert calls[1] == ("FP.CPI.TOTL.ZG", ("USA", "DEU"), ("2001", "2004"))
+    assert df["cpi"].notna().all()
+
+    # из памяти и с диска получаем одно и то же
+    cache._memory.clear()
+    world_bank.fetch_world_bank_data(["USA", "DEU"], ind, 2001, 2004)
+    assert len(calls) == 2
+
+
+def test_stale_cells_are_refetched(cache, calls, monkeypatch):
+    ind = {"FP.CPI.TOTL.ZG": "cpi"}
+    world_bank.fetch_world_bank_data(["USA"], ind, 2000, 2001)
+    now = time.time()
+    monkeypatch.setattr(indicator_cache.time, "time", lambda: now + 7200)
+    world_bank.fetch_world_bank_data(["USA"], ind, 2000, 2001)
+    assert len(calls) == 2
+
+
+def test_disk_lru_eviction(tmp_path):
+    c = IndicatorCache(directory=str(tmp_path), disk_max_bytes=1, memory_items=1)
+    values = pd.Series([1.0], index=pd.MultiIndex.from_tuples([("USA", 2000)], names=["country", "year"]))
+    c.put("A", values, {"USA": [2000]})
+    c.put("B", values, {"USA": [2000]})
+    assert len(list(tmp_path.glob("*.parquet"))) <= 1
+
+
+def _stub_client():
+    import httpx
+    from app import wb_stub
+
+    wb_stub.app.state.requests = 0
+    transport = httpx.ASGITransport(app=wb_stub.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://wb-stub/v2"), wb_stub
+
+
+def test_async_fetch_against_stub(cache, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(world_bank, "WB_PER_PAGE", 7)  # несколько страниц
+    monkeypatch.setattr(world_bank, "WB_COUNTRY_CHUNK", 2)
+    ind = {"NY.GDP.PCAP.KD.ZG": "gdp", "FP.CPI.TOTL.ZG": "cpi"}
+
+    async def run():
+        client, stub = _stub_client()
+        async with client:
+            df = await world_bank.fetch_world_bank_data_async(["USA", "RUS", "DEU"], ind, 2000, 2005, client=client)
+            first = stub.app.state.requests
+            again = await world_bank.fetch_world_bank_data_async(["USA", "RUS", "DEU"], ind, 2000, 2005, client=client)
+            return df, again, first, stub.app.state.requests, stub
+
+    df, again, first, total, stub = asyncio.run(run())
+    assert first > 0 and total == first
+    pd.testing.assert_frame_equal(df, again)
+    row = df[(df.country == "deu") & (df.year == 2003)].iloc[0]
+    assert row["gdp"] == pytest.approx(stub.synthetic_value("NY.GDP.PCAP.KD.ZG", "DEU", 2003), nan_ok=True)
+
+
+def test_concurrent_identical_requests_share_fetch(cache):
+    import asyncio
+
+    ind = {"NY.GDP.PCAP.KD.ZG": "gdp"}
+
+    async def run():
+        client, stub = _stub_client()
+        async with client:
+            frames = await asyncio.gather(*(
+                world_bank.fetch_world_bank_data_async(["USA", "RUS"], ind, 1990, 2000, client=client)
+                for _ in range(5)
+            ))
+            return frames, stub.app.state.requests
+
+    frames, requests = asyncio.run(run())
+    assert requests == 1
+    for f in frames[1:]:
+        pd.testing.assert_frame_equal(frames[0], f)
@@ -0,0 +1,250 @@
+# app/transforms.py
+#
+# Производные колонки по панели перед оценкой: log, лаги, разности,
+# темпы роста и усреднение по непересекающимся периодам (например,
+# 5-летние средние). Шаги описываются в запросе декларативно и
+# выполняются векторно по каждой сущности (стране); лаги берутся по
+# году, а не по соседней строке, так что пропущенные годы дают NaN.
+# Шаг может ссылаться на колонку, созданную предыдущим шагом (diff от log).
+#
+# Посчитанные колонки кэшируются по (версия исходных данных, шаг), так что
+# повторные спецификации с теми же преобразованиями их не пересчитывают.
+# Для данных Всемирного банка версия — индикаторы и фильтр запроса, а
+# записи помечены тегами индикаторов и сбрасываются при их обновлении.
+# Кэш ограничен и числом колонок, и их суммарным размером в байтах.
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+OPS = ("log", "lag", "diff", "growth")
+TRANSFORM_CACHE_SIZE = int(os.getenv("TRANSFORM_CACHE_SIZE", "256"))
+TRANSFORM_CACHE_BYTES = int(os.getenv("TRANSFORM_CACHE_BYTES", str(256 * 2 ** 20)))
+TRANSFORM_MAX_STEPS = int(os.getenv("TRANSFORM_MAX_STEPS", "32"))
+MAX_PERIODS = 50
+
+
+def default_name(op: str, column: str, periods: int = 1) -> str:
+    if op == "log":
+        return f"log({column})"
+    return f"{op}{periods if periods != 1 else ''}({column})"
+
+
+class DerivedCache:
+    """
+    LRU готовых колонок: ключ — (версия исходных строк, каноническое описание шага).
+    Колонка больше всего бюджета в байтах не кэшируется и других не вытесняет.
+    """
+
+    def __init__(self, max_items: int = TRANSFORM_CACHE_SIZE, max_bytes: int = TRANSFORM_CACHE_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items: "OrderedDict[tuple, tuple[np.ndarray, frozenset]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[np.ndarray]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, values: np.ndarray, tags: Iterable[str] = ()):
+        values.setflags(write=False)
+        if values.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[0].nbytes
+            self._items[key] = (values, frozenset(tags))
+            self.nbytes += values.nbytes
+            while len(self._items) > 1 and (len(self._items) > self.max_items or self.nbytes > self.max_bytes):
+                _, (evicted, _) = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def invalidate(self, tag: str) -> int:
+        with self._lock:
+            stale = [k for k, (_, tags) in self._items.items() if tag in tags]
+            for k in stale:
+                self.nbytes -= self._items.pop(k)[0].nbytes
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "items": len(self._items),
+                "bytes": self.nbytes,
+            }
+
+
+cache = DerivedCache()
+
+
+class Plan:
+    """
+    Нормализованный план: шаги [{name, op, column, periods}] и period_mean.
+    ValueError — если план некорректен (неизвестная операция, повтор имени,
+    ссылка на колонку, которая появляется позже).
+    """
+
+    def __init__(self, steps: Optional[List[dict]] = None, period_mean: Optional[int] = None):
+        steps = [dict(s) for s in steps or []]
+        if len(steps) > TRANSFORM_MAX_STEPS:
+            raise ValueError(f"Too many transforms: {len(steps)} > {TRANSFORM_MAX_STEPS}")
+        if period_mean is not None and not 1 < period_mean <= MAX_PERIODS:
+            raise ValueError(f"'period_mean' must be between 2 and {MAX_PERIODS}")
+        self.period_mean = period_mean
+        self.steps: List[dict] = []
+        self._canon: Dict[str, object] = {}
+        self._lookback: Dict[str, int] = {}
+        self.sources: List[str] = []
+        for s in steps:
+            op = str(s.get("op", "")).lower()
+            if op not in OPS:
+                raise ValueError(f"Unknown transform '{s.get('op')}', expected one of {OPS}")
+            column = s.get("column")
+            if not column:
+                raise ValueError(f"Transform '{op}' requires 'column'")
+            periods = 1 if op == "log" else int(s.get("periods") or 1)
+            if not 1 <= periods <= MAX_PERIODS:
+                raise ValueError(f"'periods' must be between 1 and {MAX_PERIODS}")
+            name = s.get("name") or default_name(op, column, periods)
+            if name in self._canon or name in self.sources:
+                raise ValueError(f"Transform output '{name}' is defined twice or shadows a source column")
+
+            if column in self._canon:
+                inner, back = self._canon[column], self._lookback[column]
+            else:
+                inner, back = column, 0
+                if column not in self.sources:
+                    self.sources.append(column)
+            self._canon[name] = [op, periods, inner]
+            self._lookback[name] = back + (0 if op == "log" else periods)
+            self.steps.append({"name": name, "op": op, "column": column, "periods": periods})
+
+    def __bool__(self) -> bool:
+        return bool(self.steps) or self.period_mean is not None
+
+    @property
+    def outputs(self) -> List[str]:
+        return [s["name"] for s in self.steps]
+
+    @property
+    def lookback(self) -> int:
+        """Сколько лет до start_year нужно загрузить, чтобы у первого года были лаги."""
+        return max(self._lookback.values(), default=0)
+
+    def fingerprint(self) -> str:
+        payload = json.dumps({"steps": self.steps, "period_mean": self.period_mean}, sort_keys=True,
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def apply(self, df: pd.DataFrame, entity: str, time: str, start_year: Optional[int] = None,
+              end_year: Optional[int] = None, version: Optional[str] = None,
+              tags: Iterable[str] = ()) -> pd.DataFrame:
+        """
+        Добавляет производные колонки, оставляет строки [start_year, end_year]
+        и при period_mean сворачивает панель в средние по периодам.
+        version — ключ исходных строк для кэша; None — отпечаток содержимого.
+        tags — теги записей кэша (DerivedCache.invalidate).
+        """
+        if not self:
+            return df
+        for col in (entity, time):
+            if col not in df.columns:
+                raise ValueError(f"Transforms require the '{col}' column")
+        missing = [c for c in self.sources if c not in df.columns]
+        if missing:
+            raise ValueError(f"Unknown columns in transforms: {missing}")
+
+        df = df.reset_index(drop=True)
+        if self.steps:
+            if version is None:
+                from .result_cache import data_version
+                version = data_version(df)
+            df = self._derive(df, entity, time, version, frozenset(tags))
+
+        if time in df.columns and (start_year is not None or end_year is not None):
+            years = pd.to_numeric(df[time], errors="coerce")
+            keep = years.between(start_year if start_year is not None else -np.inf,
+                                 end_year if end_year is not None else np.inf)
+            df = df[keep.to_numpy()].reset_index(drop=True)
+        if self.period_mean:
+            df = collapse(df, entity, time, self.period_mean, start_year)
+        return df
+
+    def _derive(self, df: pd.DataFrame, entity: str, time: str, version: str, tags: frozenset) -> pd.DataFrame:
+        years = pd.to_numeric(df[time], errors="coerce").to_numpy(dtype="float64")
+        keys = pd.MultiIndex.from_arrays([df[entity].to_numpy(), years])
+        lag_index = {}
+        if any(s["op"] != "log" for s in self.steps) and keys.has_duplicates:
+            raise ValueError(f"Lags and differences require one row per ({entity}, {time})")
+
+        def lagged(values: np.ndarray, periods: int) -> np.ndarray:
+            if periods not in lag_index:
+                target = pd.MultiIndex.from_arrays([df[entity].to_numpy(), years - periods])
+                lag_index[periods] = keys.get_indexer(target)
+            pos = lag_index[periods]
+            out = np.where(pos >= 0, values[np.maximum(pos, 0)], np.nan)
+            return out
+
+        derived = {}
+        for step in self.steps:
+            key = ((version, entity, time), json.dumps(self._canon[step["name"]], ensure_ascii=False))
+            values = cache.get(key)
+            if values is None or len(values) != len(df):
+                source = derived[step["column"]] if step["column"] in derived else \
+                    pd.to_numeric(df[step["column"]], errors="coerce").to_numpy(dtype="float64")
+                values = _compute(step["op"], source, step["periods"], lagged)
+                cache.put(key, values, tags)
+            derived[step["name"]] = values
+        return df.assign(**{name: np.array(values) for name, values in derived.items()})
+
+
+def _compute(op: str, x: np.ndarray, periods: int, lagged) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if op == "log":
+            return np.where(x > 0, np.log(np.where(x > 0, x, 1.0)), np.nan)
+        prev = lagged(x, periods)
+        if op == "lag":
+            return prev
+        if op == "diff":
+            return x - prev
+        # рост в процентах, как у индикаторов Всемирного банка (... annual %)
+        return np.where(prev != 0, 100.0 * (x / prev - 1.0), np.nan)
+
+
+def collapse(df: pd.DataFrame, entity: str, time: str, years: int, start_year: Optional[int] = None) -> pd.DataFrame:
+    """
+    Средние числовых колонок по непересекающимся периодам длиной years
+    (пропуски не учитываются); год периода — его первый год.
+    """
+    t = pd.to_numeric(df[time], errors="coerce")
+    origin = start_year if start_year is not None else t.min()
+    period = origin + ((t - origin) // years) * years
+    numeric = [c for c in df.columns if c not in (entity, time) and pd.api.types.is_numeric_dtype(df[c])]
+    out = (
+        df[numeric]
+        .groupby([df[entity], period.rename(time)], sort=True)
+        .mean()
+        .reset_index()
+    )
+    out[time] = out[time].astype("int64")
+    return out
@@ -0,0 +1,136 @@
+# app/wb_stub.py
+#
+# Локальная заглушка API Всемирного банка для офлайн-тестов и бенчмарков.
+# Отдаёт детерминированные синтетические ряды в формате /v2 API.
+#
+# Запуск:  python -m app.wb_stub --port 8081
+# затем:   WB_API_URL=http://127.0.0.1:8081/v2
+
+import asyncio
+import hashlib
+import math
+import os
+
+from fastapi import FastAPI, Query
+
+STUB_LATENCY = float(os.getenv("WB_STUB_LATENCY", "0"))
+# Размер синтетического списка /v2/indicator (плюс коды из METRIC_MAP)
+STUB_INDICATORS = int(os.getenv("WB_STUB_INDICATORS", "2000"))
+
+app = FastAPI(title="World Bank API stub")
+app.state.requests = 0
+
+
+def synthetic_value(indicator: str, country: str, year: int):
+    h = int(hashlib.md5(f"{indicator}|{country}".encode()).hexdigest(), 16)
+    # ~5% пустых ячеек, как в настоящих данных
+    if (h + year) % 20 == 0:
+        return None
+    level = (h % 1000) / 10.0
+    return round(level + 5 * math.sin(year / 3.0 + h % 7), 4)
+
+
+@app.get("/v2/country/{countries}/indicator/{indicator}")
+async def indicator_data(
+    countries: str,
+    indicator: str,
+    date: str = Query("1960:2023"),
+    per_page: int = Query(50),
+    page: int = Query(1),
+    format: str = Query("json"),
+):
+    app.state.requests += 1
+    if STUB_LATENCY:
+        await asyncio.sleep(STUB_LATENCY)
+
+    start, _, end = date.partition(":")
+    start, end = int(start), int(end or start)
+    rows = [
+        {
+            "indicator": {"id": indicator, "value": indicator},
+            "country": {"id": code[:2], "value": code},
+            "countryiso3code": code,
+            "date": str(year),
+            "value": synthetic_value(indicator, code, year),
+            "unit": "",
+            "obs_status": "",
+            "decimal": 1,
+        }
+        for code in (c.upper() for c in countries.split(";"))
+        for year in range(end, start - 1, -1)
+    ]
+    return _page(rows, per_page, page)
+
+
+def _page(rows: list, per_page: int, page: int) -> list:
+    pages = max(1, math.ceil(len(rows) / per_page))
+    meta = {"page": page, "pages": pages, "per_page": per_page, "total": len(rows)}
+    return [meta, rows[(page - 1) * per_page: page * per_page]]
+
+
+_SUBJECTS = ["GDP", "GDP per capita", "Exports of goods and services", "Imports of goods and services",
+             "Domestic credit to private sector", "Inflation, consumer prices", "Population", "Unemployment",
+             "Literacy rate, adult total", "Government expenditure", "Foreign direct investment, net inflows",
+             "CO2 emissions", "Electric power consumption", "Life expectancy at birth", "School enrollment, primary"]
+_UNITS = ["(% of GDP)", "(annual %)", "(current US$)", "(constant 2015 US$)", "(% of total)", "(per 1,000 people)"]
+_TOPICS = ["Economy & Growth", "Financial Sector", "Trade", "Education", "Health", "Environment",
+           "Public Sector", "Social Protection & Labor"]
+
+
+def synthetic_indicators(n: int = STUB_INDICATORS) -> list:
+    from .indicator_map import METRIC_MAP
+
+    rows = [{"id": code, "name": name, "source": {"id": "2", "value": "World Development Indicators"}}
+            for name, code in METRIC_MAP.items()]
+    for i in range(n):
+        subject = _SUBJECTS[i % len(_SUBJECTS)]
+        unit = _UNITS[(i // len(_SUBJECTS)) % len(_UNITS)]
+        rows.append({"id": f"SYN.{i // 100:02d}.{i % 100:02d}", "name": f"{subject} {unit}, series {i}",
+                     "source": {"id": "2", "value": "World Development Indicators"}})
+    for i, row in enumerate(rows):
+        row.update(unit="", sourceNote=f"Synthetic description of {row['name']}.",
+                   sourceOrganization="World Bank stub",
+                   topics=[{"id": str(i % len(_TOPICS) + 1), "value": _TOPICS[i % len(_TOPICS)]}])
+    return rows
+
+
+def synthetic_countries() -> list:
+    import pycountry
+
+    regions = ["East Asia & Pacific", "Europe & Central Asia", "Latin America & Caribbean",
+               "Middle East & North Africa", "North America", "South Asia", "Sub-Saharan Africa"]
+    rows = [
+        {
+            "id": c.alpha_3, "iso2Code": c.alpha_2, "name": c.name,
+            "region": {"id": "", "value": regions[i % len(regions)]},
+            "incomeLevel": {"id": "", "value": ("Low income", "Middle income", "High income")[i % 3]},
+            "capitalCity": "", "longitude": "", "latitude": "",
+        }
+        for i, c in enumerate(sorted(pycountry.countries, key=lambda c: c.alpha_3))
+    ]
+    rows.append({"id": "WLD", "iso2Code": "1W", "name": "World", "region": {"id": "NA", "value": "Aggregates"},
+                 "incomeLevel": {"id": "NA", "value": "Aggregates"}, "capitalCity": "", "longitude": "", "latitude": ""})
+    return rows
+
+
+@app.get("/v2/indicator")
+async def indicator_list(per_page: int = Query(50), page: int = Query(1), format: str = Query("json")):
+    app.state.requests += 1
+    return _page(synthetic_indicators(), per_page, page)
+
+
+@app.get("/v2/country")
+async def country_list(per_page: int = Query(50), page: int = Query(1), format: str = Query("json")):
+    app.state.requests += 1
+    return _page(synthetic_countries(), per_page, page)
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
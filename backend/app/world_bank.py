@@ -1,28 +1,224 @@
-import wbdata
+import asyncio
+import os
+
+import httpx
 import pandas as pd
 
+from . import lifecycle, result_cache
+from .indicator_cache import get_cache
+
+WB_API_URL = os.getenv("WB_API_URL", "https://api.worldbank.org/v2")
+WB_MAX_CONNECTIONS = int(os.getenv("WB_MAX_CONNECTIONS", "8"))
+WB_COUNTRY_CHUNK = int(os.getenv("WB_COUNTRY_CHUNK", "25"))
+WB_TIMEOUT = float(os.getenv("WB_TIMEOUT", "30"))
+WB_PER_PAGE = 1000
+
+
+class WorldBankError(RuntimeError):
+    pass
+
+
+def _rows_to_series(rows, countries: list[str]) -> pd.Series:
+    # API отдаёт и ISO3, и ISO2 — сопоставляем с кодами из запроса
+    wanted = {c.upper(): c for c in countries}
+    records = []
+    for row in rows or []:
+        iso3 = (row.get("countryiso3code") or "").upper()
+        iso2 = (row.get("country", {}).get("id") or "").upper()
+        code = wanted.get(iso3) or wanted.get(iso2)
+        if code is None or row.get("value") is None:
+            continue
+        records.append((code, int(str(row["date"])[:4]), float(row["value"])))
+    if not records:
+        return pd.Series(
+            [], index=pd.MultiIndex.from_arrays([[], []], names=["country", "year"]), dtype="float64"
+        )
+    df = pd.DataFrame(records, columns=["country", "year", "value"])
+    return df.set_index(["country", "year"])["value"]
+
+
+def fetch_indicator(code: str, countries: list[str], start_year: int, end_year: int) -> pd.Series:
+    # wbdata тянет dateparser и медленно импортируется — нужен только синхронному пути
+    wbdata = lifecycle.import_heavy("wbdata")
+    rows = wbdata.get_data(code, country=countries, date=(str(start_year), str(end_year)))
+    return _rows_to_series(rows, countries)
+
+
+def _assemble(
+    frames: dict[str, pd.Series],
+    countries: list[str],
+    indicators: dict[str, str],
+    start_year: int,
+    end_year: int,
+) -> pd.DataFrame:
+    cells = pd.MultiIndex.from_product(
+        [countries, range(start_year, end_year + 1)], names=["country", "year"]
+    )
+    df = pd.DataFrame(index=cells)
+    for code, name in indicators.items():
+        df[name] = frames[code].reindex(cells)
+    df = df.reset_index()
+    df["country"] = df["country"].str.lower().str.strip()
+    return df
+
+
+def _missing_span(missing: dict[str, list[int]]) -> tuple[list[str], int, int]:
+    # одним запросом по индикатору: страны с пропусками, минимальный охват лет
+    years = [y for ys in missing.values() for y in ys]
+    return list(missing), min(years), max(years)
+
+
+def _only_cells(values: pd.Series, missing: dict[str, list[int]]) -> pd.Series:
+    cells = pd.MultiIndex.from_tuples([(c, y) for c, ys in missing.items() for y in ys])
+    return values[values.index.isin(cells)]
+
+
+def invalidate_derived(code: str):
+    """Обновились данные индикатора — результаты моделей и производные колонки по нему не нужны."""
+    from . import transforms
+
+    tag = result_cache.indicator_tag(code)
+    result_cache.cache.invalidate(tag)
+    transforms.cache.invalidate(tag)
+
+
 def fetch_world_bank_data(
     countries: list[str],
     indicators: dict[str, str],
     start_year: int,
     end_year: int
 ) -> pd.DataFrame:
-    # формируем диапазон дат для WB API
-    date_range = (str(start_year), str(end_year))
-    import wbdata
-    # загружаем данные с правильным параметром parse_dates
-    df = wbdata.get_dataframe(
-        indicators,
-        country=countries,
-        date=date_range,
-        parse_dates=True
-    )
+    """
+    Возвращает панель с колонками country, year и по колонке на индикатор
+    (имена — значения словаря indicators). Ячейки берутся из локального кэша,
+    в API ходим только за отсутствующими или устаревшими.
+    """
+    cache = get_cache()
+    countries = [c.strip().upper() for c in countries]
+    years = range(start_year, end_year + 1)
 
-    # сбрасываем индекс, переименовываем колонки
-    df = df.reset_index().rename(columns={"country": "страна", "date": "год"})
-    df["country"] = df["country"].str.lower().str.strip()
-    # переводим год из datetime в целое
+    frames = {}
+    for code in indicators:
+        cached, missing = cache.get(code, countries, years)
+        if missing:
+            fetched = fetch_indicator(code, *_missing_span(missing))
+            cache.put(code, fetched, missing)
+            invalidate_derived(code)
+            cached = pd.concat([cached, _only_cells(fetched, missing)])
+        frames[code] = cached
 
-    return df
+    return _assemble(frames, countries, indicators, start_year, end_year)
+
+
+class SingleFlight:
+    """Одинаковые одновременные запросы ждут один общий вызов."""
+
+    def __init__(self):
+        self._inflight: dict = {}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+
+_flight = SingleFlight()
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=WB_API_URL,
+            timeout=WB_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=WB_MAX_CONNECTIONS,
+                max_keepalive_connections=WB_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _get_page(client: httpx.AsyncClient, path: str, params: dict, page: int):
+    resp = await client.get(path, params={**params, "page": page})
+    resp.raise_for_status()
+    body = resp.json()
+    if not isinstance(body, list) or len(body) < 2 or "message" in body[0]:
+        raise WorldBankError(f"World Bank API error for {path}: {body}")
+    return body[0], body[1] or []
+
+
+async def fetch_indicator_async(
+    client: httpx.AsyncClient,
+    code: str,
+    countries: list[str],
+    start_year: int,
+    end_year: int,
+) -> pd.Series:
+    path = f"/country/{';'.join(countries)}/indicator/{code}"
+    params = {"date": f"{start_year}:{end_year}", "format": "json", "per_page": WB_PER_PAGE}
+    meta, rows = await _get_page(client, path, params, 1)
+    pages = int(meta.get("pages") or 1)
+    if pages > 1:
+        rest = await asyncio.gather(*(_get_page(client, path, params, p) for p in range(2, pages + 1)))
+        for _, more in rest:
+            rows.extend(more)
+    return _rows_to_series(rows, countries)
+
+
+async def _fetch_missing(client, code: str, missing: dict[str, list[int]]) -> pd.Series:
+    # страны режем на пачки — пачки и индикаторы грузятся параллельно,
+    # число одновременных соединений ограничивает пул клиента
+    cache = get_cache()
+    countries, start, end = _missing_span(missing)
+    chunks = [countries[i:i + WB_COUNTRY_CHUNK] for i in range(0, len(countries), WB_COUNTRY_CHUNK)]
+
+    async def fetch_and_store(chunk):
+        values = await fetch_indicator_async(client, code, chunk, start, end)
+        await asyncio.to_thread(cache.put, code, values, {c: missing[c] for c in chunk})
+        invalidate_derived(code)
+        return values
+
+    async def load(chunk):
+        key = (code, tuple(chunk), start, end)
+        return await _flight.do(key, lambda: fetch_and_store(chunk))
+
+    parts = await asyncio.gather(*(load(chunk) for chunk in chunks))
+    return pd.concat(parts) if len(parts) > 1 else parts[0]
+
+
+async def fetch_world_bank_data_async(
+    countries: list[str],
+    indicators: dict[str, str],
+    start_year: int,
+    end_year: int,
+    client: httpx.AsyncClient | None = None,
+) -> pd.DataFrame:
+    """Асинхронный вариант fetch_world_bank_data: индикаторы грузятся параллельно."""
+    cache = get_cache()
+    client = client or get_client()
+    countries = [c.strip().upper() for c in countries]
+    years = range(start_year, end_year + 1)
 
+    async def load(code):
+        cached, missing = await asyncio.to_thread(cache.get, code, countries, years)
+        if not missing:
+            return cached
+        fetched = await _fetch_missing(client, code, missing)
+        return pd.concat([cached, _only_cells(fetched, missing)])
 
+    codes = list(indicators)
+    frames = dict(zip(codes, await asyncio.gather(*(load(code) for code in codes))))
+    return _assemble(frames, countries, indicators, start_year, end_year)
@@ -0,0 +1,65 @@
+# benchmarks/compare.py
+#
+# Сравнение двух отчётов benchmarks.run по медианам.
+# Код возврата 1, если хоть один замер медленнее базового больше чем в --threshold раз.
+#
+#     python -m benchmarks.compare base.json report.json --threshold 1.2
+
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base: dict, head: dict, threshold: float) -> tuple[list[tuple], bool]:
+    rows, regressed = [], False
+    names = sorted(set(base["results"]) | set(head["results"]))
+    for name in names:
+        b = base["results"].get(name, {}).get("median")
+        h = head["results"].get(name, {}).get("median")
+        ratio = h / b if b and h is not None else None
+        flag = ""
+        if ratio is not None and ratio > threshold:
+            flag, regressed = "slower", True
+        elif ratio is not None and ratio < 1 / threshold:
+            flag = "faster"
+        rows.append((name, b, h, ratio, flag))
+    return rows, regressed
+
+
+def _fmt(seconds) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    base, head = load(args.base), load(args.head)
+    if base["params"] != head["params"]:
+        print("⚠️ Reports were produced with different parameters", file=sys.stderr)
+    rows, regressed = compare(base, head, args.threshold)
+
+    width = max(len(r[0]) for r in rows) if rows else 10
+    print(f"{'benchmark':<{width}}  {'base':>9}  {'head':>9}  {'ratio':>6}")
+    for name, b, h, ratio, flag in rows:
+        r = f"{ratio:.2f}" if ratio is not None else "—"
+        print(f"{name:<{width}}  {_fmt(b):>9}  {_fmt(h):>9}  {r:>6}  {flag}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# benchmarks/run.py
+#
+# Воспроизводимые замеры: загрузка датасета (разбор CSV в Parquet),
+# каждая оценка perform_*_analysis и быстрые пути (моменты, out-of-core),
+# рейтинг popular_studies на большой истории и загрузка индикаторов
+# Всемирного банка через локальную заглушку app.wb_stub. Сеть и
+# Postgres не нужны: БД — временный sqlite-файл, заглушка слушает 127.0.0.1.
+#
+# Запуск из backend/:
+#     python -m benchmarks.run --countries 200 --years 60 --regressors 5 --out report.json
+#     python -m benchmarks.compare base.json report.json
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# до импорта app: database читает DATABASE_URL при импорте
+_TMP = tempfile.mkdtemp(prefix="dpmiptq-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TMP, 'app.db')}")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from benchmarks.synthetic import country_codes, make_panel, to_csv_bytes  # noqa: E402
+
+SUITES = ("ingest", "estimators", "popular", "world_bank")
+
+# пропуски в синтетической панели намеренные
+warnings.filterwarnings("ignore", message=r"\s*Inputs contain missing values")
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.fmean(runs),
+        "max": max(runs),
+        "runs": len(runs),
+    }
+
+
+def bench_ingest(df, repeat: int) -> dict:
+    from app import ingest
+
+    csv = to_csv_bytes(df)
+    out = {}
+    out["ingest.csv"] = measure(lambda: ingest.ingest(io.BytesIO(csv), "data.csv"), repeat)
+    out["ingest.csv"]["bytes"] = len(csv)
+    # повторная загрузка того же файла: только хеш, без разбора
+    out["ingest.content_hash"] = measure(lambda: ingest.content_hash(io.BytesIO(csv)), repeat)
+    return out
+
+
+def bench_estimators(df, regressors: int, repeat: int) -> dict:
+    from app import chunked, econometrics, moments
+
+    xs = [f"x{j}" for j in range(regressors)]
+    base, controls = xs[0], xs[1:]
+    complete = df.dropna(subset=["y"] + xs)
+    chunks = [df.iloc[i:i + 50_000] for i in range(0, len(df), 50_000)]
+
+    cases = {
+        "perform_ols_analysis": lambda: econometrics.perform_ols_analysis(df, "y", base, controls),
+        "perform_2sls_analysis": lambda: econometrics.perform_2sls_analysis(complete, "y", base, controls, ["z"]),
+        "perform_fe_analysis": lambda: econometrics.perform_fe_analysis(df, "y", xs, "country", "year"),
+        "perform_re_analysis": lambda: econometrics.perform_re_analysis(df, "y", xs, "country", "year"),
+        "perform_panel_analysis": lambda: econometrics.perform_panel_analysis(df, "y", xs, "country", "year"),
+        "moments.build": lambda: moments.PanelMoments.from_frame(df, ["y"] + xs, "country"),
+        "chunked.ols": lambda: chunked.fit(lambda: chunks, "ols", "y", base, controls),
+        "chunked.2sls": lambda: chunked.fit(lambda: chunks, "2sls", "y", base, controls, ["z"]),
+        "chunked.fe": lambda: chunked.fit(lambda: chunks, "fe", "y", exog_vars=xs, entity="country"),
+    }
+    for cov_type, scheme in (("clustered", None), ("bootstrap", "block"), ("bootstrap", "wild"), ("bootstrap", "pairs")):
+        kwds = {"entity": "country", "scheme": scheme, "reps": 999} if scheme else {"entity": "country"}
+        name = f"perform_fe_analysis.{scheme or cov_type}"
+        cases[name] = (lambda kwds=kwds, cov_type=cov_type:
+                       econometrics.perform_fe_analysis(df, "y", xs, "country", "year", cov_type, kwds))
+    m = moments.PanelMoments.from_frame(df, ["y"] + xs, "country")
+    cases["moments.ols"] = lambda: moments.fit(m, "ols", "y", base, controls)
+    cases["moments.fe"] = lambda: moments.fit(m, "fe", "y", exog_vars=xs)
+    cases["moments.panel"] = lambda: moments.fit(m, "panel", "y", exog_vars=xs)
+    return {f"estimators.{name}": measure(fn, repeat) for name, fn in cases.items()}
+
+
+def _populate(db, n_studies: int, n_specs: int, seed: int):
+    from sqlalchemy import insert
+    from app import models, studies
+
+    rng = np.random.default_rng(seed)
+    metrics = [f"m{i}" for i in range(40)]
+    specs = []
+    for _ in range(n_specs):
+        picked = rng.choice(len(metrics), size=4, replace=False)
+        method = ("OLS", "2SLS", "FE", "RE")[rng.integers(4)]
+        specs.append(studies.spec_of(method, metrics[picked[0]], metrics[picked[1]],
+                                     [metrics[i] for i in picked[2:]]))
+    fps = [studies.fingerprint(s) for s in specs]
+
+    # популярность спецификаций — по закону Ципфа, даты — за последние 90 дней
+    ranks = np.minimum(rng.zipf(1.3, size=n_studies), n_specs) - 1
+    now = datetime.utcnow()
+    ages = rng.uniform(0, 90 * 24 * 3600, size=n_studies)
+    rows = [
+        {
+            "method": specs[r]["method"],
+            "dependent_metric": specs[r]["dependent_metric"],
+            "base_metric": specs[r]["base_metric"],
+            "metrics": specs[r]["control_metrics"],
+            "fingerprint": fps[r],
+            "created_at": now - timedelta(seconds=float(age)),
+        }
+        for r, age in zip(ranks, ages)
+    ]
+    for i in range(0, len(rows), 10_000):
+        db.execute(insert(models.StudyResult), rows[i:i + 10_000])
+    studies.rebuild_popularity(db)
+    db.commit()
+
+
+def bench_popular(n_studies: int, repeat: int, seed: int) -> dict:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import models, studies
+
+    engine = create_engine(f"sqlite:///{os.path.join(_TMP, 'popular.db')}")
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        _populate(db, n_studies, n_specs=max(10, n_studies // 20), seed=seed)
+        out = {
+            "popular.top10": measure(lambda: studies.popular(db, top_n=10), repeat),
+            "popular.top10_week": measure(lambda: studies.popular(db, top_n=10, window="week"), repeat),
+            "popular.top10_month": measure(lambda: studies.popular(db, top_n=10, window="month"), repeat),
+        }
+
+        def record():
+            studies.record_study(db, models.StudyResult(method="OLS", dependent_metric="m0",
+                                                        base_metric="m1", metrics=["m2"]))
+            db.commit()
+        out["popular.record_study"] = measure(record, repeat)
+        out["popular.rebuild"] = measure(lambda: (studies.rebuild_popularity(db), db.commit()), max(1, repeat // 3))
+        for stats in out.values():
+            stats["studies"] = n_studies
+        return out
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _StubServer:
+    """app.wb_stub под uvicorn в отдельном потоке — настоящий HTTP без сети."""
+
+    def __init__(self):
+        import uvicorn
+        from app import wb_stub
+
+        self.port = _free_port()
+        self.app = wb_stub.app
+        config = uvicorn.Config(wb_stub.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v2"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("World Bank stub did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def bench_world_bank(countries: int, years: int, indicators: int, repeat: int) -> dict:
+    import httpx
+    from app import indicator_cache, world_bank
+    from app.indicator_cache import IndicatorCache
+
+    codes = country_codes(countries)
+    wanted = {f"BENCH.IND.{j}": f"ind{j}" for j in range(indicators)}
+    start_year, end_year = 2023 - years + 1, 2023
+    previous = indicator_cache._cache
+
+    with _StubServer() as stub:
+        async def fetch():
+            limits = httpx.Limits(max_connections=world_bank.WB_MAX_CONNECTIONS,
+                                  max_keepalive_connections=world_bank.WB_MAX_CONNECTIONS)
+            async with httpx.AsyncClient(base_url=stub.url, timeout=world_bank.WB_TIMEOUT, limits=limits) as client:
+                return await world_bank.fetch_world_bank_data_async(codes, wanted, start_year, end_year, client=client)
+
+        def cold():
+            # каждый прогон — с пустым кэшем в новом каталоге
+            indicator_cache._cache = IndicatorCache(directory=tempfile.mkdtemp(dir=_TMP))
+            asyncio.run(fetch())
+
+        try:
+            stub.app.state.requests = 0
+            out = {"world_bank.cold": measure(cold, repeat)}
+            out["world_bank.cold"]["http_requests"] = stub.app.state.requests // (repeat + 1)
+            out["world_bank.warm"] = measure(lambda: asyncio.run(fetch()), repeat)
+        finally:
+            indicator_cache._cache = previous
+    for stats in out.values():
+        stats.update(countries=len(codes), years=years, indicators=indicators)
+    return out
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment() -> dict:
+    import pandas as pd
+    return {
+        "commit": _git("rev-parse", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="DPMIPTq benchmark suite")
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--years", type=int, default=60)
+    parser.add_argument("--regressors", type=int, default=5)
+    parser.add_argument("--studies", type=int, default=100_000, help="size of the study history for popular_studies")
+    parser.add_argument("--indicators", type=int, default=4, help="indicators per World Bank fetch")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default=",".join(SUITES), help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--out", default="-", help="report path, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    suites = [s for s in args.only.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    if args.regressors < 1:
+        parser.error("--regressors must be at least 1")
+
+    df = make_panel(args.countries, args.years, args.regressors, seed=args.seed)
+    results = {}
+    try:
+        for suite in suites:
+            print(f"⏱  {suite}...", file=sys.stderr)
+            if suite == "ingest":
+                results.update(bench_ingest(df, args.repeat))
+            elif suite == "estimators":
+                results.update(bench_estimators(df, args.regressors, args.repeat))
+            elif suite == "popular":
+                results.update(bench_popular(args.studies, args.repeat, args.seed))
+            elif suite == "world_bank":
+                results.update(bench_world_bank(args.countries, args.years, args.indicators, args.repeat))
+    finally:
+        shutil.rmtree(_TMP, ignore_errors=True)
+
+    report = {
+        "environment": environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"✅ Report written to {args.out}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
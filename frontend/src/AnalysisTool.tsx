@@ -52,7 +52,8 @@ const AnalysisTool = () => {
       control_metrics: controlMetrics,
       start_year: startYear,
       end_year: endYear,
-      uploaded_dataset_id: uploadedDatasetId
+      uploaded_dataset_id: uploadedDatasetId,
+      include_summary: true
     }, { headers });
     setResult(res.data);
   };
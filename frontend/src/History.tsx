@@ -7,12 +7,15 @@ import { Button } from "@/components/ui/button";
 const History = () => {
   const [token, setToken] = useState("");
   const [history, setHistory] = useState([]);
+  const [cursor, setCursor] = useState(null);
 
-  const fetchHistory = async () => {
+  const fetchHistory = async (next = null) => {
     const res = await axios.get("/my-studies/", {
-      headers: { Authorization: `Bearer ${token}` }
+      headers: { Authorization: `Bearer ${token}` },
+      params: { include_summary: true, cursor: next || undefined }
     });
-    setHistory(res.data);
+    setHistory(next ? [...history, ...res.data.items] : res.data.items);
+    setCursor(res.data.next_cursor);
   };
 
   return (
@@ -24,7 +27,7 @@ const History = () => {
             value={token}
             onChange={(e) => setToken(e.target.value)}
           />
-          <Button onClick={fetchHistory}>Загрузить историю</Button>
+          <Button onClick={() => fetchHistory()}>Загрузить историю</Button>
         </CardContent>
       </Card>
 
@@ -40,6 +43,10 @@ const History = () => {
           </CardContent>
         </Card>
       ))}
+
+      {cursor && (
+        <Button onClick={() => fetchHistory(cursor)}>Показать ещё</Button>
+      )}
     </div>
   );
 };